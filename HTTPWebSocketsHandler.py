@@ -29,6 +29,15 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 # With simplifications (auth removed, some log_messages commented out)
 
 # Version 220302 - Added sendLock to protect _send_message()
+# Each websocket now has its own queue of outgoing frames, sent by its
+# own writer thread, so a slow client only delays itself. The class
+# wide sendLock has gone
+# Incoming frames are read by FrameParser, which unmasks each payload
+# in one operation, joins fragmented messages and limits their size
+# permessage-deflate (RFC 7692) is negotiated when ws_deflate is set,
+# see MessageDeflater
+# A sub-protocol (Sec-WebSocket-Protocol) that the page asks for is
+# accepted if it is in ws_protocols and is then in ws_protocol
 
 from http.server import SimpleHTTPRequestHandler
 import struct
@@ -36,11 +45,246 @@ from base64 import b64encode
 from hashlib import sha1
 import errno, socket #for socket exceptions
 import threading
+import collections
+import zlib
+
+# What to do when a client does not keep up and its send queue is full
+DROP_OLDEST = 'drop-oldest' # Discard the oldest queued frame
+KEEP_LATEST = 'keep-latest' # Discard all the queued frames
+DISCONNECT = 'disconnect'   # Close the websocket
+
+# permessage-deflate modes (ws_deflate), or None for no compression
+DEFLATE_CONTEXT = 'context' # Each websocket keeps its compression context
+DEFLATE_SHARED = 'shared'   # No context takeover: each message is compressed
+                            # once and the output shared between websockets
+DEFLATE_MIN = 128           # Shorter messages are sent uncompressed
+DEFLATE_LEVEL = 6
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
 
 
 class WebSocketError(Exception):
     pass
 
+
+def unmask(payload, mask):
+    """
+    Returns payload XORed with the repeated 4 byte mask. The XOR is
+    done on the whole payload as one integer rather than byte by byte
+    """
+    n = len(payload)
+    if n == 0:
+        return b''
+    key = (bytes(mask) * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(n, 'little')
+
+
+class FrameParser(object):
+    """
+    Turns the bytes received from a websocket client into messages,
+    whichever way the bytes are split:
+
+      parser = FrameParser(max_message_size)
+      for opcode, payload in parser.feed(data):
+          ...
+
+    Fragmented messages are joined and returned with the opcode of the
+    first frame. Control frames (close, ping, pong) are returned as
+    they arrive, even in the middle of a fragmented message.
+    With inflate (permessage-deflate has been negotiated) compressed
+    messages are decompressed.
+    WebSocketError is raised for a message larger than
+    max_message_size, an unmasked frame or frames out of sequence.
+    """
+    def __init__(self, max_message_size=1 << 20, inflate=False):
+        self.max_message_size = max_message_size
+        self._buffer = bytearray()
+        self._fragments = []        # Payloads of a fragmented message
+        self._fragment_opcode = None
+        self._fragment_size = 0
+        self._compressed = False    # RSV1 of the first fragment
+        self._inflater = zlib.decompressobj(-15) if inflate else None
+
+    def feed(self, data):
+        """Adds received bytes, returns a list of (opcode, payload)"""
+        self._buffer += data
+        messages = []
+        pos = 0
+        while True:
+            frame = self._frame(pos)
+            if frame is None:
+                break
+            pos, fin, rsv, opcode, payload = frame
+            if rsv & ~0x40 or (rsv and (self._inflater is None or opcode in (0x0, 0x8, 0x9, 0xa))):
+                raise WebSocketError("Reserved bits set")
+            if opcode >= 0x8:
+                messages.append((opcode, payload))
+                continue
+            if opcode == 0x0:
+                if self._fragment_opcode is None:
+                    raise WebSocketError("Continuation frame without a message")
+            elif self._fragment_opcode is not None:
+                raise WebSocketError("New message before the last one finished")
+            else:
+                self._fragment_opcode = opcode
+                self._compressed = bool(rsv)
+            self._fragments.append(payload)
+            if fin:
+                payload = b''.join(self._fragments)
+                if self._compressed:
+                    payload = self._inflate(payload)
+                messages.append((self._fragment_opcode, payload))
+                self._fragments = []
+                self._fragment_opcode = None
+                self._fragment_size = 0
+        del self._buffer[:pos]
+        return messages
+
+    def _inflate(self, payload):
+        # Decompresses a permessage-deflate message, without letting it
+        # grow beyond max_message_size
+        payload = self._inflater.decompress(payload + DEFLATE_TAIL, self.max_message_size + 1)
+        if len(payload) > self.max_message_size or self._inflater.unconsumed_tail:
+            raise WebSocketError("Message longer than %d bytes" % self.max_message_size)
+        return payload
+
+    def _frame(self, pos):
+        # Returns (next pos, fin, rsv, opcode, payload) for the frame at
+        # pos, or None if it has not all arrived
+        buf = self._buffer
+        if len(buf) - pos < 2:
+            return None
+        b0, b1 = buf[pos], buf[pos+1]
+        fin, rsv, opcode, length = b0 & 0x80, b0 & 0x70, b0 & 0x0F, b1 & 0x7F
+        if not b1 & 0x80:
+            raise WebSocketError("Frame from client is not masked")
+        header = 2
+        if length == 126:
+            header = 4
+            if len(buf) - pos < header:
+                return None
+            length = struct.unpack_from(">H", buf, pos+2)[0]
+        elif length == 127:
+            header = 10
+            if len(buf) - pos < header:
+                return None
+            length = struct.unpack_from(">Q", buf, pos+2)[0]
+        if opcode >= 0x8:
+            if not fin or length > 125:
+                raise WebSocketError("Control frame fragmented or too long")
+        elif self._fragment_size + length > self.max_message_size:
+            raise WebSocketError("Message longer than %d bytes" % self.max_message_size)
+        end = pos + header + 4 + length
+        if len(buf) < end:
+            return None
+        if opcode < 0x8:
+            self._fragment_size += length
+        mask = buf[pos+header:pos+header+4]
+        return end, fin, rsv, opcode, unmask(buf[pos+header+4:end], mask)
+
+
+def negotiate_protocol(offers, supported):
+    """
+    Returns the first sub-protocol in the Sec-WebSocket-Protocol header
+    of a client (offers) that is in supported, or None
+    """
+    if not offers:
+        return None
+    for offer in offers.split(','):
+        offer = offer.strip()
+        if offer in supported:
+            return offer
+    return None
+
+
+def negotiate_deflate(offers, mode):
+    """
+    Returns (response, MessageDeflater) for the Sec-WebSocket-Extensions
+    header of a client (offers), where response is the header to send
+    back, or (None, None) if permessage-deflate is not used. mode is
+    DEFLATE_CONTEXT, DEFLATE_SHARED or None
+    """
+    if not mode or not offers:
+        return None, None
+    known = ('server_no_context_takeover', 'client_no_context_takeover',
+             'server_max_window_bits', 'client_max_window_bits')
+    for offer in offers.split(','):
+        params = [p.strip() for p in offer.split(';')]
+        if params[0].lower() != 'permessage-deflate':
+            continue
+        values = {}
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            values[name.strip().lower()] = value.strip().strip('"')
+        if any(name not in known for name in values):
+            continue # Offers with parameters we don't know are declined
+        wbits = 15
+        if 'server_max_window_bits' in values:
+            try:
+                wbits = int(values['server_max_window_bits'])
+            except ValueError:
+                continue
+            if not 9 <= wbits <= 15:
+                continue # zlib can't compress with a 256 byte window
+        noContext = mode == DEFLATE_SHARED or 'server_no_context_takeover' in values
+        response = 'permessage-deflate'
+        if noContext:
+            response += '; server_no_context_takeover'
+        if 'server_max_window_bits' in values:
+            response += '; server_max_window_bits=%d' % wbits
+        return response, MessageDeflater(wbits, noContext, shared=noContext and wbits == 15)
+    return None, None
+
+
+class MessageDeflater(object):
+    """
+    Compresses the messages sent on one websocket (permessage-deflate).
+
+    With context takeover each message is compressed with the context
+    (history) of the messages before, so keys and values that repeat
+    from one message to the next cost almost nothing. The frames must
+    then be compressed in the order that they are sent: the send
+    queues hold uncompressed messages and frame() is called as they
+    are sent, after any have been dropped.
+
+    Without context takeover each message is compressed on its own.
+    With shared, the compressed frame is kept (for the last few
+    messages) so that the same message sent to many websockets is
+    only compressed once.
+    """
+    _shared = collections.OrderedDict() # payload -> frame
+    _sharedLock = threading.Lock()
+    _sharedSize = 64
+
+    def __init__(self, wbits=15, noContext=False, shared=False):
+        self.wbits = wbits
+        self.noContext = noContext
+        self.shared = shared
+        self._compressor = None if noContext else \
+            zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -wbits)
+
+    def frame(self, opcode, payload):
+        """Returns the frame for the message, compressed if worthwhile"""
+        if len(payload) < DEFLATE_MIN:
+            return HTTPWebSocketsHandler._frame(opcode, payload)
+        if not self.shared:
+            return HTTPWebSocketsHandler._frame(opcode, self._compress(payload), 0x40)
+        key = (opcode, payload)
+        with self._sharedLock:
+            frame = self._shared.get(key)
+        if frame is None:
+            frame = HTTPWebSocketsHandler._frame(opcode, self._compress(payload), 0x40)
+            with self._sharedLock:
+                self._shared[key] = frame
+                if len(self._shared) > self._sharedSize:
+                    self._shared.popitem(last=False)
+        return frame
+
+    def _compress(self, payload):
+        # Compresses payload, without the 00 00 ff ff that ends a flush
+        compressor = self._compressor or zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -self.wbits)
+        data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4] if data.endswith(DEFLATE_TAIL) else data
+
 class HTTPWebSocketsHandler(SimpleHTTPRequestHandler):
     """ Class to handle HTTP requests that turn into websockets"""
     
@@ -53,15 +297,30 @@ class HTTPWebSocketsHandler(SimpleHTTPRequestHandler):
     _opcode_ping = 0x9
     _opcode_pong = 0xa
     
-    # The sendLock is used so only one thread can send on a websocket
-    # at the same time. Had problems without it.
-    _sendLock = threading.Lock()
+    # Outgoing frames are queued and sent by a writer thread for each
+    # websocket. When more than send_queue_size frames are waiting the
+    # send_policy is applied (DROP_OLDEST, KEEP_LATEST or DISCONNECT)
+    send_queue_size = 100
+    send_policy = DROP_OLDEST
+    
+    # Longest message (after joining fragments) that can be received
+    max_message_size = 1 << 20
+    
+    # permessage-deflate: DEFLATE_CONTEXT, DEFLATE_SHARED or None
+    ws_deflate = None
+    
+    # Sub-protocols that may be negotiated, e.g. ('ncom-nav-binary',)
+    ws_protocols = ()
+    ws_protocol = None  # The negotiated sub-protocol, or None
     
     ws_connected = False # True when websocket is connected
     
     
     def on_ws_message(self, message):
-        """Override to process incoming websocket messages"""
+        """
+        Override to process incoming websocket messages: str for a text
+        message, bytes for a binary message
+        """
         pass
 
     def on_ws_connected(self):
@@ -76,16 +335,28 @@ class HTTPWebSocketsHandler(SimpleHTTPRequestHandler):
         """Send a message to the websocket"""
         self._send_message(self._opcode_text, message)
 
+    def send_binary(self, message):
+        """Send a binary message (bytes) to the websocket"""
+        self._send_message(self._opcode_binary, message)
+
     def setup(self):
         # BaseHTTPRequestHandler.StreamRequestHandler.BaseRequestHandler.setup()
         # called when BaseRequestHandler is initialised
         SimpleHTTPRequestHandler.setup(self)
         self.ws_connected = False
+        self._send_queue = collections.deque() # Frames, None to stop
+        self._send_ready = threading.Condition()
+        self.send_drops = 0 # Frames discarded by the send_policy
+        self._writer = None
+        self._deflater = None # MessageDeflater with permessage-deflate
                 
     def finish(self):
         # Needed when wfile is used, or when self.close_connection is not used
         # Catch errors in SimpleHTTPRequestHandler.finish() after socket disappeared
         # due to loss of network connection
+        # Give the writer a moment to send the queued frames (and close)
+        if self._writer is not None:
+            self._writer.join(1.0)
         try:
             SimpleHTTPRequestHandler.finish(self)
         except (socket.error, TypeError) as err:
@@ -130,56 +401,105 @@ class HTTPWebSocketsHandler(SimpleHTTPRequestHandler):
                 self._ws_close()
         
     def _read_next_message(self):
-        #self.rfile.read(n) is blocking.
+        #self.rfile.read1(n) is blocking until some bytes arrive.
         #it returns however immediately when the socket is closed.
-        try:
-            self.opcode = ord(self.rfile.read(1)) & 0x0F           
-            length = ord(self.rfile.read(1)) & 0x7F
-            #self.log_message("_read_next_message: opcode: %02X length: %d" % (self.opcode, length))
-            if length == 126:
-                length = struct.unpack(">H", self.rfile.read(2))[0]
-            elif length == 127:
-                length = struct.unpack(">Q", self.rfile.read(8))[0]
-            masks = [byte for byte in self.rfile.read(4)]
-            decoded = ""
-            for byte in self.rfile.read(length):
-                decoded += chr(byte ^ masks[len(decoded) % 4])
-            self._on_message(decoded)
-        except (struct.error, TypeError) as e:
-            #catch exceptions from ord() and struct.unpack()
+        data = self.rfile.read1(65536)
+        if not data:
             if self.ws_connected:
-                self.log_message("_read_next_message exception %s" % (str(e.args)))
+                self.log_message("_read_next_message connection closed")
                 raise WebSocketError("Websocket read aborted while listening")
             else:
                 #the socket was closed while waiting for input
                 self.log_error("RCV: _read_next_message aborted after closed connection")
-                pass
+                return
+        try:
+            messages = self._parser.feed(data)
+        except WebSocketError as e:
+            self.log_message("_read_next_message exception %s" % (str(e.args)))
+            raise
+        for self.opcode, payload in messages:
+            #self.log_message("_read_next_message: opcode: %02X length: %d" % (self.opcode, len(payload)))
+            if not self.ws_connected:
+                break
+            if self.opcode == self._opcode_text:
+                try:
+                    payload = payload.decode('utf-8')
+                except UnicodeDecodeError:
+                    raise WebSocketError("Message is not utf-8")
+            self._on_message(payload)
         
+    @staticmethod
+    def _frame(opcode, payload, rsv=0):
+        # Returns the header and payload as one buffer
+        length = len(payload)
+        if length <= 125:
+            header = struct.pack(">BB", 0x80 + rsv + opcode, length)
+        elif length <= 65535:
+            header = struct.pack(">BBH", 0x80 + rsv + opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 + rsv + opcode, 127, length)
+        return header + payload
+    
     def _send_message(self, opcode, message):
-        with self._sendLock:
-            #self.log_message("_send_message: opcode: %02X msg: %s" % (opcode, message))
+        # Queues the frame for the writer thread, so this never blocks.
+        # With permessage-deflate the message is queued as (opcode,
+        # payload) and compressed by the writer
+        #self.log_message("_send_message: opcode: %02X msg: %s" % (opcode, message))
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        if self._deflater is not None and opcode < self._opcode_close:
+            frame = (opcode, message)
+        else:
+            frame = self._frame(opcode, message)
+        with self._send_ready:
+            if not self.ws_connected:
+                return
+            if len(self._send_queue) >= self.send_queue_size:
+                self.send_drops += 1
+                if self.send_policy == DISCONNECT:
+                    frame = None
+                elif self.send_policy == KEEP_LATEST:
+                    self.send_drops += len(self._send_queue) - 1
+                    self._send_queue.clear()
+                else:
+                    self._send_queue.popleft()
+            if frame is not None:
+                self._send_queue.append(frame)
+                self._send_ready.notify()
+        if frame is None:
+            self.log_message("SND: Close connection: client too slow")
+            self._ws_close(abort=True)
+    
+    def _write_messages(self):
+        # Writer thread: sends the queued frames until None is queued.
+        # Frames that are waiting are joined and sent together
+        while True:
+            with self._send_ready:
+                while not self._send_queue:
+                    self._send_ready.wait()
+                frames = list(self._send_queue)
+                self._send_queue.clear()
+            stop = None in frames
+            if stop:
+                frames = frames[:frames.index(None)]
             try:
+                if self._deflater is not None:
+                    frames = [f if type(f) is bytes else self._deflater.frame(*f) for f in frames]
                 #use of self.wfile.write gives socket exception after socket is closed. Avoid.
-                self.request.send((0x80 + opcode).to_bytes(1, 'big'))
-                length = len(message)
-                if length <= 125:
-                    self.request.send(length.to_bytes(1, 'big'))
-                elif length >= 126 and length <= 65535:
-                    self.request.send((126).to_bytes(1, 'big'))
-                    self.request.send(struct.pack(">H", length))
-                else:
-                    self.request.send((127).to_bytes(1, 'big'))
-                    self.request.send(struct.pack(">Q", length))
-                if length > 0:
-                    self.request.send(message.encode('utf-8'))
+                self.request.sendall(b''.join(frames))
             except socket.error as e:
                 #websocket content error, time-out or disconnect.
-                self.log_message("SND: Close connection: Socket Error %s" % str(e.args))
-                self._ws_close()
+                if self.ws_connected:
+                    self.log_message("SND: Close connection: Socket Error %s" % str(e.args))
+                    self._ws_close(abort=True)
+                return
             except Exception as err:
                 #unexpected error in websocket connection.
-                self.log_error("SND: Exception: in _send_message: %s" % str(err.args))
-                self._ws_close()
+                self.log_error("SND: Exception: in _write_messages: %s" % str(err.args))
+                self._ws_close(abort=True)
+                return
+            if stop:
+                return
 
     def _handshake(self):
         # self.log_message("_handshake()")
@@ -192,53 +512,64 @@ class HTTPWebSocketsHandler(SimpleHTTPRequestHandler):
         self.send_header('Upgrade', 'websocket')
         self.send_header('Connection', 'Upgrade')
         self.send_header('Sec-WebSocket-Accept', digest)
+        offers = ', '.join(headers.get_all('Sec-WebSocket-Extensions') or [])
+        response, self._deflater = negotiate_deflate(offers, self.ws_deflate)
+        if response:
+            self.send_header('Sec-WebSocket-Extensions', response)
+        offers = ', '.join(headers.get_all('Sec-WebSocket-Protocol') or [])
+        self.ws_protocol = negotiate_protocol(offers, self.ws_protocols)
+        if self.ws_protocol:
+            self.send_header('Sec-WebSocket-Protocol', self.ws_protocol)
         self.end_headers()
+        self._parser = FrameParser(self.max_message_size, inflate=self._deflater is not None)
+        # A websocket can be quiet for a long time, so the idle timeout
+        # of an HTTP connection (if any) does not apply
+        self.request.settimeout(None)
         self.ws_connected = True
         #self.close_connection = 0
+        self._writer = threading.Thread(target=self._write_messages, daemon=True)
+        self._writer.start()
         self.on_ws_connected()
     
-    def _ws_close(self):
-        #avoid closing a single socket two time for send and receive.
-        #self.log_message("LOCK: WAIT _was_close obj: %s thd %s" % (str(self) , threading.current_thread().ident)) 
-        #self.mutex.acquire()
-        #self.log_message("LOCK: ACKD _was_close obj: %s thd %s" % (str(self) , threading.current_thread().ident)) 
-        try:
-            if self.ws_connected:
-                self.ws_connected = False
-                #Terminate BaseHTTPRequestHandler.handle() loop:
-                self.close_connection = 1
-                #send close and ignore exceptions. An error may already have occurred.
-                try: 
-                    self._send_close()
-                except:
-                    #self.log_message("_ws_close we send a close to a broken line. Do not expect much")
-                    pass
-                self.on_ws_closed()
-            else:
-                self.log_message("_ws_close websocket in closed state. Ignore.")
+    def _ws_close(self, abort=False):
+        # Closes the websocket once, whichever thread finds the problem.
+        # abort discards the queued frames and shuts the socket down, so
+        # that the reader and writer stop waiting for a stuck client
+        with self._send_ready:
+            connected = self.ws_connected
+            self.ws_connected = False
+            if connected and abort:
+                self.send_drops += len(self._send_queue)
+                self._send_queue.clear()
+        if not connected:
+            self.log_message("_ws_close websocket in closed state. Ignore.")
+            return
+        #Terminate BaseHTTPRequestHandler.handle() loop:
+        self.close_connection = 1
+        if abort:
+            self._stop_writer()
+            try:
+                self.request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
                 pass
-        finally:
-            #self.mutex.release()
-            pass
-        #self.log_message("LOCK: RLSD _was_close obj: %s thd %s" % (str(self) , threading.current_thread().ident)) 
+        else:
+            #send close and ignore exceptions. An error may already have occurred.
+            try: 
+                self._send_close()
+            except:
+                #self.log_message("_ws_close we send a close to a broken line. Do not expect much")
+                pass
+        self.on_ws_closed()
             
     def _on_message(self, message):
         # self.log_message("_on_message: opcode: %02X msg: %s" % (self.opcode, message))
         
         # close
         if self.opcode == self._opcode_close:
-            self.ws_connected = False
-            #Terminate BaseHTTPRequestHandler.handle() loop:
-            self.close_connection = 1
-            try:
-                self._send_close()
-            except:
-                #self.log_message("_on_message we send a close to a broken line. Do not expect much")
-                pass
-            self.on_ws_closed()
+            self._ws_close()
         # ping
         elif self.opcode == self._opcode_ping:
-            _send_message(self._opcode_pong, message)
+            self._send_message(self._opcode_pong, message)
         # pong
         elif self.opcode == self._opcode_pong:
             pass
@@ -250,8 +581,15 @@ class HTTPWebSocketsHandler(SimpleHTTPRequestHandler):
 
     def _send_close(self):
         #Dedicated _send_close allows for catch all exception handling
-        msg = bytearray()
-        msg.append(0x80 + self._opcode_close)
-        msg.append(0x00)
-        self.request.send(msg)
+        #The close frame is sent after the queued frames, and then the
+        #writer stops
+        with self._send_ready:
+            self._send_queue.append(self._frame(self._opcode_close, b''))
+        self._stop_writer()
+    
+    def _stop_writer(self):
+        # Queues None, which stops the writer thread
+        with self._send_ready:
+            self._send_queue.append(None)
+            self._send_ready.notify()
     
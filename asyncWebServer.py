@@ -0,0 +1,350 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+asyncWebServer is an asyncio version of bgWebServer: a simple (and
+insecure?) web server that serves files from subfolder "static" and
+websockets, all on one event loop rather than a thread per connection.
+
+Usage (from a coroutine on the event loop):
+  import asyncWebServer
+  ws = asyncWebServer.AsyncWebServer()
+  await ws.start()
+
+  ws.send_message_all(message, path="/message.json?ip=192.168.2.62")
+  message, path = await ws.recvpath()
+
+The methods are the same as BgWebServer except that recvpath() and
+next_message() are coroutines. send_message_all() must be called from
+the event loop.
+
+HTTP/1.1 connections are kept open for more requests (including
+pipelined requests) until the client closes them or they have been
+idle for keep_alive_timeout seconds, and the requests are parsed by the
+same functions as selectorWebServer. Only GET (and HEAD) is supported.
+Files are served from a staticCache, which is checked for changed files
+in the default executor so the event loop never waits for the disk.
+
+Each websocket has a queue of outgoing frames, written by its own task
+that waits (drain) for a slow client. When more than SEND_QUEUE_SIZE
+frames are waiting SEND_POLICY is applied, as in HTTPWebSocketsHandler,
+so a stalled phone cannot use more and more memory.
+"""
+
+import asyncio
+import collections
+import os
+from base64 import b64encode
+from hashlib import sha1
+from HTTPWebSocketsHandler import HTTPWebSocketsHandler, FrameParser, WebSocketError, negotiate_protocol
+from HTTPWebSocketsHandler import DROP_OLDEST, KEEP_LATEST, DISCONNECT
+from selectorWebServer import parse_request, response_head, error_page
+from selectorWebServer import MAX_REQUEST, KEEP_ALIVE_TIMEOUT
+import staticCache
+
+# Ideally settings would be added for these
+PORT = 8000
+MAX_MESSAGES = 100      # Limit for incoming message queue
+MAX_MESSAGE_SIZE = 1 << 20 # Longest websocket message that can be received
+SEND_QUEUE_SIZE = 100   # Limit for the outgoing frames of each websocket
+SEND_POLICY = DROP_OLDEST # When a client can't keep up: DROP_OLDEST, KEEP_LATEST or DISCONNECT
+CLOSE_TIMEOUT = 1.0     # Seconds to send the queued frames when a websocket closes
+
+# Definitions from the websocket protocol
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OPCODE_CONTINU = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+
+class AsyncWebSocket(object):
+    """
+    One open websocket. path is the path (and query) that the page
+    connected to, as in HTTPWebSocketsHandler
+    """
+    def __init__(self, server, reader, writer, path, protocol=None):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.path = path
+        self.ws_protocol = protocol # The negotiated sub-protocol, or None
+        self.ws_connected = True
+        self.parser = FrameParser(MAX_MESSAGE_SIZE)
+        self.send_drops = 0     # Frames discarded by the send policy
+        self._send_queue = collections.deque() # Frames, None to stop
+        self._send_ready = asyncio.Event()
+        self._writer = asyncio.get_running_loop().create_task(self._write_messages())
+    
+    def send_message(self, message):
+        """Send a message to the websocket"""
+        self._send_message(OPCODE_TEXT, message.encode('utf-8'))
+    
+    def send_binary(self, message):
+        """Send a binary message (bytes) to the websocket"""
+        self._send_message(OPCODE_BINARY, bytes(message))
+    
+    def _send_message(self, opcode, payload):
+        # Queues the frame for _write_messages(), applying the send
+        # policy if the client is not keeping up
+        if not self.ws_connected:
+            return
+        queue = self._send_queue
+        if len(queue) >= self.server.send_queue_size:
+            self.send_drops += 1
+            if self.server.send_policy == DISCONNECT:
+                self._ws_close(abort=True)
+                return
+            elif self.server.send_policy == KEEP_LATEST:
+                self.send_drops += len(queue) - 1
+                queue.clear()
+            else:
+                queue.popleft()
+        queue.append(HTTPWebSocketsHandler._frame(opcode, payload))
+        self._send_ready.set()
+    
+    async def _write_messages(self):
+        # Writes the queued frames, all that are waiting at once, and
+        # waits for them to be sent (drain) before writing more. Ends
+        # at None, which follows the close frame
+        queue = self._send_queue
+        try:
+            while True:
+                await self._send_ready.wait()
+                self._send_ready.clear()
+                frames = list(queue)
+                queue.clear()
+                stop = None in frames
+                if stop:
+                    frames = frames[:frames.index(None)]
+                self.writer.write(b''.join(frames))
+                await self.writer.drain()
+                if stop:
+                    return
+        except (ConnectionError, RuntimeError):
+            self._ws_close(abort=True) # Disconnected
+    
+    async def _read_messages(self):
+        # Reads frames until the websocket closes
+        try:
+            while self.ws_connected:
+                await self._read_next_message()
+        except (asyncio.IncompleteReadError, ConnectionError, WebSocketError):
+            pass # Websocket content error or disconnect
+        self._ws_close()
+    
+    async def _read_next_message(self):
+        data = await self.reader.read(65536)
+        if not data:
+            raise WebSocketError("Connection closed")
+        for opcode, payload in self.parser.feed(data):
+            if not self.ws_connected:
+                break
+            if opcode == OPCODE_CLOSE:
+                self._ws_close()
+            elif opcode == OPCODE_PING:
+                self._send_message(OPCODE_PONG, payload)
+            elif opcode == OPCODE_PONG:
+                pass
+            elif opcode == OPCODE_TEXT:
+                try:
+                    message = payload.decode('utf-8')
+                except UnicodeDecodeError:
+                    raise WebSocketError("Message is not utf-8")
+                self.server._on_ws_message(message, self.path)
+            elif opcode == OPCODE_BINARY:
+                self.server._on_ws_message(payload, self.path)
+    
+    def _ws_close(self, abort=False):
+        # Closes the websocket once. abort discards the queued frames and
+        # the connection, so that the reader and writer stop waiting for
+        # a stuck client
+        if not self.ws_connected:
+            return
+        self.ws_connected = False
+        if abort:
+            self.send_drops += len(self._send_queue)
+            self._send_queue.clear()
+            self._writer.cancel()
+            self.writer.transport.abort()
+        else:
+            self._send_queue.append(HTTPWebSocketsHandler._frame(OPCODE_CLOSE, b''))
+            self._send_queue.append(None)
+            self._send_ready.set()
+        self.server._on_ws_closed(self)
+
+
+class AsyncWebServer():
+    """
+    ws = asyncWebServer.AsyncWebServer(); await ws.start() starts the
+    web server on the running event loop, serving html from
+    subdirectory "static" and connecting incomming websockets as needed
+    """
+    def __init__(self, port=PORT, directory="static", ws_protocols=(),
+                 send_queue_size=SEND_QUEUE_SIZE, send_policy=SEND_POLICY,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        # ws_protocols - sub-protocols that a websocket may ask for
+        self.port = port
+        self.keep_alive_timeout = keep_alive_timeout
+        self.connections = set() # Writers of the HTTP (not websocket) connections
+        self.directory = os.path.abspath(directory)
+        self.static = staticCache.StaticCache(directory)
+        self.ws_protocols = ws_protocols
+        self.send_queue_size = send_queue_size
+        self.send_policy = send_policy
+        self.websocketmessages = asyncio.Queue(maxsize=MAX_MESSAGES)
+        self.websockets = []
+        self.server = None
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, port=self.port, reuse_address=True,
+                                                 limit=MAX_REQUEST)
+    
+    def stop(self):
+        """
+        Closes the web server and the open websockets
+        """
+        for handler in list(self.websockets):
+            handler._ws_close()
+        for writer in list(self.connections):
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+    
+    async def next_message(self):
+        """
+        Returns the next message in the queue, without the path
+        """
+        return (await self.websocketmessages.get())[0]
+    
+    async def recvpath(self):
+        """
+        Returns the next message in the queue and the path of the socket
+        that sent the message. Returns (message, path) as a tuple.
+        message is str for a text message and bytes for a binary one.
+        """
+        return await self.websocketmessages.get()
+    
+    def send_message_all(self, message, path=None):
+        """
+        Sends the message to all the websockets connected at path
+        (including "/", for example "/my_websocket.json")
+        Or, if path is None it will send to all the websockets,
+        which is probably dangerous!
+        """
+        for handler in list(self.websockets):
+            if path == None or path == handler.path:
+                handler.send_message(message)
+    
+    def _on_ws_message(self, message, path):
+        try:
+            # Put both the message and the path so we know where it came from
+            self.websocketmessages.put_nowait((message, path))
+        except asyncio.QueueFull:
+            pass # queue full then throw it away
+    
+    def _on_ws_closed(self, handler):
+        try:
+            self.websockets.remove(handler)
+        except ValueError:
+            pass
+    
+    async def _handle(self, reader, writer):
+        # One connection: file requests, while it is kept alive, or a
+        # websocket
+        self.connections.add(writer)
+        try:
+            keepAlive = True
+            while keepAlive:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.keep_alive_timeout)
+                except asyncio.TimeoutError:
+                    break # Idle
+                except asyncio.LimitOverrunError:
+                    self._send_error(writer, 431, 'Request header fields too large')
+                    break
+                request = parse_request(head[:-4])
+                if request is None:
+                    self._send_error(writer, 400, 'Bad request')
+                    break
+                method, path, headers, keepAlive = request
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    self.connections.discard(writer)
+                    await self._websocket(reader, writer, path, headers)
+                    break
+                elif method in ('GET', 'HEAD'):
+                    await self._send_file(writer, path, method == 'HEAD', headers, keepAlive)
+                else:
+                    self._send_error(writer, 501, 'Unsupported method')
+                    break
+                await writer.drain()
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+    
+    async def _websocket(self, reader, writer, path, headers):
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            self._send_error(writer, 400, 'Bad websocket request')
+            return
+        digest = b64encode(sha1((key + WS_GUID).encode()).digest()).decode()
+        protocol = negotiate_protocol(headers.get('sec-websocket-protocol'), self.ws_protocols)
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\n'
+                      'Connection: Upgrade\r\n'
+                      '%s'
+                      'Sec-WebSocket-Accept: %s\r\n\r\n'
+                      % ('Sec-WebSocket-Protocol: %s\r\n' % protocol if protocol else '',
+                         digest)).encode('latin-1'))
+        handler = AsyncWebSocket(self, reader, writer, path, protocol)
+        self.websockets.append(handler)
+        await handler._read_messages()
+        # Give the writer a moment to send the queued frames (and close)
+        try:
+            await asyncio.wait_for(handler._writer, CLOSE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+    
+    async def _send_file(self, writer, path, headOnly, headers, keepAlive):
+        # The cache checks the file on disk (and reloads it if it has
+        # changed), so that is done in the executor
+        response = await asyncio.get_running_loop().run_in_executor(None,
+            self.static.respond, path, headers.get('accept-encoding'), headers.get('if-none-match'))
+        if response is None:
+            self._send_error(writer, 404, 'File not found', keepAlive)
+            return
+        code, fields, body = response
+        writer.write(response_head(code, 'OK' if code == 200 else 'Not Modified', fields, keepAlive))
+        if not headOnly:
+            writer.write(body)
+    
+    def _send_error(self, writer, code, message, keepAlive=False):
+        fields, body = error_page(code, message)
+        writer.write(response_head(code, message, fields, keepAlive) + body)
@@ -0,0 +1,513 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+benchmark.py
+
+Rough timings for the parts of ncom-web that run at 100Hz per INS.
+The NCOM data is synthetic, so no INS is needed.
+
+Usage:
+
+python3 benchmark.py decode
+
+  Compares the per-field int.from_bytes() decoding of Batch A/B with
+  the compiled layout in ncomrx (checking that they give identical
+  values) and times NcomRx.decode() and NcomRx.decode_all() per packet,
+  with random and with repeated status channel bytes.
+
+python3 benchmark.py resync
+
+  Times NcomRx.decode_all() on a mixture of NCOM and non-NCOM datagrams.
+
+python3 benchmark.py fanout
+
+  Sends messages to hundreds of websockets (socket pairs) through the
+  bgWebServer registry and through the old scan of every websocket,
+  while other websockets connect and disconnect.
+
+python3 benchmark.py unmask
+
+  Compares unmasking a websocket message byte by byte with the whole
+  payload XOR in HTTPWebSocketsHandler.unmask().
+
+python3 benchmark.py nav
+
+  Compares nav as JSON, one message per sample as sent at 100Hz, with
+  the binary nav of publisher (batches of samples): encoding time and
+  bytes per sample.
+
+python3 benchmark.py pageload
+
+  Loads speed.html and its files from bgWebServer (both server
+  modes): a new connection for each file, one HTTP/1.1 keep-alive
+  connection, and all the requests pipelined on one connection.
+
+python3 benchmark.py numpy
+
+  Compares NcomRx with the bulk decoder in ncomrx_numpy (needs numpy).
+"""
+
+import sys
+import time
+import math
+import random
+import struct
+import re
+import socket
+import threading
+import http.client
+
+import ncomrx
+
+
+########################################################################
+# Synthetic NCOM
+
+def make_packet(navStatus=4, seconds=0, channel=0, statusBytes=bytes(8), rnd=random):
+    """
+    Returns a 72 byte NCOM packet with valid checksums. The Batch A/B
+    measurements are random but plausible.
+    """
+    def i24(x):
+        return int(x).to_bytes(3, byteorder='little', signed=True)
+    p = bytearray([ncomrx.NCOM_SYNC])
+    p += (seconds % ncomrx.TIMECYCLE).to_bytes(2, byteorder='little')
+    for _ in range(6):
+        p += i24(rnd.uniform(-200000, 200000))         # Ax..Wz
+    p.append(navStatus)
+    p.append(sum(p[1:22]) % 256)                       # Checksum 1
+    p += struct.pack('<ddf',
+        rnd.uniform(-1.5, 1.5), rnd.uniform(-3.1, 3.1), rnd.uniform(0, 200))
+    for _ in range(3):
+        p += i24(rnd.uniform(-400000, 400000))         # Vn, Ve, Vd
+    for _ in range(3):
+        p += i24(rnd.uniform(-3141592, 3141592))       # Heading, Pitch, Roll
+    p.append(sum(p[1:61]) % 256)                       # Checksum 2
+    p.append(channel)
+    p += bytes(statusBytes)
+    p.append(sum(p[1:71]) % 256)                       # Checksum 3
+    return bytes(p)
+
+
+def make_stream(n, seed=1, repeatStatus=False):
+    """
+    Returns a list of n packets at 100Hz. The status channels cycle
+    through 0..81 with some random payloads, as a real INS would.
+    With repeatStatus each channel repeats the same payload, which is
+    what most configuration channels do.
+    """
+    rnd = random.Random(seed)
+    packets = []
+    minutes = 2200000
+    if repeatStatus:
+        fixed = [bytes(rnd.randrange(256) for _ in range(8)) for _ in range(82)]
+    for i in range(n):
+        ms = i * 10
+        channel = i % 82
+        if channel == 0:
+            sb = (minutes + ms // 60000).to_bytes(4, 'little') + bytes([12, 4, 4, 4])
+        elif channel == 16:
+            sb = bytes([0,0,0,0,0,0,0,(18<<1)|1])
+        elif repeatStatus:
+            sb = fixed[channel]
+        else:
+            sb = bytes(rnd.randrange(256) for _ in range(8))
+        packets.append(make_packet(4, ms, channel, sb, rnd))
+    return packets
+
+
+########################################################################
+# Benchmarks
+
+def legacy_batch_ab(b):
+    # The per-field decoder that ncomrx used before the compiled layout
+    nav = {}
+    nav['GpsSeconds'] = int.from_bytes(b[1:3], byteorder = 'little', signed=False) * ncomrx.TIME2SEC
+    nav['Ax'] = int.from_bytes(b[3:6],   byteorder = 'little', signed=True) * ncomrx.ACC2MPS2
+    nav['Ay'] = int.from_bytes(b[6:9],   byteorder = 'little', signed=True) * ncomrx.ACC2MPS2
+    nav['Az'] = int.from_bytes(b[9:12],  byteorder = 'little', signed=True) * ncomrx.ACC2MPS2
+    nav['Wx'] = int.from_bytes(b[12:15], byteorder = 'little', signed=True) * ncomrx.RATE2RPS * ncomrx.RAD2DEG
+    nav['Wy'] = int.from_bytes(b[15:18], byteorder = 'little', signed=True) * ncomrx.RATE2RPS * ncomrx.RAD2DEG
+    nav['Wz'] = int.from_bytes(b[18:21], byteorder = 'little', signed=True) * ncomrx.RATE2RPS * ncomrx.RAD2DEG
+    nav['Lat'] = struct.unpack("<d",b[23:31])[0]
+    nav['Lon'] = struct.unpack("<d",b[31:39])[0]
+    nav['Alt'] = struct.unpack("<f",b[39:43])[0]
+    nav['Vn'] = int.from_bytes(b[43:46], byteorder = 'little', signed=True) * ncomrx.VEL2MPS
+    nav['Ve'] = int.from_bytes(b[46:49], byteorder = 'little', signed=True) * ncomrx.VEL2MPS
+    nav['Vd'] = int.from_bytes(b[49:52], byteorder = 'little', signed=True) * ncomrx.VEL2MPS
+    h = int.from_bytes(b[52:55], byteorder = 'little', signed=True) * ncomrx.ANG2RAD * ncomrx.RAD2DEG
+    nav['Heading'] = h if h >= 0.0 else h + 360.0
+    nav['Pitch']   = int.from_bytes(b[55:58], byteorder = 'little', signed=True) * ncomrx.ANG2RAD * ncomrx.RAD2DEG
+    nav['Roll']    = int.from_bytes(b[58:61], byteorder = 'little', signed=True) * ncomrx.ANG2RAD * ncomrx.RAD2DEG
+    return nav
+
+
+def layout_batch_ab(b):
+    # The compiled layout, as used by NcomRx.decode()
+    nav = {}
+    ncomrx.unpackBatchA(nav, b)
+    ncomrx.unpackBatchB(nav, b)
+    if nav['Heading'] < 0.0:
+        nav['Heading'] += 360.0
+    return nav
+
+
+def same(a, b):
+    # Exact comparison, treating NaN as equal to NaN
+    return a.keys() == b.keys() and all(
+        a[k] == b[k] or (a[k] != a[k] and b[k] != b[k]) for k in a)
+
+
+def per_packet(fn, packets, repeat=5):
+    # Best of 'repeat' runs, in microseconds per packet
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for p in packets:
+            fn(p)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(packets) * 1e6
+
+
+def bench_decode():
+    packets = make_stream(10000)
+
+    # Check that the layout gives exactly the same values
+    for p in packets:
+        if not same(legacy_batch_ab(p), layout_batch_ab(p)):
+            print("Mismatch decoding packet", p.hex())
+            return 1
+    print("Batch A/B values identical for %d packets" % len(packets))
+
+    tl = per_packet(legacy_batch_ab, packets)
+    tc = per_packet(layout_batch_ab, packets)
+    print("Batch A/B int.from_bytes: %6.2f us/packet" % tl)
+    print("Batch A/B layout:         %6.2f us/packet (x%.1f)" % (tc, tl/tc))
+
+    nrx = ncomrx.NcomRx()
+    td = per_packet(nrx.decode, packets)
+    print("NcomRx.decode():          %6.2f us/packet" % td)
+
+    # Datagrams of several packets, some split across datagrams
+    stream = b''.join(packets)
+    datagrams = [stream[i:i+200] for i in range(0, len(stream), 200)]
+    nrx = ncomrx.NcomRx()
+    ta = per_packet(nrx.decode_all, datagrams) * len(datagrams) / len(packets)
+    print("NcomRx.decode_all():      %6.2f us/packet" % ta)
+
+    # Status payloads that repeat, so the status cache is used
+    stream = b''.join(make_stream(10000, repeatStatus=True))
+    datagrams = [stream[i:i+200] for i in range(0, len(stream), 200)]
+    nrx = ncomrx.NcomRx()
+    tr = per_packet(nrx.decode_all, datagrams) * len(datagrams) / len(packets)
+    print("  repeated status bytes:  %6.2f us/packet (%.0f%% cache hits)" % (
+        tr, 100.0 * nrx.connection['statusCacheHitRate']))
+    return 0
+
+
+def bench_resync():
+    # Non-NCOM datagrams (e.g. a misconfigured device sending to port
+    # 3000) mixed with NCOM, with plenty of false sync bytes
+    rnd = random.Random(2)
+    garbage = bytes(rnd.choice([ncomrx.NCOM_SYNC, 0, 1, 2]) for _ in range(1400*100))
+    datagrams = [garbage[i:i+1400] for i in range(0, len(garbage), 1400)]
+    packets = make_stream(2000)
+    stream = b''.join(packets)
+    datagrams += [stream[i:i+1400] for i in range(0, len(stream), 1400)]
+    rnd.shuffle(datagrams)
+
+    nrx = ncomrx.NcomRx()
+    t = per_packet(nrx.decode_all, datagrams, repeat=1)
+    c = nrx.connection
+    print("%d datagrams of 1400 bytes, %.0f%% non-NCOM" % (len(datagrams), 100.0 * len(garbage) / (len(garbage) + len(stream))))
+    print("NcomRx.decode_all():      %6.1f us/datagram" % t)
+    print("numPackets %d, skippedChars %d, resyncEvents %d, resyncDiscarded %d" % (
+        c['numPackets'], c['skippedChars'], c['resyncEvents'], c['resyncDiscarded']))
+    return 0
+
+
+def bench_numpy():
+    # Needs numpy, which the rest of ncom-web does not
+    import ncomrx_numpy
+    packets = make_stream(36000)
+    # Some invalid packets (NavStatus 0, 5, 6, 7), which clear status
+    rnd = random.Random(4)
+    for i in range(250, len(packets), 997):
+        packets[i] = make_packet(rnd.choice((0, 5, 6, 7)), i * 10, i % 82, bytes(8), rnd)
+    stream = b''.join(packets)
+
+    nrx = ncomrx.NcomRx()
+    t0 = time.perf_counter()
+    nrx.decode_all(stream)
+    t1 = time.perf_counter()
+    nav, status = ncomrx_numpy.decode(stream)
+    t2 = time.perf_counter()
+    print("%d packets" % len(nav))
+    print("NcomRx.decode_all():      %6.3f s" % (t1 - t0))
+    print("ncomrx_numpy.decode():    %6.3f s (x%.1f)" % (t2 - t1, (t1-t0)/(t2-t1)))
+
+    # The same values as NcomRx, packet by packet (NaN for not valid,
+    # GpsMinutes -1 when not known)
+    nrx = ncomrx.NcomRx(samples=True)
+    expected = []
+    for p in packets:
+        nrx.decode(p)
+        expected.append(tuple(nrx.sample))
+    if len(expected) != len(nav):
+        print("Mismatch: %d packets from NcomRx" % len(expected))
+        return 1
+    for i, name in enumerate(ncomrx.NavSample.FIELDS):
+        column = [e[i] for e in expected]
+        if name == 'GpsMinutes':
+            column = [-1 if v != v else v for v in column]
+        bad = [k for k, (a, b) in enumerate(zip(column, nav[name].tolist()))
+               if a != b and not (a != a and b != b)]
+        if bad:
+            print("Mismatch in %s at packet %d: NcomRx %r, ncomrx_numpy %r" % (
+                name, bad[0], column[bad[0]], nav[name][bad[0]]))
+            return 1
+    print("Same values as NcomRx")
+    return 0
+
+
+class FanoutSocket(object):
+    # Stands in for a websocket handler: sends a text frame on one end
+    # of a socket pair and reads it back, so each send is a system call
+    def __init__(self, path):
+        self.path = path
+        self.a, self.b = socket.socketpair()
+    
+    def send_message(self, message):
+        payload = message.encode('utf-8')
+        self.a.sendall(struct.pack(">BBH", 0x81, 126, len(payload)) + payload)
+        self.b.recv(65536)
+    
+    def close(self):
+        self.a.close()
+        self.b.close()
+
+
+def bench_fanout(sockets=500, devices=50):
+    import bgWebServer
+    paths = ["/message.json?ip=192.168.2.%d" % (d + 1) for d in range(devices)]
+    handlers = [FanoutSocket(paths[i % devices]) for i in range(sockets)]
+    ws = bgWebServer.BgWebServer.__new__(bgWebServer.BgWebServer) # No server
+    ws.server = type('Server', (), {})()
+    ws.server.websockets = bgWebServer.Registry()
+    for h in handlers:
+        ws.server.websockets.add(h)
+    message = '{"nav": [%s]}' % ', '.join(['0.123456789'] * 40)
+    
+    def scan(message, path):
+        # The previous send_message_all: compare the path of every websocket
+        for handler in handlers:
+            if path == handler.path:
+                handler.send_message(message)
+    
+    def best(fn, repeat=5):
+        # Best of 'repeat' runs, in microseconds per message (one device)
+        t = math.inf
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for path in paths:
+                fn(message, path)
+            t = min(t, time.perf_counter() - t0)
+        return t / len(paths) * 1e6
+    
+    # Other websockets connecting and disconnecting while sending
+    churn = [FanoutSocket(paths[0]) for _ in range(20)]
+    stop = threading.Event()
+    def connect():
+        while not stop.is_set():
+            for h in churn:
+                ws.server.websockets.add(h)
+            for h in churn:
+                ws.server.websockets.remove(h)
+    
+    print("%d websockets, %d per device" % (sockets, sockets // devices))
+    ts = best(scan)
+    tr = best(ws.send_message_all)
+    print("Scan every websocket:     %6.1f us/message" % ts)
+    print("Registry:                 %6.1f us/message (x%.1f)" % (tr, ts/tr))
+    t = threading.Thread(target=connect)
+    t.start()
+    try:
+        tc = best(ws.send_message_all)
+    finally:
+        stop.set()
+        t.join()
+    print("  while connecting:       %6.1f us/message" % tc)
+    for h in handlers + churn:
+        h.close()
+    return 0
+
+
+def bench_unmask():
+    from HTTPWebSocketsHandler import unmask
+    rnd = random.Random(3)
+    mask = bytes(rnd.randrange(256) for _ in range(4))
+    for n in (100, 10000, 100000):
+        data = bytes(rnd.randrange(32, 127) for _ in range(n))
+        
+        def chars(data):
+            # The loop that HTTPWebSocketsHandler used
+            decoded = ""
+            for byte in data:
+                decoded += chr(byte ^ mask[len(decoded) % 4])
+            return decoded
+        
+        if chars(unmask(data, mask)) != data.decode():
+            print("Mismatch unmasking %d bytes" % n)
+            return 1
+        tc = per_packet(chars, [data], repeat=3)
+        tu = per_packet(lambda d: unmask(d, mask), [data])
+        print("%6d bytes: byte by byte %9.1f us, unmask() %7.1f us (x%.0f)" % (n, tc, tu, tc/tu))
+    return 0
+
+
+def bench_nav():
+    import json
+    import publisher
+    nrx = ncomrx.NcomRx(samples=True)
+    navs, samples = [], []
+    for p in make_stream(1000):
+        nrx.decode(p)
+        navs.append(dict(nrx.nav))
+        samples.append(nrx.sample)
+    offset = nrx.status.get('TimeUtcOffset')
+    
+    def jsonNav(nav):
+        return json.dumps({'nav': nav}, default=str)
+    
+    tj = per_packet(jsonNav, navs)
+    bj = sum(len(jsonNav(nav)) for nav in navs) / len(navs)
+    print("JSON:          %6.1f us, %4.0f bytes per sample" % (tj, bj))
+    for n in (1, 10, 50):
+        batches = [samples[i:i+n] for i in range(0, len(samples), n)]
+        tb = per_packet(lambda b: publisher.encodeNav(b, offset), batches) / n
+        bb = sum(len(publisher.encodeNav(b, offset)) for b in batches) / len(samples)
+        print("binary, %2d/msg: %5.1f us, %4.0f bytes per sample (x%.0f faster)" % (n, tb, bb, tj/tb))
+    return 0
+
+
+def read_response(f):
+    # Reads one HTTP response from file f, returns (status, body)
+    status = f.readline().split()[1]
+    length = 0
+    while True:
+        line = f.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    return int(status), f.read(length)
+
+
+def bench_pageload(loads=50, port=8099):
+    import bgWebServer
+    with open('static/speed.html') as f:
+        page = f.read()
+    paths = ['/speed.html'] + ['/' + p for p in re.findall(r'(?:src|href)="([^"#:]+)"', page)]
+    headers = {'Accept-Encoding': 'gzip'}
+    
+    def separate():
+        # A new connection for each file, as with HTTP/1.0
+        for path in paths:
+            c = http.client.HTTPConnection('127.0.0.1', port)
+            c.request('GET', path, headers=dict(headers, Connection='close'))
+            r = c.getresponse()
+            r.read()
+            c.close()
+    
+    def keepalive():
+        # One connection, one request at a time
+        c = http.client.HTTPConnection('127.0.0.1', port)
+        for path in paths:
+            c.request('GET', path, headers=headers)
+            r = c.getresponse()
+            r.read()
+        c.close()
+    
+    def pipelined():
+        # One connection, all the requests sent together
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(b''.join(b'GET %s HTTP/1.1\r\nHost: x\r\nAccept-Encoding: gzip\r\n\r\n'
+                           % p.encode() for p in paths))
+        f = s.makefile('rb')
+        for path in paths:
+            if read_response(f)[0] != 200:
+                raise RuntimeError("Failed to load " + path)
+        f.close()
+        s.close()
+    
+    def asyncServer(port):
+        # AsyncWebServer on an event loop in another thread. Returns a
+        # function that stops it
+        import asyncio
+        import asyncWebServer
+        loop = asyncio.new_event_loop()
+        ws = asyncWebServer.AsyncWebServer(port=port)
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(ws.start(), loop).result()
+        return lambda: loop.call_soon_threadsafe(ws.stop)
+    
+    bgWebServer.BgWebHandler.log_message = lambda *args: None # Quiet
+    print("speed.html and %d files, %d page loads" % (len(paths) - 1, loads))
+    for server in ('Threaded', 'Selectors', 'Asyncio'):
+        if server == 'Asyncio':
+            stop = asyncServer(port)
+        else:
+            ws = bgWebServer.BgWebServer(port=port, selectors=server == 'Selectors')
+            stop = lambda: (ws.stop(), ws.thread.join())
+        time.sleep(0.1)
+        print("%s server:" % server)
+        for name, fn in (('new connection per file', separate),
+                         ('keep-alive', keepalive),
+                         ('pipelined', pipelined)):
+            t = per_packet(lambda _: fn(), range(loads), repeat=3) / 1000.0
+            print("  %-24s %6.2f ms/page" % (name + ':', t))
+        stop()
+        port += 1
+    return 0
+
+
+BENCHMARKS = {
+    'decode': bench_decode,
+    'resync': bench_resync,
+    'fanout': bench_fanout,
+    'unmask': bench_unmask,
+    'nav': bench_nav,
+    'pageload': bench_pageload,
+    'numpy': bench_numpy,
+    }
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or ['decode']
+    for name in names:
+        if name not in BENCHMARKS:
+            print("Unknown benchmark '%s', choose from: %s" % (name, ", ".join(BENCHMARKS)))
+            sys.exit(2)
+    sys.exit(max(BENCHMARKS[name]() for name in names))
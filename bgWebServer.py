@@ -38,9 +38,21 @@ Usage:
   
 ... and then web pages are served from subfolder "static"
 
+With ws = bgWebServer.BgWebServer(selectors=True) all the web pages and
+websockets are served by one thread using non-blocking sockets (see
+selectorWebServer), which is better for many connections. The methods
+are the same.
+
 In this version all websockets map to the same queue(s).
 TODO: A version with websocket addresses
 
+Files in "static" are served from memory, compressed and with cache
+headers (see staticCache).
+
+The open websockets are kept in a Registry (ws.server.websockets),
+indexed by path and by device (the ip query), so sending to one path
+only visits the websockets at that path.
+
 Problems:
 * Security. The modules that this web server is based on always state
      that they are insecure (without ever stating why). Consider this
@@ -50,7 +62,8 @@ Problems:
      application tries to quit, these threads can prevent termination.
      I'll fix that one day.
 * Each page is served from a new thread, which is fine for a few pages
-     but is not ideal if there are thousands of hits per second.
+     but is not ideal if there are thousands of hits per second. Use
+     selectors=True for that.
 
 """
 
@@ -58,12 +71,27 @@ from socketserver import ThreadingMixIn
 from http.server import HTTPServer
 from http.server import SimpleHTTPRequestHandler
 from HTTPWebSocketsHandler import HTTPWebSocketsHandler
+from HTTPWebSocketsHandler import DROP_OLDEST, KEEP_LATEST, DISCONNECT
+from HTTPWebSocketsHandler import DEFLATE_CONTEXT, DEFLATE_SHARED
+import selectorWebServer
+import staticCache
 import threading
+import io
 import queue
+import urllib.parse
 
 # Ideally settings would be added for these
 PORT = 8000
 MAX_MESSAGES=100 # Limit for incoming message queue
+SEND_QUEUE_SIZE=100 # Limit for the outgoing frames of each websocket
+SEND_POLICY=DROP_OLDEST # When a client can't keep up: DROP_OLDEST, KEEP_LATEST or DISCONNECT
+KEEP_ALIVE_TIMEOUT=15 # Seconds that an idle HTTP/1.1 connection is kept open
+# permessage-deflate for websockets, if the browser supports it:
+# DEFLATE_CONTEXT (best compression), DEFLATE_SHARED (compressed once
+# for all websockets, less CPU) or None
+WS_DEFLATE=DEFLATE_CONTEXT
+# Websocket sub-protocols that a page may ask for (binary nav, see publisher)
+WS_PROTOCOLS=('ncom-nav-binary',)
 
 class BgWebHandler(HTTPWebSocketsHandler):
     """
@@ -74,9 +102,38 @@ class BgWebHandler(HTTPWebSocketsHandler):
     # for received messages, so all websocket addresses map to the
     # same message queue
     
+    send_queue_size = SEND_QUEUE_SIZE
+    send_policy = SEND_POLICY
+    ws_deflate = WS_DEFLATE
+    ws_protocols = WS_PROTOCOLS
+    
+    # HTTP/1.1 keeps the connection open so that a page and its files
+    # are loaded over one connection (and thread). Every response has a
+    # Content-Length. timeout closes idle connections (not websockets)
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    # Otherwise the headers and file, written separately, wait for the
+    # delayed ACK of the client on a kept-alive connection
+    disable_nagle_algorithm = True
+    
     def __init__(self, request, client_address, server, directory="static"):
         HTTPWebSocketsHandler.__init__(self, request, client_address, server, directory=directory)
     
+    def send_head(self):
+        # Overrides SimpleHTTPRequestHandler so that files come from the
+        # static cache. Anything else (e.g. a directory without a
+        # trailing "/" or a missing file) is left to SimpleHTTPRequestHandler
+        response = self.server.static.respond(self.path,
+            self.headers.get('Accept-Encoding'), self.headers.get('If-None-Match'))
+        if response is None:
+            return SimpleHTTPRequestHandler.send_head(self)
+        code, headers, body = response
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        return io.BytesIO(body) if code == 200 else None
+
     def on_ws_message(self, message):
         # Overrides HTTPWebSocketsHandler
         if message != None:
@@ -88,16 +145,93 @@ class BgWebHandler(HTTPWebSocketsHandler):
 
     def on_ws_connected(self):
         # Overrides HTTPWebSocketsHandler
-        # Sever keeps a list of open websockets
-        self.server.websockets.append(self)
+        # Sever keeps a registry of open websockets
+        self.server.websockets.add(self)
 
     def on_ws_closed(self):
         # Overrides HTTPWebSocketsHandler
-        try:
-            # Remove open websockets
-            self.server.websockets.remove(self)
-        finally:
-            pass # TODO: something more descriptive here
+        # Remove open websockets
+        self.server.websockets.remove(self)
+
+class Registry():
+    """
+    The open websockets, indexed by path (including the query, e.g.
+    "/message.json?ip=192.168.2.62") and by device (the ip query).
+
+    Adding and removing take a lock and replace the tuples of the
+    index (copy-on-write), so the tuples returned by at_path(),
+    for_device() and iteration are never changed and can be used while
+    websockets connect and disconnect.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._all = ()
+        self._paths = {}    # path -> (handler, ...)
+        self._devices = {}  # ip -> (handler, ...)
+        self.version = 0    # Incremented on every change
+
+    @staticmethod
+    def _device(path):
+        # Returns the ip query of path, or None
+        query = urllib.parse.urlsplit(path).query
+        return urllib.parse.parse_qs(query).get('ip', [None])[0]
+
+    @staticmethod
+    def _with(index, key, handler):
+        # Replaces index[key] with a new tuple that includes handler
+        index[key] = index.get(key, ()) + (handler,)
+
+    @staticmethod
+    def _without(index, key, handler):
+        # Replaces index[key] with a new tuple without handler
+        handlers = tuple(h for h in index.get(key, ()) if h is not handler)
+        if handlers:
+            index[key] = handlers
+        else:
+            index.pop(key, None)
+
+    def add(self, handler):
+        """Adds an open websocket"""
+        device = self._device(handler.path)
+        with self._lock:
+            if handler in self._all:
+                return
+            self._all += (handler,)
+            paths = dict(self._paths)
+            self._with(paths, handler.path, handler)
+            devices = dict(self._devices)
+            if device is not None:
+                self._with(devices, device, handler)
+            self._paths, self._devices = paths, devices
+            self.version += 1
+
+    def remove(self, handler):
+        """Removes a websocket, if it is in the registry"""
+        device = self._device(handler.path)
+        with self._lock:
+            if handler not in self._all:
+                return
+            self._all = tuple(h for h in self._all if h is not handler)
+            paths = dict(self._paths)
+            self._without(paths, handler.path, handler)
+            devices = dict(self._devices)
+            self._without(devices, device, handler)
+            self._paths, self._devices = paths, devices
+            self.version += 1
+
+    def at_path(self, path):
+        """Returns the websockets at path (with its query) as a tuple"""
+        return self._paths.get(path, ())
+
+    def for_device(self, ip):
+        """Returns the websockets with query ip=<ip> as a tuple"""
+        return self._devices.get(ip, ())
+
+    def __iter__(self):
+        return iter(self._all)
+
+    def __len__(self):
+        return len(self._all)
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
@@ -107,13 +241,21 @@ class BgWebServer():
     """
     ws = bgWebServer.BgWebServer() starts the web server in a new
     thread, serving html from subdirectory "static" and connecting
-    incomming websockets as needed
+    incomming websockets as needed. With selectors=True that thread
+    serves all the connections, rather than a thread for each
     """    
-    def __init__(self):
-        self.server = ThreadedHTTPServer(('', PORT), BgWebHandler)
-        self.server.daemon_threads = True
+    def __init__(self, port=PORT, selectors=False):
+        if selectors:
+            self.server = selectorWebServer.SelectorHTTPServer(('', port),
+                send_queue_size=SEND_QUEUE_SIZE, send_policy=SEND_POLICY,
+                keep_alive_timeout=KEEP_ALIVE_TIMEOUT, ws_deflate=WS_DEFLATE,
+                ws_protocols=WS_PROTOCOLS)
+        else:
+            self.server = ThreadedHTTPServer(('', port), BgWebHandler)
+            self.server.daemon_threads = True
         self.server.websocketmessages = queue.Queue(maxsize=MAX_MESSAGES)
-        self.server.websockets = [] # TODO: Should have some lock mechanism on this
+        self.server.static = staticCache.StaticCache("static")
+        self.server.websockets = Registry()
 
         self.thread = threading.Thread(target=BgWebServer.server_thread, args=((self,)), daemon=True)
         self.thread.start()
@@ -148,6 +290,7 @@ class BgWebServer():
         """
         Returns the next message in the queue and the path of the socket
         that sent the message. Returns (message, path) as a tuple.
+        message is str for a text message and bytes for a binary one.
         """
         return self.server.websocketmessages.get() # blocks if empty
     
@@ -158,10 +301,13 @@ class BgWebServer():
         Or, if path is None it will send to all the websockets,
         which is probably dangerous!
         """
-        for handler in self.server.websockets:
+        if path == None:
+            handlers = tuple(self.server.websockets)
+        else:
+            handlers = self.server.websockets.at_path(path)
+        for handler in handlers:
             try:
-                if path == None or path == handler.path:
-                    handler.send_message(message)
+                handler.send_message(message)
             finally:
                 # todo: Could try to remove handler from list on a failed attempt?
                 pass # todo: Something more descriptive here
@@ -45,6 +45,11 @@ For example:
 will connect to 192.168.2.123 and open the web socket that serves
 navigation data from INS on IP address 192.168.2.62
 
+Add a rate query (1 to 100 Hz) for a faster update rate than the
+default 2Hz, for example nav.html?ip=192.168.2.62&rate=10 (see
+publisher.py). At high rates add &binary=1 for binary nav, which is
+much cheaper to encode and decode than JSON
+
 The devices.json web socket doesn't need an IP address because it lists
 all of the devices/IP addresses that have been received
 
@@ -84,9 +89,6 @@ though one socket, message.ws. Changed html to use chart.js.
 """
 
 # Standard python imports
-import time
-import json
-import threading
 import socket
 import sys
 import os
@@ -94,54 +96,56 @@ import re
 
 # Local modules
 import ncomrx_thread
+import ncomrx_shard
+import ncom_uds
 import bgWebServer
+import publisher
+
+# Number of worker processes for decoding. 0 decodes in this process,
+# which is fine for a few INSs. See ncomrx_shard for more
+WORKERS = 0
+
+# Prefix of the shared memory where the latest measurements of each INS
+# are written for other programs (see ncom_shm), e.g. 'ncomweb', or None
+SHARED_MEMORY = None
+
+# Start background ncom receiver and decoder. The worker processes
+# must be started before the other threads. They need fork (not on
+# Windows) because this script does not check __name__, see ncomrx_shard
+if WORKERS > 0 and ncomrx_shard.START_METHOD == 'fork':
+    nrxs = ncomrx_shard.NcomRxShards(workers=WORKERS, prefix=SHARED_MEMORY or 'ncomweb')
+else:
+    nrxs = ncomrx_thread.NcomRxThread(shmPrefix=SHARED_MEMORY)
+
+# Unix domain socket that streams every packet to other programs (see
+# ncom_uds), e.g. '/tmp/ncomweb.sock', or None. Needs WORKERS = 0
+UNIX_SOCKET = None
+if UNIX_SOCKET and WORKERS == 0:
+    uds = ncom_uds.UdsServer(nrxs, UNIX_SOCKET)
+
+# Serve all the web pages and web sockets from one thread (see
+# selectorWebServer) rather than a thread for each connection. Better
+# for many web pages, e.g. on a Raspberry Pi
+WEB_SERVER_SELECTORS = False
 
 # Start the background web server
-ws = bgWebServer.BgWebServer()
-
-# Start background ncom receiver and decoder
-nrxs = ncomrx_thread.NcomRxThread()
+ws = bgWebServer.BgWebServer(selectors=WEB_SERVER_SELECTORS)
 
 # Socket for sending UDP
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-def serve_json():
-    """
-    serve_json() loops forever serving ncom to the web sockets.
-    Run in a new thread
-    """
-    global nrx, ws
-    while True:
-        time.sleep(0.5) # Sets the update rate for the sockets
-        
-        # nrxs.nrx is a dictionary of all the INSs found on the network
-        # ... and the keys are the IP addresses
-        # Form a list of the IP addresses
-        devices = [ nrx for nrx in nrxs.nrx ] # list of keys/ip addresses
-        devices_json = json.dumps(devices)
-        ws.send_message_all(devices_json, path="/devices.json")
-        
-        # For each INS extract the information from the decoder (NcomRx type)
-        # Note that this implementation encodes everything in JSON, even if
-        # it ends up that no websocket wants the data
-        for addr, nrx in nrxs.nrx.items():      
-            nav_json = json.dumps({"nav":nrx['decoder'].nav}, default=str)
-            status_json = json.dumps({"status":nrx['decoder'].status}, default=str)
-            connection_json = json.dumps({"connection":nrx['decoder'].connection}, default=str)
-
-            ws.send_message_all(nav_json, path="/message.json?ip="+addr)
-            ws.send_message_all(status_json, path="/message.json?ip="+addr)
-            ws.send_message_all(connection_json, path="/message.json?ip="+addr)
-
 # Start the program
 print("Use Ctrl-C (Linux) or System Break (Windows) to quit")
-threading.Thread(target=serve_json).start()
+
+# Send the measurements to the web sockets as they arrive
+pub = publisher.Publisher(ws, nrxs)
 
 
 try:
     # receive messages from web sockets
     while(1):
         message,path = ws.recvpath() # Note: blocking
+        if not isinstance(message, str): continue # Commands are text
         print(path + ": " + message)
         
         # Many ways to split out the query, none particularly elegant
@@ -157,6 +161,7 @@ try:
 
 except KeyboardInterrupt as e:
     print('Stopping')
+    nrxs.stop() # Removes the shared memory
     # Needs extra code to stop threads, which may be blocked on sockets
     try:
         sys.exit(0)
@@ -0,0 +1,161 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+ncom-web entry point using asyncio
+
+This does the same as main.py (see there for the web sockets and web
+pages) but everything runs on one asyncio event loop:
+* NCOM is received and decoded by ncomrx_async
+* Web pages and web sockets are served by asyncWebServer
+* message.json is sent to each web socket at the rate of its "rate"
+  query, encoding only the messages that are subscribed to (see
+  publisher.py for the "rate" and "kinds" queries and binary nav).
+  The latest values are sent, whether or not they have changed, and
+  binary nav holds just the latest sample
+* Commands from the web sockets are forwarded to the INS on port 3001
+
+With the threaded version there is a thread for the receiver, one for
+serve_json, one for each web connection and the main loop, which all
+compete for the GIL.
+
+Usage:
+
+python3 main_async.py
+
+Then, from a web browser:
+
+http://<ip of python PC>:8000/nav.html?ip=<ip of INS>
+"""
+
+# Standard python imports
+import json
+import socket
+import asyncio
+import re
+
+# Local modules
+import ncomrx_async
+import asyncWebServer
+import publisher
+
+STATUS_RATE = 2.0       # Hz, the most that status and connection are sent
+
+
+async def serve_json(ws, nrxs):
+    """
+    serve_json() loops forever serving ncom to the web sockets, each at
+    the rate of its "rate" query (see publisher.ClientState). status and
+    connection are sent at no more than STATUS_RATE
+    """
+    loop = asyncio.get_running_loop()
+    clients = {}        # handler -> ClientState
+    devicesDue = 0.0
+    while True:
+        now = loop.time()
+        
+        # nrxs.nrx is a dictionary of all the INSs found on the network
+        # ... and the keys are the IP addresses
+        if now >= devicesDue:
+            devicesDue = now + publisher.DEVICES_PERIOD
+            devices = [ nrx for nrx in nrxs.nrx ] # list of keys/ip addresses
+            ws.send_message_all(json.dumps(devices), path="/devices.json")
+        
+        # Web sockets that have opened or closed
+        clients = {h: clients.get(h) or publisher.ClientState(h) for h in ws.websockets}
+        active = [c for c in clients.values() if c.kinds and c.ip in nrxs.nrx]
+        
+        # Encode each message that at least one web socket wants, once
+        encoded = {}
+        for c in active:
+            if now < c.due:
+                continue
+            c.due = now + c.period
+            kinds = [k for k in c.kinds if k == 'nav' or now >= c.statusDue]
+            if len(kinds) > ('nav' in kinds):
+                c.statusDue = now + 1.0 / STATUS_RATE
+            decoder = nrxs.nrx[c.ip]['decoder']
+            for kind in kinds:
+                binary = kind == 'nav' and c.binary
+                key = (c.ip, kind, binary)
+                if key not in encoded:
+                    if binary:
+                        # Binary nav, just the latest (see publisher.py)
+                        encoded[key] = publisher.encodeLatestNav(decoder)
+                    else:
+                        encoded[key] = json.dumps({kind: getattr(decoder, kind)}, default=str)
+                if binary:
+                    c.handler.send_binary(encoded[key])
+                else:
+                    c.handler.send_message(encoded[key])
+        
+        nextDue = min([c.due for c in active] + [devicesDue])
+        await asyncio.sleep(max(0.0, nextDue - loop.time()))
+
+
+async def forward_commands(ws, transport):
+    """
+    Receives messages from the web sockets and sends them to the INS
+    given by the ip query of the web socket, on port 3001
+    """
+    while True:
+        message, path = await ws.recvpath()
+        if not isinstance(message, str): continue # Commands are text
+        print(path + ": " + message)
+        
+        ip1 = re.search(r'[?&]ip(=([^&#]*)|&|#|$)',path)
+        if not ip1: continue      # query not found
+        ip2 = ip1.group()         # ?ip=...
+        if len(ip2) < 4: continue # probably not necessary
+        ip = ip2[4:]              # ...
+        try:                      # because might not be valid IP
+            transport.sendto(bytes(message+"\n", "utf-8"), (ip,3001))
+        except:
+            pass
+
+
+async def main():
+    ws = asyncWebServer.AsyncWebServer(ws_protocols=(publisher.NAV_PROTOCOL,))
+    await ws.start()
+    nrxs = await ncomrx_async.start()
+    
+    # Socket for sending UDP
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, family=socket.AF_INET)
+    
+    print("Use Ctrl-C (Linux) or System Break (Windows) to quit")
+    try:
+        await asyncio.gather(serve_json(ws, nrxs), forward_commands(ws, transport))
+    finally:
+        nrxs.stop()
+        ws.stop()
+        transport.close()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('Stopping')
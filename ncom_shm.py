@@ -0,0 +1,379 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+ncom_shm.py
+
+Shared memory blocks that hold the latest decoded NCOM for a device,
+so that another process can read it without pickling, sockets or
+queues. There is one writer (the process decoding the device) and any
+number of readers.
+
+Each DeviceSegment is a multiprocessing.shared_memory block with three
+regions:
+  nav        - the latest nav record: the NavSample values followed by
+               TimeUtcOffset and MachineTime (NAV_FIELDS), as doubles
+  status     - status dictionary, as JSON text
+  connection - connection dictionary, as JSON text
+
+Each region is protected by a sequence lock (seqlock): the writer makes
+the sequence number odd, writes, then makes it even again. A reader
+copies the region and tries again if the sequence number was odd or
+changed while it was copying. Readers never block the writer.
+
+ncom-web only publishes when SHARED_MEMORY is set in main.py (or it
+uses worker processes, which always do).
+
+The segments are named <prefix>_<ip> (e.g. ncomweb_192_168_2_62) and
+the IP addresses are listed in <prefix>_devices. Other programs on the
+same machine (loggers, CAN bridges, etc.) can read the latest nav
+record of each INS with NavReader, which needs nothing but this module
+and ncomrx:
+
+  import ncom_shm
+  print(ncom_shm.devices())              # ['192.168.2.62', ...]
+  r = ncom_shm.NavReader('192.168.2.62')
+  seq, rec = r.read()                    # rec['Lat'], rec['GpsSeconds'], ...
+  seq, rec = r.wait(seq, timeout=0.1)    # the next record
+"""
+
+import json
+import time
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+import ncomrx
+
+NAN = float('nan')
+
+# Nav record
+NAV_FIELDS = ncomrx.NavSample.FIELDS + ('TimeUtcOffset', 'MachineTime')
+NAV_STRUCT = struct.Struct('<%dd' % len(NAV_FIELDS))
+
+DEFAULT_PREFIX = 'ncomweb'
+
+# Region sizes, including the 16 byte header
+REGION_HEADER = 16
+NAV_SIZE = REGION_HEADER + NAV_STRUCT.size
+STATUS_SIZE = 65536
+CONNECTION_SIZE = 4096
+
+SEQ = struct.Struct('<Q')       # Sequence number, at offset 0
+LENGTH = struct.Struct('<I')    # Bytes of data, at offset 8
+
+
+class SeqlockRegion(object):
+    # buf[offset:offset+size] holding a sequence number, the length of
+    # the data and the data
+    def __init__(self, buf, offset, size):
+        self.buf = buf
+        self.offset = offset
+        self.data = offset + REGION_HEADER
+        self.capacity = size - REGION_HEADER
+        self.seq = SEQ.unpack_from(buf, offset)[0] # Writer's copy
+    
+    def write(self, data):
+        # Writes data (bytes-like). Returns False if it is too big
+        n = len(data)
+        if n > self.capacity:
+            return False
+        self.seq += 1
+        SEQ.pack_into(self.buf, self.offset, self.seq)      # Odd: writing
+        self.buf[self.data:self.data+n] = data
+        LENGTH.pack_into(self.buf, self.offset + 8, n)
+        self.seq += 1
+        SEQ.pack_into(self.buf, self.offset, self.seq)      # Even: done
+        return True
+    
+    def writeStruct(self, st, *values):
+        # Writes values packed with struct st
+        self.seq += 1
+        SEQ.pack_into(self.buf, self.offset, self.seq)
+        st.pack_into(self.buf, self.data, *values)
+        LENGTH.pack_into(self.buf, self.offset + 8, st.size)
+        self.seq += 1
+        SEQ.pack_into(self.buf, self.offset, self.seq)
+    
+    def read(self):
+        # Returns (seq, data). seq is 0 (and data empty) if nothing has
+        # been written
+        buf = self.buf
+        while True:
+            s1 = SEQ.unpack_from(buf, self.offset)[0]
+            if not s1 & 1:
+                n = LENGTH.unpack_from(buf, self.offset + 8)[0]
+                data = bytes(buf[self.data:self.data+min(n, self.capacity)])
+                if SEQ.unpack_from(buf, self.offset)[0] == s1:
+                    return s1, data
+            time.sleep(0) # Writer is part way through, let it finish
+    
+    def readStruct(self, st):
+        # Returns (seq, values) for a region written by writeStruct()
+        buf = self.buf
+        while True:
+            s1 = SEQ.unpack_from(buf, self.offset)[0]
+            if not s1 & 1:
+                values = st.unpack_from(buf, self.data)
+                if SEQ.unpack_from(buf, self.offset)[0] == s1:
+                    return s1, values
+            time.sleep(0)
+
+
+def segmentName(prefix, ip):
+    # Name of the shared memory for a device, e.g. ncomweb_192_168_2_62
+    return '%s_%s' % (prefix, ip.replace('.', '_').replace(':', '_'))
+
+
+_created = set() # Names of the shared memory created by this process
+
+def _create(name, size):
+    # Creates shared memory, replacing any left over from a previous run
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        old = shared_memory.SharedMemory(name=name)
+        old.close()
+        old.unlink()
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _created.add(name)
+    return shm
+
+
+def _attach(name, track):
+    shm = shared_memory.SharedMemory(name=name)
+    if not track and name not in _created:
+        # Attaching registers the shared memory to be removed when
+        # this process exits, which only the creator should do
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class DeviceSegment(object):
+    SIZE = NAV_SIZE + STATUS_SIZE + CONNECTION_SIZE
+    
+    def __init__(self, name, create=False, track=True):
+        # create - True to create the shared memory (the writer), False
+        #          to attach to an existing one
+        # track  - False for a process that only attaches, and is not
+        #          related to the creator, so that Python does not
+        #          remove the shared memory when it exits
+        self.shm = _create(name, self.SIZE) if create else _attach(name, track)
+        buf = self.shm.buf
+        self.nav = SeqlockRegion(buf, 0, NAV_SIZE)
+        self.status = SeqlockRegion(buf, NAV_SIZE, STATUS_SIZE)
+        self.connection = SeqlockRegion(buf, NAV_SIZE + STATUS_SIZE, CONNECTION_SIZE)
+    
+    ####################################################################
+    # Writer
+    def writeNav(self, decoder, machineTime=None):
+        # Writes decoder.sample, which needs NcomRx(samples=True)
+        self.nav.writeStruct(NAV_STRUCT, *decoder.sample,
+            decoder.status.get('TimeUtcOffset', NAN),
+            NAN if machineTime is None else machineTime)
+    
+    def writeJson(self, decoder):
+        # Writes the status and connection dictionaries. Returns False
+        # if either is too big for its region. They are copied first, so
+        # this can be called from a thread other than the decoder's
+        s = self.status.write(json.dumps(dict(decoder.status), default=str).encode('utf-8'))
+        c = self.connection.write(json.dumps(dict(decoder.connection), default=str).encode('utf-8'))
+        return s and c
+    
+    ####################################################################
+    # Reader
+    def readNavRecord(self):
+        # Returns (seq, dict of NAV_FIELDS), NaN values included
+        seq, values = self.nav.readStruct(NAV_STRUCT)
+        return seq, dict(zip(NAV_FIELDS, values))
+    
+    def readNav(self):
+        # Returns a dictionary like NcomRx.nav (with GpsTime, UtcTime)
+        seq, values = self.nav.readStruct(NAV_STRUCT)
+        if seq == 0:
+            return {}
+        n = len(ncomrx.NavSample.FIELDS)
+        nav = ncomrx.NavSample(values[:n]).asdict()
+        utcOffset = values[n]
+        try:
+            nav['GpsTime'] = ncomrx.NcomTime(nav['GpsMinutes'], nav['GpsSeconds'])
+            if utcOffset == utcOffset:
+                nav['UtcTime'] = ncomrx.NcomTime(nav['GpsMinutes'], nav['GpsSeconds'], int(utcOffset))
+        except (KeyError, OverflowError):
+            pass
+        nav.pop('GpsMinutes', None) # In status, not nav
+        return nav
+    
+    def readJson(self, region):
+        # Returns the dictionary in the status or connection region
+        seq, data = region.read()
+        return json.loads(data) if data else {}
+    
+    def close(self):
+        self.nav = self.status = self.connection = None
+        self.shm.close()
+    
+    def unlink(self):
+        self.shm.unlink()
+
+
+class Directory(object):
+    # <prefix>_devices: JSON list of the IP addresses with segments
+    SIZE = 65536
+    
+    def __init__(self, prefix=DEFAULT_PREFIX, create=False, track=True):
+        name = prefix + '_devices'
+        self.shm = _create(name, self.SIZE) if create else _attach(name, track)
+        self.region = SeqlockRegion(self.shm.buf, 0, self.SIZE)
+        self.ips = []
+    
+    def add(self, ip):
+        # Writer
+        self.ips.append(ip)
+        self.region.write(json.dumps(self.ips).encode('utf-8'))
+    
+    def read(self):
+        seq, data = self.region.read()
+        return json.loads(data) if data else []
+    
+    def close(self):
+        self.region = None
+        self.shm.close()
+    
+    def unlink(self):
+        self.shm.unlink()
+
+
+class Publisher(object):
+    # Publishes one decoder to its segment: nav after every packet and
+    # status/connection at most every 'interval' seconds. Encoding the
+    # JSON is much slower than the nav record, so a program can leave
+    # it to another thread: set changed after each datagram and call
+    # publish() from that thread every interval
+    def __init__(self, segment, interval=0.1):
+        self.segment = segment
+        self.interval = interval
+        self.published = 0.0
+        self.changed = False    # Decoded since status/connection were written
+    
+    def packet(self, decoder, machineTime):
+        # Call for each packet (e.g. from NcomRx.onPacket)
+        self.segment.writeNav(decoder, machineTime)
+    
+    def datagram(self, decoder, now):
+        # Call after each datagram is decoded, to write status and
+        # connection from the decoding thread
+        self.changed = True
+        if now - self.published >= self.interval:
+            self.publish(decoder, now)
+    
+    def publish(self, decoder, now):
+        # Writes status and connection if they have changed
+        if not self.changed:
+            return
+        self.changed = False
+        self.published = now
+        if not self.segment.writeJson(decoder):
+            decoder.connection['publishErrors'] = decoder.connection.get('publishErrors', 0) + 1
+
+
+########################################################################
+# Reader library
+
+def devices(prefix=DEFAULT_PREFIX):
+    """
+    Returns the IP addresses of the INSs that ncom-web is publishing,
+    or [] if it is not running
+    """
+    try:
+        d = Directory(prefix, track=False)
+    except FileNotFoundError:
+        return []
+    try:
+        return d.read()
+    finally:
+        d.close()
+
+
+class NavReader(object):
+    """
+    Reads the latest nav record of an INS published by ncom-web.
+    Raises FileNotFoundError if the INS is not being published.
+    """
+    def __init__(self, ip, prefix=DEFAULT_PREFIX):
+        self.ip = ip
+        self.segment = DeviceSegment(segmentName(prefix, ip), track=False)
+        self._names = NAV_FIELDS
+    
+    def read(self):
+        """
+        Returns (seq, record) where record is a dictionary of NAV_FIELDS
+        (NaN when not valid) and seq increases with each new record
+        (0 if nothing has been published yet)
+        """
+        seq, values = self.segment.nav.readStruct(NAV_STRUCT)
+        return seq, dict(zip(self._names, values))
+    
+    def values(self):
+        """
+        Returns (seq, values), a tuple in the order of NAV_FIELDS, which
+        is the quickest way to read
+        """
+        return self.segment.nav.readStruct(NAV_STRUCT)
+    
+    def sample(self):
+        """
+        Returns the latest NavSample, or None if nothing has been
+        published yet
+        """
+        seq, values = self.segment.nav.readStruct(NAV_STRUCT)
+        return ncomrx.NavSample(values[:len(ncomrx.NavSample.FIELDS)]) if seq else None
+    
+    def wait(self, seq, timeout=None, poll=0.0005):
+        """
+        Waits for a record newer than seq, polling every 'poll' seconds.
+        Returns (seq, record), or None after timeout seconds
+        """
+        end = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            if SEQ.unpack_from(self.segment.shm.buf, self.segment.nav.offset)[0] > seq:
+                s, record = self.read()
+                if s > seq:
+                    return s, record
+            if end is not None and time.perf_counter() > end:
+                return None
+            time.sleep(poll)
+    
+    def status(self):
+        """
+        Returns the latest status dictionary (updated about 10 times
+        a second)
+        """
+        return self.segment.readJson(self.segment.status)
+    
+    def connection(self):
+        return self.segment.readJson(self.segment.connection)
+    
+    def close(self):
+        self.segment.close()
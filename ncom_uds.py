@@ -0,0 +1,185 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+ncom_uds.py
+
+Streams every decoded packet to other programs on the same machine
+through a Unix domain socket, as fixed size binary records. This is
+much cheaper than JSON over a websocket and no packets are skipped
+(unless a reader falls behind).
+
+Use by:
+
+nrxs = ncomrx_thread.NcomRxThread()
+uds = ncom_uds.UdsServer(nrxs, '/tmp/ncomweb.sock')
+
+Each record is RECORD_STRUCT (little endian):
+  ip          - 4 bytes, IPv4 address of the INS
+  machineTime - double, time.perf_counter() when the datagram arrived
+  values      - one double per ncomrx.NavSample.FIELDS (NavStatus,
+                GpsMinutes, GpsSeconds, Ax, ... Roll), NaN when not
+                valid
+
+Each reader has a buffer of up to maxRecords records. If a reader does
+not keep up the newest records are dropped for that reader only and
+counted in its 'dropped'. The server only subscribes to nrxs (which
+makes the decoders produce NavSamples) while a reader is connected.
+To read, in another program:
+
+  for ip, machineTime, sample in ncom_uds.records('/tmp/ncomweb.sock'):
+      print(ip, sample.GpsSeconds, sample.Lat)
+"""
+
+import os
+import socket
+import struct
+import threading
+
+import ncomrx
+
+RECORD_STRUCT = struct.Struct('<4sd%dd' % len(ncomrx.NavSample.FIELDS))
+
+
+class UdsClient(object):
+    # One connected reader
+    def __init__(self, sock, maxBytes):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.buffer = bytearray()
+        self.maxBytes = maxBytes
+        self.sent = 0       # Records sent
+        self.dropped = 0    # Records dropped because the buffer was full
+    
+    def put(self, record):
+        # Adds the record to the buffer and sends what the socket will
+        # take without blocking. Returns False if the reader has gone
+        if len(self.buffer) + len(record) > self.maxBytes:
+            self.dropped += 1
+        else:
+            self.buffer += record
+            self.sent += 1
+        try:
+            n = self.sock.send(self.buffer)
+            del self.buffer[:n]
+        except BlockingIOError:
+            pass
+        except OSError:
+            return False
+        return True
+    
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class UdsServer(threading.Thread):
+    """
+    Listens on the Unix domain socket 'path' and streams every packet
+    decoded by nrxs (an NcomRxThread) to the connected readers.
+    """
+    def __init__(self, nrxs, path, maxRecords=1000):
+        threading.Thread.__init__(self, daemon=True)
+        self.nrxs = nrxs
+        self.path = path
+        self.maxBytes = maxRecords * RECORD_STRUCT.size
+        self.clients = ()   # Replaced, not modified, when readers come and go
+        self.lock = threading.Lock() # For clients and subscription
+        self.keepGoing = True
+        
+        if os.path.exists(path):
+            os.unlink(path) # Left over from a previous run
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen()
+        
+        # While there are readers, the subscription's thread packs and
+        # sends the records, so the decoder is never held up by them
+        self.subscription = None
+        self.start()
+    
+    def run(self):
+        # Accepts readers
+        while self.keepGoing:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break # Socket closed by stop()
+            with self.lock:
+                self.clients += (UdsClient(conn, self.maxBytes),)
+                if self.subscription is None:
+                    self.subscription = self.nrxs.subscribe(self._packet, kinds=('sample',))
+    
+    def _packet(self, packet):
+        clients = self.clients
+        if not clients or packet['sample'] is None:
+            return
+        record = RECORD_STRUCT.pack(socket.inet_aton(packet['ip']),
+            packet['machineTime'] or float('nan'), *packet['sample'])
+        gone = [c for c in clients if not c.put(record)]
+        if gone:
+            with self.lock:
+                self.clients = tuple(c for c in self.clients if c not in gone)
+                if not self.clients and self.subscription is not None:
+                    self.subscription.unsubscribe() # Last reader has gone
+                    self.subscription = None
+            for c in gone:
+                c.close()
+    
+    def stop(self):
+        self.keepGoing = False
+        with self.lock:
+            if self.subscription is not None:
+                self.subscription.unsubscribe()
+                self.subscription = None
+        self.sock.close()
+        for c in self.clients:
+            c.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def records(path):
+    """
+    Connects to a UdsServer and yields (ip, machineTime, NavSample)
+    for every packet, until the server closes
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    f = sock.makefile('rb')
+    try:
+        while True:
+            data = f.read(RECORD_STRUCT.size)
+            if len(data) < RECORD_STRUCT.size:
+                return
+            r = RECORD_STRUCT.unpack(data)
+            yield socket.inet_ntoa(r[0]), r[1], ncomrx.NavSample(r[2:])
+    finally:
+        f.close()
+        sock.close()
@@ -43,6 +43,11 @@ Decodes measurements into dictionaries
 import struct
 import datetime
 import math
+import collections
+import itertools
+import functools
+import array
+import operator
 
 ########################################################################
 # Definitions: from NComRx.c
@@ -117,6 +122,10 @@ ALT2M               = 1e-3                # Units of 1 mm
 SUPPLYV2V           = 0.1                 # Units of 0.1 V
 SP2M                = 1e-3                # Units of 1mm
 
+NCOM_BUFFER_SIZE    = 1024                # Initial size of the receive buffer
+NCOM_RESYNC_WINDOW  = 4096                # Bytes of running checksum computed at a time when resynchronising
+NCOM_RESYNC_BUDGET  = 65536               # Most bytes searched for sync in one call of decode_all()/decode()
+
 RAD2DEG             = 57.29577951308232   # 180/pi
 DEG2RAD             = 1.0/RAD2DEG
 
@@ -135,21 +144,293 @@ EARTH_ECCENTRICITY  = (0.0818191908426)
 GPS_STARTTIME = datetime.datetime(1980,1,6,tzinfo=datetime.timezone.utc)
 
 
+########################################################################
+# Batch A and Batch B packet layout
+#
+# Each field is (name, offset, width, kind, scale)
+#   offset, width - position of the field in the 72 byte packet
+#   kind          - 'i' signed integer, 'u' unsigned integer, 'f' float
+#   scale         - factors that are applied in turn. Keeping them
+#                   separate (rather than pre-multiplying) gives exactly
+#                   the same values as int.from_bytes(...) * A * B
+#
+# The tables are compiled once, at import, into functions that extract
+# a whole batch with one struct.unpack_from() call.
+
+BATCH_A_FIELDS = (
+    ('GpsSeconds',  1, 2, 'u', (TIME2SEC,)),
+    ('Ax',          3, 3, 'i', (ACC2MPS2,)),
+    ('Ay',          6, 3, 'i', (ACC2MPS2,)),
+    ('Az',          9, 3, 'i', (ACC2MPS2,)),
+    ('Wx',         12, 3, 'i', (RATE2RPS, RAD2DEG)),
+    ('Wy',         15, 3, 'i', (RATE2RPS, RAD2DEG)),
+    ('Wz',         18, 3, 'i', (RATE2RPS, RAD2DEG)),
+    )
+
+BATCH_B_FIELDS = (
+    ('Lat',        23, 8, 'f', ()), # Note: radians
+    ('Lon',        31, 8, 'f', ()), # Note: radians
+    ('Alt',        39, 4, 'f', ()),
+    ('Vn',         43, 3, 'i', (VEL2MPS,)),
+    ('Ve',         46, 3, 'i', (VEL2MPS,)),
+    ('Vd',         49, 3, 'i', (VEL2MPS,)),
+    ('Heading',    52, 3, 'i', (ANG2RAD, RAD2DEG)), # Wrapped to 0..360
+    ('Pitch',      55, 3, 'i', (ANG2RAD, RAD2DEG)),
+    ('Roll',       58, 3, 'i', (ANG2RAD, RAD2DEG)),
+    )
+
+
+def _compileLayout(fields):
+    # Compiles a field table into a function f(nav, packet, offset)
+    # that extracts every field with one struct.unpack_from() and
+    # stores the scaled values in the dictionary nav.
+    # struct cannot unpack 24-bit integers so they are read as a
+    # 16-bit unsigned lower part and an 8-bit (signed) upper part.
+    intFormats = {(1,'u'):'B', (1,'i'):'b', (2,'u'):'H', (2,'i'):'h',
+                  (4,'u'):'I', (4,'i'):'i'}
+    floatFormats = {4:'f', 8:'d'}
+    start = fields[0][1]
+    fmt = '<'
+    pos = start
+    n = 0
+    lines = []
+    for name, offset, width, kind, scale in fields:
+        if offset > pos:
+            fmt += '%dx' % (offset - pos)
+        if kind == 'f':
+            fmt += floatFormats[width]
+            expr = 'r[%d]' % n
+            n += 1
+        elif width == 3:
+            fmt += 'Hb' if kind == 'i' else 'HB'
+            expr = '((r[%d] << 16) | r[%d])' % (n+1, n)
+            n += 2
+        else:
+            fmt += intFormats[(width,kind)]
+            expr = 'r[%d]' % n
+            n += 1
+        for f in scale:
+            expr += ' * %r' % f
+        lines.append('    nav[%r] = %s' % (name, expr))
+        pos = offset + width
+    s = struct.Struct(fmt)
+    src = 'def unpack(nav, packet, offset=0):\n' \
+        + '    r = unpack_from(packet, offset + %d)\n' % start \
+        + '\n'.join(lines) + '\n'
+    namespace = {'unpack_from': s.unpack_from}
+    exec(src, namespace)
+    return namespace['unpack']
+
+# unpackBatchA(nav, packet, offset=0) and unpackBatchB(...) decode
+# Batch A/B of the packet starting at offset into the dictionary nav
+# (Note: Heading is not wrapped to 0..360 by unpackBatchB)
+unpackBatchA = _compileLayout(BATCH_A_FIELDS)
+unpackBatchB = _compileLayout(BATCH_B_FIELDS)
+
+
+########################################################################
+# Time
+#
+# Building datetime objects for GpsTime and UtcTime on every packet is
+# slow and they are rarely looked at, so the decoder keeps times as
+# numbers in an NcomTime. The datetime is only built when it is used.
+
+# Range of times that datetime can represent, in seconds from GPS_STARTTIME
+NCOMTIME_MIN = (datetime.datetime.min.replace(tzinfo=datetime.timezone.utc) - GPS_STARTTIME).total_seconds()
+NCOMTIME_MAX = (datetime.datetime.max.replace(tzinfo=datetime.timezone.utc) - GPS_STARTTIME).total_seconds()
+
+@functools.total_ordering
+class NcomTime(object):
+    # GPS_STARTTIME + minutes + seconds + offset (e.g. the UTC offset)
+    #
+    # str() gives exactly the same text as str() of the datetime, so
+    # json.dumps(..., default=str) is unchanged. Other datetime
+    # attributes and methods (year, isoformat(), etc.) are passed on to
+    # the datetime, which is built the first time it is needed.
+    __slots__ = ('minutes', 'seconds', 'offset', '_datetime')
+    
+    def __init__(self, minutes, seconds, offset=0):
+        # Raises OverflowError if datetime cannot represent the time,
+        # as GPS_STARTTIME + timedelta(...) would
+        if not NCOMTIME_MIN <= minutes * 60.0 + seconds + offset <= NCOMTIME_MAX:
+            raise OverflowError("NcomTime out of range")
+        self.minutes = minutes
+        self.seconds = seconds
+        self.offset = offset
+        self._datetime = None
+    
+    @property
+    def gpsSeconds(self):
+        # Seconds since GPS_STARTTIME
+        return self.minutes * 60.0 + self.seconds + self.offset
+    
+    @property
+    def datetime(self):
+        if self._datetime is None:
+            # Built in the same way as the decoder used to
+            dt = GPS_STARTTIME + datetime.timedelta( minutes=self.minutes, seconds=self.seconds )
+            if self.offset:
+                dt += datetime.timedelta( seconds=self.offset )
+            self._datetime = dt
+        return self._datetime
+    
+    def __getattr__(self, name):
+        # Only called for attributes that NcomTime does not have
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.datetime, name)
+    
+    def __str__(self):
+        return str(self.datetime)
+    
+    def __repr__(self):
+        return 'NcomTime(%r, %r, %r)' % (self.minutes, self.seconds, self.offset)
+    
+    def __eq__(self, other):
+        return self.datetime == (other.datetime if isinstance(other, NcomTime) else other)
+    
+    def __lt__(self, other):
+        return self.datetime < (other.datetime if isinstance(other, NcomTime) else other)
+    
+    def __hash__(self):
+        return hash(self.datetime)
+    
+    def __add__(self, other):
+        return self.datetime + other
+    
+    def __sub__(self, other):
+        return self.datetime - (other.datetime if isinstance(other, NcomTime) else other)
+
+
+########################################################################
+# NavSample
+#
+# A compact, immutable record of the navigation measurements from one
+# packet, for library use and for keeping history. The values are held
+# in an array('d'), which needs a fraction of the memory of a copy of
+# the nav dictionary, behind a read-only memoryview so that they cannot
+# be changed through the sample. Measurements that were not in the packet (e.g.
+# Batch B when NavStatus is 1 or 2) and unknown GpsMinutes are NaN.
+#
+# Values can be read as attributes (s.Lat) or items (s['Lat']).
+
+NAN = float('nan')
+
+class NavSample(object):
+    FIELDS = ('NavStatus', 'GpsMinutes') \
+        + tuple(f[0] for f in BATCH_A_FIELDS + BATCH_B_FIELDS)
+    INDEX = {name: i for i, name in enumerate(FIELDS)}
+    __slots__ = ('_values',)
+    
+    def __init__(self, values):
+        # values: one number per FIELDS
+        _setValues(self, memoryview(array.array('d', values)).toreadonly())
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("NavSample is immutable")
+    
+    def __reduce__(self):
+        # For copy and pickle, which cannot handle the memoryview
+        return (NavSample, (tuple(self._values),))
+    
+    def __getitem__(self, name):
+        return self._values[self.INDEX[name]]
+    
+    def __len__(self):
+        return len(self._values)
+    
+    def __iter__(self):
+        # Values in the order of FIELDS
+        return iter(self._values)
+    
+    def __repr__(self):
+        return 'NavSample(%s)' % ', '.join('%s=%r' % kv for kv in zip(self.FIELDS, self._values))
+    
+    @property
+    def GpsTime(self):
+        # NcomTime of the sample, or None if GpsMinutes is not known
+        m = self._values[1]
+        if m != m or self.GpsSeconds != self.GpsSeconds:
+            return None
+        return NcomTime(int(m), self.GpsSeconds)
+    
+    def asdict(self):
+        # Dictionary of the valid measurements, as in NcomRx.nav
+        d = {k: v for k, v in zip(self.FIELDS, self._values) if v == v}
+        d['NavStatus'] = int(d['NavStatus'])
+        if 'GpsMinutes' in d:
+            d['GpsMinutes'] = int(d['GpsMinutes'])
+        return d
+
+# Read-only attributes for each field
+for _i, _name in enumerate(NavSample.FIELDS):
+    setattr(NavSample, _name, property(lambda self, i=_i: self._values[i]))
+del _i, _name
+_setValues = NavSample._values.__set__ # Bypasses __setattr__
+
+# Functions that get the Batch A/B values, as tuples, from nav
+navSampleA = operator.itemgetter(*(f[0] for f in BATCH_A_FIELDS))
+navSampleB = operator.itemgetter(*(f[0] for f in BATCH_B_FIELDS))
+NAVSAMPLE_NAN_A = (NAN,) * len(BATCH_A_FIELDS)
+NAVSAMPLE_NAN_B = (NAN,) * len(BATCH_B_FIELDS)
+
+
 ########################################################################
 # NCOM class
 class NcomRx(object):
-    def __init__(self):
+    # Status channels that must be decoded every time, even when the
+    # bytes are unchanged, because the decoders depend on previous
+    # values (counters, innovations, time) or share measurements with
+    # another channel (12 and 57 both set GAPx/y/z, so the last one
+    # received must win)
+    alwaysDecodeChannels = frozenset([0,1,2,12,17,18,32,45,50,57,59,61])
+    
+    # Bytes that one call of decode_all() or decode() may search for
+    # sync. Bytes beyond this are discarded (see _resync). None for no
+    # limit, e.g. when decoding a file
+    resyncBudget = NCOM_RESYNC_BUDGET
+    
+    def __init__(self, samples=False, history=0):
+        # samples - if True, each packet also produces a NavSample,
+        #           which is held in self.sample
+        # history - number of NavSamples to keep in self.history (a
+        #           deque, newest last); implies samples
         # todo: protect nav, status with a lock when multi-threaded
         self.nav = {}  # Dictionary for navigation measurements
         self.status = {} # Dictionary for status/configuration
         self.connection = {} # Dictionary for decoding status variables
-        self.ncomBytes = b'' # Holds bytes waiting to be decoded
         
-        # Find all 'decodeStatus' functions and create dictionary
-        decodeList = [ (int(decoder[12:]),getattr(self,decoder)) for decoder in dir(self) if decoder[0:12] == 'decodeStatus']
-        self.decodeStatus = dict(decodeList)
+        # NavSample of the last packet. Replacing the reference is
+        # atomic, so other threads always see a consistent sample
+        self.samples = samples or history > 0
+        self.sample = None
+        self.history = collections.deque(maxlen=history) if history > 0 else None
+        
+        # Bytes waiting to be decoded (an incomplete packet) are held
+        # in rxBuffer[rxStart:rxEnd]. The buffer is preallocated and
+        # only grows if decode() is given more than it can hold
+        self.rxBuffer = bytearray(NCOM_BUFFER_SIZE)
+        self.rxView = memoryview(self.rxBuffer)
+        self.rxStart = 0
+        self.rxEnd = 0
+        self.resyncLeft = self.resyncBudget # Of this call, see _resync()
+        
+        # Status channel decoders are built once per class, see
+        # _buildStatusDecoders(). Other classes that call this __init__
+        # use the NcomRx table
+        cls = type(self) if isinstance(self, NcomRx) else NcomRx
+        if 'statusDecoders' not in cls.__dict__:
+            cls._buildStatusDecoders()
         self.connection['decodeStatusErrors'] = {} # Useful for debugging or identifying new status channels
         
+        # The last status bytes decoded for each channel. Most channels
+        # repeat the same bytes for hours, so decoding is skipped when
+        # they have not changed (see alwaysDecodeChannels)
+        self.statusCache = [None] * 256
+        self.connection['statusCacheHits'] = 0
+        self.connection['statusCacheMisses'] = 0
+        self.connection['statusCacheHitRate'] = 0.0 # Fraction of status channels not decoded
+        
         # A race-condition exists with time, where minutes are in
         # a status message and seconds are in Batch A
         # Store previous seconds to figure out if they have wrapped
@@ -159,84 +440,223 @@ class NcomRx(object):
         self.connection['numChars'] = 0
         self.connection['skippedChars'] = 0
         self.connection['numPackets'] = 0        
+        self.connection['resyncEvents'] = 0      # Times bytes were skipped to find the next packet
+        self.connection['resyncDiscarded'] = 0   # Skipped bytes not searched, see _resync()
+        self.inSync = True
         
         # Filter for converting machineTime to GpsTime
         self.connection['timeOffset'] = None   # GpsTime = machineTime + timeOffset
         self.f1 = 0.1            # Factor to decrease timeOffset
         self.f2 = 0.001          # Factor to increase timeOffset
+        
+        # Called as onPacket(self, machineTime) after each packet is
+        # decoded, e.g. by NcomRxThread to pass packets to subscribers.
+        # It runs in the decoding thread so it should be quick
+        self.onPacket = None
+
+    ####################################################################
+    # decode_all() is the normal function to call when new data (e.g. a
+    # UDP datagram) is available. It decodes every complete packet and
+    # updates the nav, status and connection dictionaries with the new
+    # measurements. Returns the number of packets decoded.
+    #
+    # Packets are decoded directly from buf. Only the bytes of an
+    # incomplete packet at the end of buf are copied, so they can be
+    # joined to the next call.
+    def decode_all(self, buf, machineTime=None, nbytes=None):
+        # buf should be a bytes or bytearray object
+        # nbytes is the number of valid bytes in buf (default: all), which
+        #   is useful when buf is a preallocated receive buffer
+        # machineTime can be used to work out the offset between the
+        #   local clock and GpsTime
+        mv = memoryview(buf)
+        end = len(mv) if nbytes is None else nbytes
+        pos = 0
+        count = 0
+        self.resyncLeft = self.resyncBudget
+        
+        # First complete any packet carried over from last time. Only
+        # copy as much of buf as is needed to make up a packet
+        while self.rxEnd > self.rxStart:
+            need = NOUTPUT_PACKET_LENGTH - (self.rxEnd - self.rxStart)
+            if need > 0:
+                take = min(need, end - pos)
+                self._append(mv[pos:pos+take])
+                pos += take
+                if self.rxEnd - self.rxStart < NOUTPUT_PACKET_LENGTH:
+                    break # buf used up, still not a complete packet
+            self.rxStart, decoded = self._decodeNext(self.rxBuffer, self.rxView, self.rxStart, self.rxEnd, machineTime)
+            count += decoded
+            if not decoded and pos < end:
+                # Out of sync, so resynchronise over all the bytes
+                # rather than a few at a time
+                self._append(mv[pos:end])
+                pos = end
+        
+        # Then decode the rest of buf in place
+        if self.rxEnd == self.rxStart:
+            self.rxStart = self.rxEnd = 0
+            decoded = True
+            while decoded:
+                pos, decoded = self._decodeNext(buf, mv, pos, end, machineTime)
+                count += decoded
+            self._append(mv[pos:end]) # Carry over an incomplete packet
+        
+        self.connection['unprocessedBytes'] = self.rxEnd - self.rxStart
+        return count
+
 
     ####################################################################
-    # decode() is the normal function to call when new data is available
-    # It will update the nav, status and connection dictionaries with
-    # new measurements.
-    # Only one packet will be decoded so either ensure that
-    # rxBytes <= NOUTPUT_PACKET_LENGTH or call multiple times until
-    # return value is 0
+    # decode() is the original interface, which can be called when new
+    # data is available. Only one packet will be decoded so either
+    # ensure that rxBytes <= NOUTPUT_PACKET_LENGTH or call multiple
+    # times until return value is 0. decode_all() is more efficient.
     def decode(self,rxBytes, machineTime=None):
-        # ncomBytes should be a bytes object
+        # rxBytes should be a bytes object
         # Returns 1 if packet is decoded
         # Returns 0 if packet cannot be decoded
         # machineTime can be used to work out the offset between the
         #   local clock and GpsTime
-        
-        self.ncomBytes += rxBytes # Add received bytes to ncomBytes
-        
-        # Find the first valid packet
-        skipped = 0
-        while True:
-            # Find the NCOM_SYNC
-            syncOffset = self.ncomBytes.find(NCOM_SYNC)
-            
-            # -1 means there is no sync or valid packet in ncomBytes
-            if syncOffset < 0:
-                skipped += len(self.ncomBytes)
-                self.connection['numChars'] += skipped
-                self.connection['skippedChars'] += skipped
-                self.ncomBytes = b''
-                return 0
-            
-            # Realign to sync byte
-            self.ncomBytes = self.ncomBytes[syncOffset:]
-            skipped += syncOffset
-            
-            # Is there enough data for a full packet?
-            if len(self.ncomBytes) < NOUTPUT_PACKET_LENGTH:
-                return 0
-                        
-            # Test the packet integrity
-            if self.ncomBytes[22] == sum(self.ncomBytes[1:22]) % 256 \
-            or self.ncomBytes[61] == sum(self.ncomBytes[1:61]) % 256 \
-            or self.ncomBytes[71] == sum(self.ncomBytes[1:71]) % 256:
-                self.connection['numChars'] += NOUTPUT_PACKET_LENGTH
-                self.connection['skippedChars'] += skipped
-                self.connection['numPackets'] += 1
-                break # Valid packet
-            
-            # This sync is not a valid packet so skip over
-            self.ncomBytes = self.ncomBytes[1:]
-            skipped += 1
-        
-        # ... Must have a valid packet or we would have returned
+        if self.rxEnd == self.rxStart:
+            self.rxStart = self.rxEnd = 0
+        self.resyncLeft = self.resyncBudget
+        self._append(rxBytes)
+        self.rxStart, decoded = self._decodeNext(self.rxBuffer, self.rxView, self.rxStart, self.rxEnd, machineTime)
+        self.connection['unprocessedBytes'] = self.rxEnd - self.rxStart
+        return 1 if decoded else 0
+
+
+    def _append(self, data):
+        # Copies data to the end of rxBuffer, moving the unprocessed
+        # bytes to the start of the buffer (or growing it) if necessary
+        n = len(data)
+        if n == 0:
+            return
+        if self.rxEnd + n > len(self.rxBuffer):
+            held = self.rxEnd - self.rxStart
+            if held + n > len(self.rxBuffer):
+                self.rxView.release()
+                self.rxBuffer = self.rxBuffer[self.rxStart:self.rxEnd] + bytearray(max(held + n, 2*len(self.rxBuffer)) - held)
+                self.rxView = memoryview(self.rxBuffer)
+            else:
+                self.rxView[0:held] = self.rxView[self.rxStart:self.rxEnd]
+            self.rxStart, self.rxEnd = 0, held
+        self.rxView[self.rxEnd:self.rxEnd+n] = data
+        self.rxEnd += n
+
+
+    def _decodeNext(self, data, p, pos, end, machineTime):
+        # Finds and decodes the first valid packet in data[pos:end]
+        # data is bytes/bytearray (for find()) and p is a memoryview of it
+        # Returns (pos, decoded) where pos is where the next search
+        # should start: after the decoded packet or, if no packet was
+        # decoded, at the start of the bytes that should be kept
+        
+        # Normally data[pos:] starts with a valid packet
+        if end - pos >= NOUTPUT_PACKET_LENGTH and p[pos] == NCOM_SYNC and (
+               p[pos+22] == sum(p[pos+1:pos+22]) % 256
+            or p[pos+61] == sum(p[pos+1:pos+61]) % 256
+            or p[pos+71] == sum(p[pos+1:pos+71]) % 256):
+            self.connection['numChars'] += NOUTPUT_PACKET_LENGTH
+            self.connection['numPackets'] += 1
+            self.inSync = True
+        elif 0 < end - pos < NOUTPUT_PACKET_LENGTH and p[pos] == NCOM_SYNC:
+            return pos, False # Start of a packet, wait for the rest
+        else:
+            pos, found = self._resync(data, p, pos, end)
+            if not found:
+                return pos, False
+        
+        self._decodePacket(p, pos, machineTime)
+        if self.onPacket is not None:
+            self.onPacket(self, machineTime)
+        return pos + NOUTPUT_PACKET_LENGTH, True
+
+
+    def _resync(self, data, p, pos, end):
+        # Searches data[pos:end] for the next valid packet when the
+        # stream is not aligned (e.g. corrupted or non-NCOM data).
+        # Returns (pos, found) in the same way as _decodeNext, but
+        # without decoding the packet.
+        #
+        # Checking every sync byte by summing up to 71 bytes is slow
+        # when there is a lot of rubbish, so a running checksum is
+        # computed once, NCOM_RESYNC_WINDOW bytes at a time, and then
+        # each candidate packet is checked from differences of the
+        # running checksum. The work is linear in the number of bytes.
+        #
+        # The work is also limited to resyncLeft bytes in each call of
+        # decode_all() or decode(). When that has been searched, the
+        # rest of the bytes are discarded without being searched
+        # (counted in skippedChars and resyncDiscarded), except the last
+        # NOUTPUT_PACKET_LENGTH-1, which are carried over to the next
+        # call
+        start = pos
+        find = data.find
+        last = end - NOUTPUT_PACKET_LENGTH # Last sync that can be checked
+        left = self.resyncLeft
+        limited = left is not None and pos + left <= last
+        if limited:
+            last = pos + left - 1
+        found = False
+        sync = find(NCOM_SYNC, pos, end)
+        while 0 <= sync <= last:
+            # Running checksum of this window: acc[i] is the sum of
+            # data[sync:sync+i]
+            acc = list(itertools.accumulate(p[sync:min(end, sync+NCOM_RESYNC_WINDOW)], initial=0))
+            base = sync
+            stop = min(last, sync + NCOM_RESYNC_WINDOW - NOUTPUT_PACKET_LENGTH)
+            while 0 <= sync <= stop:
+                a = sync - base
+                s1 = acc[a+1]
+                if data[sync+22] == (acc[a+22] - s1) % 256 \
+                or data[sync+61] == (acc[a+61] - s1) % 256 \
+                or data[sync+71] == (acc[a+71] - s1) % 256:
+                    found = True
+                    break
+                sync = find(NCOM_SYNC, sync+1, end)
+            if found:
+                break
+        
+        # Keep from the valid packet or from a sync that is too close to
+        # the end to be checked; everything before it is discarded
+        if found or not limited:
+            pos = end if sync < 0 else sync
+        else:
+            pos = end - NOUTPUT_PACKET_LENGTH + 1 # Out of budget
+            self.connection['resyncDiscarded'] += pos - (start + left)
+        if left is not None:
+            self.resyncLeft = max(0, left - (pos - start))
+        skipped = pos - start
+        if skipped:
+            if self.inSync:
+                self.connection['resyncEvents'] += 1 # Lost sync
+            self.inSync = False
+            self.connection['numChars'] += skipped
+            self.connection['skippedChars'] += skipped
+        if found:
+            self.connection['numChars'] += NOUTPUT_PACKET_LENGTH
+            self.connection['numPackets'] += 1
+            self.inSync = True
+        return pos, found
+
+
+    def _decodePacket(self, p, o, machineTime):
+        # Decodes the valid packet in p[o:o+NOUTPUT_PACKET_LENGTH]
         # Decode NavStatus to find what other fields are valid
-        self.nav['NavStatus'] = int(self.ncomBytes[21])
-        self.status['NavStatus'] = int(self.ncomBytes[21])
+        self.nav['NavStatus'] = p[o+21]
+        self.status['NavStatus'] = p[o+21]
         
         if self.nav['NavStatus'] in [0,5,6,7]:
             self.status = {}
-            # Remove this packet
-            self.ncomBytes = self.ncomBytes[NOUTPUT_PACKET_LENGTH:]
-            self.connection['unprocessedBytes'] = len(self.ncomBytes)
-            return 1 # All quantities are invalid
+            self.statusCache = [None] * 256
+            if self.samples:
+                self._storeSample(p[o+21], False, False)
+            return # All quantities are invalid
         
         if self.nav['NavStatus'] in [1,2,3,4,20,21,22]:        
             # Decode Batch A
-            self.nav['GpsSeconds'] = int.from_bytes(self.ncomBytes[1:3], byteorder = 'little', signed=False) * TIME2SEC
-            self.nav['Ax'] = int.from_bytes(self.ncomBytes[3:6],   byteorder = 'little', signed=True) * ACC2MPS2
-            self.nav['Ay'] = int.from_bytes(self.ncomBytes[6:9],   byteorder = 'little', signed=True) * ACC2MPS2
-            self.nav['Az'] = int.from_bytes(self.ncomBytes[9:12],  byteorder = 'little', signed=True) * ACC2MPS2
-            self.nav['Wx'] = int.from_bytes(self.ncomBytes[12:15], byteorder = 'little', signed=True) * RATE2RPS * RAD2DEG
-            self.nav['Wy'] = int.from_bytes(self.ncomBytes[15:18], byteorder = 'little', signed=True) * RATE2RPS * RAD2DEG
-            self.nav['Wz'] = int.from_bytes(self.ncomBytes[18:21], byteorder = 'little', signed=True) * RATE2RPS * RAD2DEG
+            unpackBatchA(self.nav, p, o)
 
             # Create sensible time format
             # See if seconds have wrapped
@@ -247,11 +667,9 @@ class NcomRx(object):
                     pass
             self.previousSeconds = self.nav['GpsSeconds']
             try:
-                self.nav['GpsTime'] = GPS_STARTTIME + \
-                    datetime.timedelta( minutes=self.status['GpsMinutes'], seconds=self.nav['GpsSeconds'] )
+                self.nav['GpsTime'] = NcomTime( self.status['GpsMinutes'], self.nav['GpsSeconds'] )
                 self.status['GpsTime'] = self.nav['GpsTime']
-                self.nav['UtcTime'] = self.nav['GpsTime'] + \
-                    datetime.timedelta( seconds=self.status['TimeUtcOffset'] )
+                self.nav['UtcTime'] = NcomTime( self.status['GpsMinutes'], self.nav['GpsSeconds'], self.status['TimeUtcOffset'] )
                 self.status['UtcTime'] = self.nav['UtcTime']
             except: # Most likely is that 'GpsMinutes' or 'TimeUtcOffset' is not available
                 pass
@@ -277,35 +695,51 @@ class NcomRx(object):
             
         if self.nav['NavStatus'] in [3,4,20,21,22]:
             # Decode Batch B
-            self.nav['Lat'] = struct.unpack("<d",self.ncomBytes[23:31])[0] # Note: radians
-            self.nav['Lon'] = struct.unpack("<d",self.ncomBytes[31:39])[0] # Note: radians
-            self.nav['Alt'] = struct.unpack("<f",self.ncomBytes[39:43])[0]
-            self.nav['Vn'] = int.from_bytes(self.ncomBytes[43:46], byteorder = 'little', signed=True) * VEL2MPS
-            self.nav['Ve'] = int.from_bytes(self.ncomBytes[46:49], byteorder = 'little', signed=True) * VEL2MPS
-            self.nav['Vd'] = int.from_bytes(self.ncomBytes[49:52], byteorder = 'little', signed=True) * VEL2MPS
-            h = int.from_bytes(self.ncomBytes[52:55], byteorder = 'little', signed=True) * ANG2RAD * RAD2DEG
-            self.nav['Heading'] = h if h >= 0.0 else h + 360.0
-            self.nav['Pitch']   = int.from_bytes(self.ncomBytes[55:58], byteorder = 'little', signed=True) * ANG2RAD * RAD2DEG
-            self.nav['Roll']    = int.from_bytes(self.ncomBytes[58:61], byteorder = 'little', signed=True) * ANG2RAD * RAD2DEG
+            unpackBatchB(self.nav, p, o)
+            if self.nav['Heading'] < 0.0:
+                self.nav['Heading'] += 360.0
+
+        if self.samples:
+            self._storeSample(self.nav['NavStatus'],
+                self.nav['NavStatus'] in [1,2,3,4,20,21,22],
+                self.nav['NavStatus'] in [3,4,20,21,22])
 
         if self.nav['NavStatus'] in [1,2,3,4,10,20,21,22]:
             # Decode Batch S
-            statusChannel = int(self.ncomBytes[62])
+            statusChannel = p[o+62]
+            statusBytes = bytes(p[o+63:o+71])
+            if statusBytes == self.statusCache[statusChannel]:
+                # Same bytes as last time, so status already holds the
+                # decoded values
+                c = self.connection
+                c['statusCacheHits'] += 1
+                c['statusCacheHitRate'] = c['statusCacheHits'] / (c['statusCacheHits'] + c['statusCacheMisses'])
+                return
+            c = self.connection
+            c['statusCacheMisses'] += 1
+            c['statusCacheHitRate'] = c['statusCacheHits'] / (c['statusCacheHits'] + c['statusCacheMisses'])
             try:
-                self.decodeStatus[statusChannel](self.ncomBytes[63:71])
+                self.statusDecoders[statusChannel](self, statusBytes)
+                if statusChannel not in self.alwaysDecodeChannels:
+                    self.statusCache[statusChannel] = statusBytes
             except:
-                # Catch missing or erroneous decodeStatus functions
+                self.statusCache[statusChannel] = None
+                # Catch missing (None) or erroneous decoders
                 try:
                     # Increment the errors for this channel
                     self.connection['decodeStatusErrors'][statusChannel] += 1
                 except:
                     self.connection['decodeStatusErrors'][statusChannel] = 1 # Start new key
 
-        # Remove this packet
-        self.ncomBytes = self.ncomBytes[NOUTPUT_PACKET_LENGTH:]
-        self.connection['unprocessedBytes'] = len(self.ncomBytes)
 
-        return 1
+    def _storeSample(self, navStatus, batchA, batchB):
+        # Makes the NavSample for this packet from nav, which holds the
+        # values just decoded for the valid batches
+        self.sample = NavSample((navStatus, self.status.get('GpsMinutes', NAN))
+            + (navSampleA(self.nav) if batchA else NAVSAMPLE_NAN_A)
+            + (navSampleB(self.nav) if batchB else NAVSAMPLE_NAN_B))
+        if self.history is not None:
+            self.history.append(self.sample)
 
 
     def mt2Gps(self, machineTime):
@@ -321,28 +755,12 @@ class NcomRx(object):
     ####################################################################
     # Decoders for status channels.
     #
-    # "invalid" measurements are added then removed. While this is more
-    # CPU intensive, it does reduce source code significantly
+    # Most status channels are decoded from the table STATUS_CHANNELS
+    # (see below). The channels here are hand-written because they
+    # depend on previous values (counters, filters) or do not fit the
+    # table. A decodeStatusN method takes priority over the table, so
+    # a subclass can override any channel.
     
-    def decodeStatus0(self,statusBytes):
-        # Full time, number of satellites, position mode, velocity mode, dual antenna mode
-        # 'Gps' not 'Gnss' used for historical reasons
-        self.status['GpsMinutes'] = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=False)
-        if self.status['GpsMinutes'] < 1000: del self.status['GpsMinutes']
-        
-        self.status['GpsNumObs'] = int(statusBytes[4])
-        if self.status['GpsNumObs'] == 255: del self.status['GpsNumObs']
-
-        self.status['GpsPosMode'] = int(statusBytes[5])
-        if self.status['GpsPosMode'] == 255: del self.status['GpsPosMode']
-
-        self.status['GpsVelMode'] = int(statusBytes[6])
-        if self.status['GpsVelMode'] == 255: del self.status['GpsVelMode']
-
-        self.status['GpsAttMode'] = int(statusBytes[7])
-        if self.status['GpsAttMode'] == 255: del self.status['GpsAttMode']
-
-
     def decodeStatus1(self,statusBytes):
         # Kalman filter innovations set 1 (position, velocity, attitude)
         self._updateInnovation( 'InnPosX', statusBytes[0:1] )
@@ -426,7 +844,7 @@ class NcomRx(object):
         if (il > s): # Indicates s has wrapped
             iu += 1
         
-        self.status[measurement] = (iu<<8) + s        
+        self.status[measurement] = (iu<<8) + s
 
 
     def _updateLE32(self, s, measurement ):
@@ -447,7 +865,7 @@ class NcomRx(object):
         if (il > s): # Indicates s has wrapped
             iu += 1
         
-        self.status[measurement] = (iu<<32) + s        
+        self.status[measurement] = (iu<<32) + s
 
 
     def decodeStatus2(self,statusBytes):
@@ -457,170 +875,6 @@ class NcomRx(object):
         self._updateLE16(int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False),'GpsPrimaryCharsSkipped')
         self._updateLE16(int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False),'GpsPrimaryOldPkts')
 
-    def decodeStatus3(self,statusBytes):
-        # Position accuracy
-        self.status['NorthAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * POSA2M
-        self.status['EastAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * POSA2M
-        self.status['AltAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * POSA2M
-        if statusBytes[6] > 150:
-            del self.status['NorthAcc']
-            del self.status['EastAcc']
-            del self.status['AltAcc']       
-
-        # ABD robot UMAC interface status byte
-        self.status['UmacStatus'] = statusBytes[7]
-        if statusBytes[7] == 0xFF: del self.status['UmacStatus']
-
-
-    def decodeStatus4(self,statusBytes):
-        # Velocity accuracy
-        self.status['VnAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * VELA2MPS
-        self.status['VeAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * VELA2MPS
-        self.status['VdAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * VELA2MPS
-        if statusBytes[6] > 150:
-            del self.status['VnAcc']
-            del self.status['VeAcc']
-            del self.status['VdAcc']       
-
-        # Processing method used by blended
-        self.status['BlendedMethod'] = statusBytes[7]
-        if statusBytes[7] == 0: del self.status['BlendedMethod']
-
-
-    def decodeStatus5(self,statusBytes):
-        # Orientation accuracy
-        self.status['HeadingAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * ANGA2RAD * RAD2DEG
-        self.status['PitchAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * ANGA2RAD * RAD2DEG
-        self.status['RollAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * ANGA2RAD * RAD2DEG
-        if statusBytes[6] > 150:
-            del self.status['HeadingAcc']
-            del self.status['PitchAcc']
-            del self.status['RollAcc']       
-
-
-    def decodeStatus6(self,statusBytes):
-        # Gyro bias
-        self.status['WxBias'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GB2RPS * RAD2DEG
-        self.status['WyBias'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GB2RPS * RAD2DEG
-        self.status['WzBias'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GB2RPS * RAD2DEG
-        if statusBytes[6] > 150:
-            del self.status['WxBias']
-            del self.status['WyBias']
-            del self.status['WzBias']       
-
-
-    def decodeStatus7(self,statusBytes):
-        # Accelerometer bias
-        self.status['AxBias'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * AB2MPS2
-        self.status['AyBias'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * AB2MPS2
-        self.status['AzBias'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * AB2MPS2
-        if statusBytes[6] > 150:
-            del self.status['AxBias']
-            del self.status['AyBias']
-            del self.status['AzBias']       
-
-
-    def decodeStatus8(self,statusBytes):
-        # Gyro scale factor
-        self.status['WxSf'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GSFACTOR
-        self.status['WySf'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GSFACTOR
-        self.status['WzSf'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GSFACTOR
-        if statusBytes[6] > 150:
-            del self.status['WxSf']
-            del self.status['WySf']
-            del self.status['WzSf']       
-
-
-    def decodeStatus9(self,statusBytes):
-        # Gyro bias accuracy
-        self.status['WxBiasAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * GBA2RPS * RAD2DEG
-        self.status['WyBiasAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * GBA2RPS * RAD2DEG
-        self.status['WzBiasAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * GBA2RPS * RAD2DEG
-        if statusBytes[6] > 150:
-            del self.status['WxBiasAcc']
-            del self.status['WyBiasAcc']
-            del self.status['WzBiasAcc']       
-
-
-    def decodeStatus10(self,statusBytes):
-        # Accelerometer bias accuracy
-        self.status['AxBiasAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * ABA2MPS2
-        self.status['AyBiasAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * ABA2MPS2
-        self.status['AzBiasAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * ABA2MPS2
-        if statusBytes[6] > 150:
-            del self.status['AxBiasAcc']
-            del self.status['AyBiasAcc']
-            del self.status['AzBiasAcc']       
-
-
-    def decodeStatus11(self,statusBytes):
-        # Gyro scale factor accuracy
-        self.status['WxSfAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * GSAFACTOR
-        self.status['WySfAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * GSAFACTOR
-        self.status['WzSfAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * GSAFACTOR
-        if statusBytes[6] > 150:
-            del self.status['WxSfAcc']
-            del self.status['WySfAcc']
-            del self.status['WzSfAcc']       
-
-
-    def decodeStatus12(self,statusBytes):
-        # Position estimate of primary GPS antenna lever-arm
-        self.status['GAPx'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GPSPOS2M
-        self.status['GAPy'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GPSPOS2M
-        self.status['GAPz'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GPSPOS2M
-        if statusBytes[6] > 150:
-            del self.status['GAPx']
-            del self.status['GAPy']
-            del self.status['GAPz']       
-
-
-    def decodeStatus13(self,statusBytes):
-        # Orientation estimate of dual antenna systems
-        self.status['AtH'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['AtP'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['BaseLineLength'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * GPSPOS2M
-        if statusBytes[6] > 150:
-            del self.status['AtH']
-            del self.status['AtP']
-            del self.status['BaseLineLength']       
-
-
-    def decodeStatus14(self,statusBytes):
-        # Position estimate of primary GPS antenna lever-arm accuracy
-        self.status['GAPxAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * GPSPOSA2M
-        self.status['GAPyAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * GPSPOSA2M
-        self.status['GAPzAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * GPSPOSA2M
-        if statusBytes[6] > 150:
-            del self.status['GAPxAcc']
-            del self.status['GAPyAcc']
-            del self.status['GAPzAcc']
-
-
-    def decodeStatus15(self,statusBytes):
-        # Orientation estimate of dual antenna systems accuracy
-        self.status['AtHAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * GPSATTA2RAD * RAD2DEG
-        self.status['AtPAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * GPSATTA2RAD * RAD2DEG
-        self.status['BaseLineLengthAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * GPSPOSA2M
-        if statusBytes[6] > 150:
-            del self.status['AtHAcc']
-            del self.status['AtPAcc']
-            del self.status['BaseLineLengthAcc']
-
-
-    def decodeStatus16(self,statusBytes):
-        # RT to vehicle rotation
-        self.status['VehHeading'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['VehPitch'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['VehRoll'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        if statusBytes[6] > 150:
-            del self.status['VehHeading']
-            del self.status['VehPitch']
-            del self.status['VehRoll']       
-
-        self.status['TimeUtcOffset'] = int.from_bytes(statusBytes[7:8], byteorder = 'little', signed=True) >> 1
-        if statusBytes[7]&0x1 == 0: del self.status['TimeUtcOffset']
-
 
     def decodeStatus17(self,statusBytes):
         # Internal information about secondary GNSS receiver
@@ -637,193 +891,6 @@ class NcomRx(object):
         self._updateLE16(int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False),'ImuSkipped')
 
 
-    def decodeStatus19(self,statusBytes):
-        # Software version running on the RT
-        self.status['DevId'] = statusBytes.decode('utf-8')
-
-
-    def decodeStatus20(self,statusBytes):
-        # Differential corrections configuration
-        self.status['GpsDiffAge'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * DIFFAGE2SEC
-        self.status['BaseStationId'] = statusBytes[2:6].decode('utf-8')
-        if statusBytes[2] == 0: del self.status['BaseStationId']
-
-
-    def decodeStatus21(self,statusBytes):
-        # Disk space and size of current internal log file
-        self.status['DiskSpace'] = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=False)
-        self.status['FileSize'] = int.from_bytes(statusBytes[4:8], byteorder = 'little', signed=False)
-        
-
-    def decodeStatus22(self,statusBytes):
-        # Internal information on timing of real-time processing
-        self.status['TimeMismatch'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False)
-        if self.status['TimeMismatch'] == 65535: del self.status['TimeMismatch']
-        
-        self.status['ImuTimeDiff'] = statusBytes[2]
-        if statusBytes[2] == 255: del self.status['ImuTimeDiff']
-
-        self.status['ImuTimeMargin'] = statusBytes[3]
-        if statusBytes[3] == 255: del self.status['ImuTimeMargin']
-
-        self.status['ImuLoopTime'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        if self.status['ImuLoopTime'] == 65535: del self.status['ImuLoopTime']
-
-        self.status['OpLoopTime'] = int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False)
-        if self.status['OpLoopTime'] == 65535: del self.status['OpLoopTime']
-
-
-    def decodeStatus23(self,statusBytes):
-        # System up time and consecutive GPS rejections
-        self.status['BnsLag'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False)
-        if self.status['BnsLag'] == 65535: del self.status['BnsLag']
-        
-        x = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False)
-        if x > 20700: self.status['UpTime'] = (x-20532)*3600
-        elif x < 10800: self.status['UpTime'] = x
-        else: self.status['UpTime'] = (x-10620)*60
-        
-        self.status['GpsPosReject'] = statusBytes[4]
-        if statusBytes[4] == 255: del self.status['GpsPosReject']
-        
-        self.status['GpsVelReject'] = statusBytes[5]
-        if statusBytes[5] == 255: del self.status['GpsVelReject']
-
-        self.status['GpsAttReject'] = statusBytes[6]
-        if statusBytes[6] == 255: del self.status['GpsAttReject']
-
-
-    def decodeStatus24(self,statusBytes):
-        # Trigger 1 event timings (falling edge triggers)
-        m = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True)
-        ms = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        us = statusBytes[6]
-        self.status['Trig1FallingTime'] = m * 60.0 + ms * 0.001 + us * FINETIME2SEC
-        if m == 0: del self.status['Trig1FallingTime']
-        
-        self.status['Trig1FallingCount'] = statusBytes[7]
-
-    # decodeStatus25 not decoded: reserved
-    # Status 25 used by older OxTS systems and unlikely to be output
-    # by any firmware after 2010. Status 66/67 used now.
-    
-    def decodeStatus26(self,statusBytes):
-        # Remote lever-arm
-        self.status['RemoveLeverArmX'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * OUTPOS2M
-        self.status['RemoveLeverArmY'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * OUTPOS2M
-        self.status['RemoveLeverArmZ'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * OUTPOS2M
-        if statusBytes[6] > 0:
-            del self.status['RemoveLeverArmX']
-            del self.status['RemoveLeverArmY']
-            del self.status['RemoveLeverArmZ']       
-
-    def decodeStatus27(self,statusBytes):
-        # Internal information about dial antenna ambiguity search
-        self.status['HeadQuality'] = statusBytes[0]
-        self.status['HeadSearchType'] = statusBytes[1]
-        self.status['HeadSearchStatus'] = statusBytes[2]
-        self.status['HeadSearchReady'] = statusBytes[3]
-        
-        self.status['HeadSearchInit'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        if self.status['HeadSearchInit'] == 0xFFFF: del self.status['HeadSearchInit']
-        
-        self.status['HeadSearchNum'] = int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False)
-        if self.status['HeadSearchNum'] == 0xFFFF: del self.status['HeadSearchNum']
-    
-    def decodeStatus28(self,statusBytes):
-        # Details on initial settings for heading ambiguity search
-        self.status['HeadSearchMaster'] = 1 + statusBytes[0]
-        self.status['HeadSearchSlave1'] = 1 + statusBytes[1]
-        self.status['HeadSearchSlave2'] = 1 + statusBytes[2]
-        self.status['HeadSearchSlave3'] = 1 + statusBytes[3]
-        self.status['HeadSearchTime'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        self.status['HeadSearchConstr'] = int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False)
-        
-    def decodeStatus29(self,statusBytes):
-        # Details on the initial settings
-        self.status['OptionLevel'] = statusBytes[0]
-        if (statusBytes[0]&0x80) == 0x80: del self.status['OptionLevel']
-        
-        self.status['OptionVibration'] = statusBytes[1]
-        if (statusBytes[1]&0x80) == 0x80: del self.status['OptionVibration']
-
-        self.status['OptionGpsAcc'] = statusBytes[2]
-        if (statusBytes[2]&0x80) == 0x80: del self.status['OptionGpsAcc']
-
-        self.status['OptionUpd'] = statusBytes[3]
-        if (statusBytes[3]&0x80) == 0x80: del self.status['OptionUpd']
-
-        self.status['OptionsSer1'] = statusBytes[4]
-        if (statusBytes[4]&0x80) == 0x80: del self.status['OptionsSer1']
-
-        self.status['OptionsSer2'] = statusBytes[5]
-        if (statusBytes[5]&0x80) == 0x80: del self.status['OptionsSer2']
-
-        self.status['OptionHeading'] = statusBytes[6]
-        if (statusBytes[6]&0x80) == 0x80: del self.status['OptionHeading']
-
-        self.status['OptionHeave'] = statusBytes[7]
-        if (statusBytes[7]&0x80) == 0x80: del self.status['OptionHeave']
-
-
-    def decodeStatus30(self,statusBytes):
-        # Operating system and script version information
-        self.status['OsVersion1'] = statusBytes[0]
-        if statusBytes[0] == 0xFF: del self.status['OsVersion1']
-        
-        self.status['OsVersion2'] = statusBytes[1]
-        if statusBytes[1] == 0xFF: del self.status['OsVersion2']
-
-        self.status['OsVersion3'] = statusBytes[2]
-        if statusBytes[2] == 0xFF: del self.status['OsVersion3']
-        
-        x = int.from_bytes(statusBytes[3:6], byteorder = 'little', signed=True)
-        self.status['OsScriptId'] = "%06d" % x
-        if x < 0: del self.status['OsScriptId']
-        
-        self.status['SerialNumber'] = int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False)
-        # Not going to invalidate this one 0xFFFF is invalid
-
-
-    def decodeStatus31(self,statusBytes):
-        # Hardware configuration information
-        self.status['ImuType'] = statusBytes[0]
-        if statusBytes[0] == 0xFF: del self.status['ImuType']
-        
-        self.status['GpsPrimary'] = statusBytes[1]
-        if statusBytes[1] == 0xFF: del self.status['GpsPrimary']
-
-        self.status['GpsSecondary'] = statusBytes[2]
-        if statusBytes[2] == 0xFF: del self.status['GpsSecondary']
-
-        self.status['InterPcbType'] = statusBytes[3]
-        if statusBytes[3] == 0xFF: del self.status['InterPcbType']
-
-        self.status['FrontPcbType'] = statusBytes[4]
-        if statusBytes[4] == 0xFF: del self.status['FrontPcbType']
-
-        self.status['InterSwId'] = statusBytes[5]
-        if statusBytes[5] == 0xFF: del self.status['InterSwId']
-
-        self.status['HwConfig'] = statusBytes[6]
-        if statusBytes[6] == 0xFF: del self.status['HwConfig']
-
-        gf = ~statusBytes[7]
-        self.status['PsrDiffEnabled'] = (gf & 0x01) > 0
-        self.status['SBASEnabled']    = (gf & 0x02) > 0
-        self.status['OmniVBSEnabled'] = (gf & 0x08) > 0
-        self.status['OmniHpEnabled']  = (gf & 0x10) > 0
-        self.status['L1DiffEnabled']  = (gf & 0x20) > 0
-        self.status['L2DiffEnabled']  = (gf & 0x40) > 0
-        if (gf & 0x80) == 0:
-            del self.status['PsrDiffEnabled']
-            del self.status['SBASEnabled']
-            del self.status['OmniVBSEnabled']
-            del self.status['OmniHpEnabled']
-            del self.status['L1DiffEnabled']
-            del self.status['L2DiffEnabled']
-
-
     def decodeStatus32(self,statusBytes):
         # Kalman filter innovations for zero velocity, advanced slip, etc.
         self._updateInnovation( 'InnZeroVelX', statusBytes[0:1] )
@@ -834,234 +901,28 @@ class NcomRx(object):
         self._updateInnovation( 'InnWSpeed', statusBytes[0:1] )
         self._updateInnovation( 'InnZeroVelX', statusBytes[0:1] )
         self._updateInnovation( 'InnZeroVelX', statusBytes[0:1] )
-                
-    
-    def decodeStatus33(self,statusBytes):
-        # Zero velocity lever arm
-        self.status['ZeroVelLeverArmX'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * ZVPOS2M
-        self.status['ZeroVelLeverArmY'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * ZVPOS2M
-        self.status['ZeroVelLeverArmZ'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * ZVPOS2M
-        if statusBytes[6] > 0:
-            del self.status['ZeroVelLeverArmX']
-            del self.status['ZeroVelLeverArmY']
-            del self.status['ZeroVelLeverArmZ']       
-    
-        
-    def decodeStatus34(self,statusBytes):
-        # Zero velocity lever arm accuracy
-        self.status['ZeroVelLeverArmXAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * ZVPOSA2M
-        self.status['ZeroVelLeverArmYAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * ZVPOSA2M
-        self.status['ZeroVelLeverArmZAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * ZVPOSA2M
-        if statusBytes[6] > 0:
-            del self.status['ZeroVelLeverArmXAcc']
-            del self.status['ZeroVelLeverArmYAcc']
-            del self.status['ZeroVelLeverArmZAcc']       
-
-
-    def decodeStatus35(self,statusBytes):
-        # Advanced slip lever arm
-        self.status['NoSlipLeverArmX'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * NSPOS2M
-        self.status['NoSlipLeverArmY'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * NSPOS2M
-        self.status['NoSlipLeverArmZ'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * NSPOS2M
-        if statusBytes[6] > 0:
-            del self.status['NoSlipLeverArmX']
-            del self.status['NoSlipLeverArmY']
-            del self.status['NoSlipLeverArmZ']       
-
-
-    def decodeStatus36(self,statusBytes):
-        # Advanced slip lever arm accuracy
-        self.status['NoSlipLeverArmXAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * NSPOSA2M
-        self.status['NoSlipLeverArmYAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * NSPOSA2M
-        self.status['NoSlipLeverArmZAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * NSPOSA2M
-        if statusBytes[6] > 0:
-            del self.status['NoSlipLeverArmXAcc']
-            del self.status['NoSlipLeverArmYAcc']
-            del self.status['NoSlipLeverArmZAcc']       
-
-    def decodeStatus37(self,statusBytes):
-        # Heading misalignment angle and accuracy
-        self.status['HeadingMisAlign'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * ALIGN2RAD * RAD2DEG
-        self.status['HeadingMisAlignAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * ALIGNA2RAD * RAD2DEG
-        if statusBytes[6] > 0:
-            del self.status['HeadingMisAlign']
-            del self.status['HeadingMisAlignAcc']
-        
-        # NCOM manual version 180806 shows validity as not 0xF,
-        # but I assume this is incorrect. 0xFF used here
-        self.status['NumSatsUsedPos'] = statusBytes[4]
-        if statusBytes[4] == 0xFF: del self.status['NumSatsUsedPos']
-        
-        self.status['NumSatsUsedVel'] = statusBytes[5]
-        if statusBytes[5] == 0xFF: del self.status['NumSatsUsedVel']
-
-        self.status['NumSatsUsedAtt'] = statusBytes[7]
-        if statusBytes[7] == 0xFF: del self.status['NumSatsUsedAtt']
-
-
-    def decodeStatus38(self,statusBytes):
-        # Zero velocity option settings
-        self.status['OptionSZVDelay'] = statusBytes[0] * SZVDELAY2S
-        if statusBytes[0] == 0xFF: del self.status['OptionSZVDelay']
-        
-        self.status['OptionSZVPeriod'] = statusBytes[1] * SZVPERIOD2S
-        if statusBytes[1] == 0xFF: del self.status['OptionSZVPeriod']
-
-        self.status['OptionTopSpeed'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * TOPSPEED2MPS
-        if statusBytes[2:4] == b'\xFF\xFF': del self.status['OptionTopSpeed']
-        
-        self.status['OptionInitSpeed'] = statusBytes[4] * INITSPEED2MPS
-        if statusBytes[4] == 0xFF: del self.status['OptionInitSpeed']
-        
-        self.status['OptionSer3'] = statusBytes[5]
-        if statusBytes[5]&0x80 > 0: del self.status['OptionSer3']
-        
-    
-    def decodeStatus39(self,statusBytes):
-        # No slip option settings
-        self.status['OptionNSDelay'] = statusBytes[0] * NSDELAY2S
-        if statusBytes[0] == 0xFF: del self.status['OptionNSDelay']
-        
-        self.status['OptionNSPeriod'] = statusBytes[1] * NSPERIOD2S
-        if statusBytes[1] == 0xFF: del self.status['OptionNSPeriod']
-        
-        self.status['OptionNSAngleStd'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * ANGA2RAD * RAD2DEG
-        if statusBytes[2:4] == b'\xFF\xFF': del self.status['OptionNSAngleStd']
-        
-        self.status['OptionNSHAccel'] = statusBytes[4] * NSACCEL2MPS2
-        if statusBytes[4] == 0xFF: del self.status['OptionNSHAccel']
-        
-        self.status['OptionNSVAccel'] = statusBytes[5] * NSACCEL2MPS2
-        if statusBytes[5] == 0xFF: del self.status['OptionNSVAccel']
-
-        self.status['OptionNSSpeed'] = statusBytes[6] * NSSPEED2MPS
-        if statusBytes[6] == 0xFF: del self.status['OptionNSSpeed']
-
-        self.status['OptionNSRadius'] = statusBytes[7] * NSRADIUS2M
-        if statusBytes[7] == 0xFF: del self.status['OptionNSRadius']
-
-    # decodeStatus40: NCOM format encoder version: not decoded
-    
-    def decodeStatus41(self,statusBytes):
-        self.status['OptionSer1Baud'] = statusBytes[0] & 0xF
-        self.status['OptionSer2Baud'] = statusBytes[1] & 0xF
-        self.status['OptionSer3Baud'] = statusBytes[2] & 0xF
-        self.status['OptionCanBaud']  = statusBytes[3] & 0xF
-    
-    
-    def decodeStatus42(self,statusBytes):
-        # Heading lock options
-        self.status['OptionHLDelay'] = statusBytes[0] * HLDELAY2S
-        if statusBytes[0] == 0xFF: del self.status['OptionHLDelay']
-        
-        self.status['OptionHLPeriod'] = statusBytes[1] * HLPERIOD2S
-        if statusBytes[1] == 0xFF: del self.status['OptionHLPeriod']
-        
-        self.status['OptionHLAngleStd'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * ANGA2RAD * RAD2DEG
-        if statusBytes[2:4] == b'\xFF\xFF': del self.status['OptionHLAngleStd']
-        
-        self.status['OptionStatDelay'] = statusBytes[4] * STATDELAY2S
-        if statusBytes[4] == 0xFF: del self.status['OptionStartDelay']
-
-        self.status['OptionStatSpeed'] = statusBytes[5] * STATSPEED2MPS
-        if statusBytes[5] == 0xFF: del self.status['OptionStatSpeed']
-
-
-    def decodeStatus43(self,statusBytes):
-        # Trigger 1 event timing (rising edge triggers)
-        m = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True)
-        ms = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        us = statusBytes[6]
-        self.status['Trig1RisingTime'] = m * 60.0 + ms * 0.001 + us * FINETIME2SEC
-        if m == 0: del self.status['Trig1RisingTime']
-        
-        self.status['Trig1RisingCount'] = statusBytes[7]
-
-
-    def decodeStatus44(self,statusBytes):
-        # Wheel speed configuration
-        self.status['WSpeedScale'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False) * WSSF2PPM
-        if statusBytes[0:2] == b'\xFF\xFF': del self.status['WSpeedScale']
-
-        self.status['WSpeedScaleStd'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=False) * WSSFA2PC
-        if statusBytes[2:4] == b'\xFF\xFF': del self.status['WSpeedScaleStd']
-
-        self.status['OptionWSpeedDelay'] = statusBytes[4] * WSDELAY2S
-        if statusBytes[4] == 0xFF: del self.status['OptionWSpeedDelay']
-
-        self.status['OptionWSpeedZVDelay'] = statusBytes[5] * WSDELAY2S
-        if statusBytes[5] == 0xFF: del self.status['OptionWSpeedZVDelay']
-
-        self.status['OptionWSpeedNoiseStd'] = statusBytes[6] * WSNOISE2CNT
-        if statusBytes[6] == 0xFF: del self.status['OptionWSpeedNoiseStd']
 
 
     def decodeStatus45(self,statusBytes):
         # Wheel speed counts
         self.status['WSpeedCount'] = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=False)
         
-        try:
-            m = self.status['GpsMinutes'] # May be invalid, hence 'try'
-            s = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False) * 0.001
-            self.status['WSpeedTime'] = GPS_STARTTIME + \
-                datetime.timedelta( minutes=self.status['GpsMinutes'], seconds=self.nav['GpsSeconds'] )
-            if statusBytes[4:6] == b'\xFF\xFF': del self.status['WSpeedTime']
-        except:
-            pass
+        if statusBytes[4:6] == b'\xFF\xFF':
+            self.status.pop('WSpeedTime', None)
+        else:
+            try:
+                self.status['WSpeedTime'] = NcomTime( self.status['GpsMinutes'], self.nav['GpsSeconds'] )
+            except: # GpsMinutes or GpsSeconds may be invalid, hence 'try'
+                pass
         
-        self.status['WSpeedTimeUnchanged'] = statusBytes[6] * WSDELAY2S
-        if statusBytes[6] == 0xFF: del self.status['WSpeedTimeUnchanged']
+        if statusBytes[6] == 0xFF:
+            self.status.pop('WSpeedTimeUnchanged', None)
+        else:
+            self.status['WSpeedTimeUnchanged'] = statusBytes[6] * WSDELAY2S
         
         # todo: calculate tacho frequency - see OxTS NCom decoders
 
 
-    def decodeStatus46(self,statusBytes):
-        # Advanced whees speed lever arm
-        self.status['WSpeedLeverArmX'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * WSPOS2M
-        self.status['WSpeedLeverArmY'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * WSPOS2M
-        self.status['WSpeedLeverArmZ'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * WSPOS2M
-        if statusBytes[6] > 0:
-            del self.status['WSpeedLeverArmX']
-            del self.status['WSpeedLeverArmY']
-            del self.status['WSpeedLeverArmZ']       
-
-
-    def decodeStatus47(self,statusBytes):
-        # Advanced wheel speed lever arm accuracy
-        self.status['WSpeedLeverArmXAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * WSPOSA2M
-        self.status['WSpeedLeverArmYAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * WSPOSA2M
-        self.status['WSpeedLeverArmZAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * WSPOSA2M
-        if statusBytes[6] > 0:
-            del self.status['WSpeedLeverArmXAcc']
-            del self.status['WSpeedLeverArmYAcc']
-            del self.status['WSpeedLeverArmZAcc']       
-
-
-    def decodeStatus48(self,statusBytes):
-        # Undulation and dilution of precision of GPS
-        self.status['Undulation'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * UNDUL2M
-        if statusBytes[0:2] == b'\x00\x80': del self.status['Undulation']
-        
-        self.status['HDOP'] = statusBytes[2] * DOPFACTOR
-        if statusBytes[2] == 0xFF: del self.status['HDOP']
-        
-        self.status['PDOP'] = statusBytes[3] * DOPFACTOR
-        if statusBytes[3] == 0xFF: del self.status['PDOP']
-
-        if statusBytes[2] != 0xFF and statusBytes[3] == 0xFF:
-            x = max((self.status['PDOP']**2 - self.status['HDOP']**2,0.0))
-            self.status['VDOP'] = x**0.5
-        
-        self.status['DatumEllipsoid'] = statusBytes[6]
-        if statusBytes[6] == 0xFF: del self.status['DatumEllipsoid']
-        
-        self.status['DatumEarthFrame'] = statusBytes[7]
-        if statusBytes[7] == 0xFF: del self.status['DatumEarthFrame']
-
-
-    # todo: decodeStatus49: Omnistar
-    
-    
     def decodeStatus50(self,statusBytes):
         # Information sent to the command decoder (e.g. through UDP port 3001)
         self._updateLE16(int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False),'CmdChars')
@@ -1069,130 +930,6 @@ class NcomRx(object):
         self._updateLE16(int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False),'CmdCharsSkipped')
         self._updateLE16(int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False),'CmdErrors')
 
-    def decodeStatus51(self,statusBytes):
-        # Additional slip point 1
-        self.status['SlipPoint1X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint1Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint1Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint1X']
-            del self.status['SlipPoint1Y']
-            del self.status['SlipPoint1Z']       
-
-
-    def decodeStatus52(self,statusBytes):
-        # Additional slip point 2
-        self.status['SlipPoint2X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint2Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint2Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint2X']
-            del self.status['SlipPoint2Y']
-            del self.status['SlipPoint2Z']       
-
-
-    def decodeStatus53(self,statusBytes):
-        # Additional slip point 3
-        self.status['SlipPoint3X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint3Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint3Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint3X']
-            del self.status['SlipPoint3Y']
-            del self.status['SlipPoint3Z']       
-
-
-    def decodeStatus54(self,statusBytes):
-        # Additional slip point 4
-        self.status['SlipPoint4X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint4Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint4Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint4X']
-            del self.status['SlipPoint4Y']
-            del self.status['SlipPoint4Z']       
-
-    def decodeStatus55(self,statusBytes):
-        # Status information about primary GNSS receiver
-        self.status['GpsPrimaryAntStatus'] = statusBytes[0] & 0x03
-        if (statusBytes[0] & 0x03) == 0x03: del self.status['GpsPrimaryAntStatus']
-        
-        self.status['GpsPrimaryAntPower'] = (statusBytes[0] & 0x0C) >> 2
-        if (statusBytes[0] & 0x0C) == 0x0C: del self.status['GpsPrimaryAntPower']
-
-        self.status['GpsPrimaryCpuUsed'] = statusBytes[1]
-        if statusBytes[1] == 0xFF: del self.status['GpsPrimaryCpuUsed']
-
-        self.status['GpsPrimaryCoreNoise'] = statusBytes[2]
-        if statusBytes[2] == 0xFF: del self.status['GpsPrimaryCoreNoise']
-                
-        self.status['GpsPrimaryBaud'] = statusBytes[3]
-        if statusBytes[3] == 0xFF: del self.status['GpsPrimaryBaud']
-        
-        self.status['GpsPrimaryNumSats'] = statusBytes[4]
-        if statusBytes[4] == 0xFF: del self.status['GpsPrimaryNumSats']
-        
-        self.status['GpsPrimaryPosMode'] = statusBytes[5]
-        if statusBytes[5] == 0xFF: del self.status['GpsPrimaryPosMode']
-        
-        self.status['GpsPrimaryCoreTemp'] = statusBytes[6] + TEMPK_OFFSET + ABSZERO_TEMPC
-        if statusBytes[6] == 0xFF: del self.status['GpsPrimaryCoreTemp']
-        
-        self.status['GpsPrimarySupplyVolt'] = statusBytes[7] * SUPPLYV2V
-        if statusBytes[7] == 0xFF: del self.status['GpsPrimarySupplyVolt']
-
-
-    def decodeStatus56(self,statusBytes):
-        # Status information about secondary GNSS receiver
-        self.status['GpsSecondaryAntStatus'] = statusBytes[0] & 0x03
-        if (statusBytes[0] & 0x03) == 0x03: del self.status['GpsSecondaryAntStatus']
-        
-        self.status['GpsSecondaryAntPower'] = (statusBytes[0] & 0x0C) >> 2
-        if (statusBytes[0] & 0x0C) == 0x0C: del self.status['GpsSecondaryAntPower']
-
-        self.status['GpsSecondaryCpuUsed'] = statusBytes[1]
-        if statusBytes[1] == 0xFF: del self.status['GpsSecondaryCpuUsed']
-
-        self.status['GpsSecondaryCoreNoise'] = statusBytes[2]
-        if statusBytes[2] == 0xFF: del self.status['GpsSecondaryCoreNoise']
-                
-        self.status['GpsSecondaryBaud'] = statusBytes[3]
-        if statusBytes[3] == 0xFF: del self.status['GpsSecondaryBaud']
-        
-        self.status['GpsSecondaryNumSats'] = statusBytes[4]
-        if statusBytes[4] == 0xFF: del self.status['GpsSecondaryNumSats']
-        
-        self.status['GpsSecondaryPosMode'] = statusBytes[5]
-        if statusBytes[5] == 0xFF: del self.status['GpsSecondaryPosMode']
-        
-        self.status['GpsSecondaryCoreTemp'] = statusBytes[6] + TEMPK_OFFSET + ABSZERO_TEMPC
-        if statusBytes[6] == 0xFF: del self.status['GpsSecondaryCoreTemp']
-        
-        self.status['GpsSecondarySupplyVolt'] = statusBytes[7] * SUPPLYV2V
-        if statusBytes[7] == 0xFF: del self.status['GpsSecondarySupplyVolt']
-
-    def decodeStatus57(self,statusBytes):
-        # Position estimate of primary GPS antenna lever-arm (extended range)
-        sf = statusBytes[7]        
-        self.status['GAPx'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GPSPOS2M * sf
-        self.status['GAPy'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GPSPOS2M * sf
-        self.status['GAPz'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GPSPOS2M * sf
-        if statusBytes[6] > 150 or statusBytes[7] == 0:
-            del self.status['GAPx']
-            del self.status['GAPy']
-            del self.status['GAPz']       
-
-
-    def decodeStatus58(self,statusBytes):
-        # vehicle to output rotation - very rarely used and not in config software
-        self.status['OpHeading'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['OpPitch'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['OpRoll'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        if statusBytes[6] > 150:
-            del self.status['OpHeading']
-            del self.status['OpPitch']
-            del self.status['OpRoll']       
-
 
     def decodeStatus59(self,statusBytes):
         # IMU decoding status
@@ -1201,17 +938,6 @@ class NcomRx(object):
         self._updateLE8(statusBytes[3],'ImuErrorCount')
 
 
-    def decodeStatus60(self,statusBytes):
-        # Definition of the surface angles
-        self.status['Ned2SurfHeading'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['Ned2SurfPitch'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        self.status['Ned2SurfRoll'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * GPSATT2RAD * RAD2DEG
-        if statusBytes[6] > 150:
-            del self.status['Ned2SurfHeading']
-            del self.status['Ned2SurfPitch']
-            del self.status['Ned2SurfRoll']       
-
-
     def decodeStatus61(self,statusBytes):
         # Internal information about external GNSS receiver
         self._updateLE16(int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=False),'GpsExternalChars')
@@ -1220,112 +946,6 @@ class NcomRx(object):
         self._updateLE16(int.from_bytes(statusBytes[6:8], byteorder = 'little', signed=False),'GpsExternalOldPkts')
 
 
-    def decodeStatus62(self,statusBytes):
-        # Status information about external GNSS receiver
-        self.status['GpsExternalAntStatus'] = statusBytes[0] & 0x03
-        if (statusBytes[0] & 0x03) == 0x03: del self.status['GpsExternalAntStatus']
-        
-        self.status['GpsExternalAntPower'] = (statusBytes[0] & 0x0C) >> 2
-        if (statusBytes[0] & 0x0C) == 0x0C: del self.status['GpsExternalAntPower']
-
-        self.status['GpsExternalCpuUsed'] = statusBytes[1]
-        if statusBytes[1] == 0xFF: del self.status['GpsExternalCpuUsed']
-
-        self.status['GpsExternalCoreNoise'] = statusBytes[2]
-        if statusBytes[2] == 0xFF: del self.status['GpsExternalCoreNoise']
-                
-        self.status['GpsExternalBaud'] = statusBytes[3]
-        if statusBytes[3] == 0xFF: del self.status['GpsExternalBaud']
-        
-        self.status['GpsExternalNumSats'] = statusBytes[4]
-        if statusBytes[4] == 0xFF: del self.status['GpsExternalNumSats']
-        
-        self.status['GpsExternalPosMode'] = statusBytes[5]
-        if statusBytes[5] == 0xFF: del self.status['GpsExternalPosMode']
-        
-        self.status['GpsExternalCoreTemp'] = statusBytes[6] + TEMPK_OFFSET + ABSZERO_TEMPC
-        if statusBytes[6] == 0xFF: del self.status['GpsExternalCoreTemp']
-        
-        self.status['GpsExternalSupplyVolt'] = statusBytes[7] * SUPPLYV2V
-        if statusBytes[7] == 0xFF: del self.status['GpsExternalSupplyVolt']
-
-    # decodeStatus63: todo: angular acceleration low-pass filter
-
-    def decodeStatus64(self,statusBytes):
-        # Hardware information and GPS receiver configurations
-        self.status['CpuPcbType'] = statusBytes[0]
-        if statusBytes[0] == 0xFF: del self.status['CpuPcbType']
-
-        self.status['GpsSetType'] = statusBytes[1]
-        if statusBytes[1] == 0xFF: del self.status['GpsSetType']
-
-        self.status['GpsSetFormat'] = statusBytes[2]
-        if statusBytes[2] == 0xFF: del self.status['GpsSetFormat']
-        
-        self.status['DualPortRamStatus'] = statusBytes[3]
-        if statusBytes[3] == 0xFF: del self.status['DualPortRamStatus']
-        
-        self.status['GpsPrimarySetPosRate'] = statusBytes[4] & 0x0F
-        if statusBytes[4]&0x0F == 0x0F: del self.status['GpsPrimarySetPosRate']
-        
-        self.status['GpsPrimarySetVelRate'] = (statusBytes[4]>>4) & 0x0F
-        if (statusBytes[4]>>4)&0x0F == 0x0F: del self.status['GpsPrimarySetVelRate']
-
-        self.status['GpsPrimarySetRawRate'] = statusBytes[5] & 0x0F
-        if statusBytes[5]&0x0F == 0x0F: del self.status['GpsPrimarySetRawRate']
-
-        self.status['GpsSecondarySetRawRate'] = (statusBytes[5]>>4) & 0x0F
-        if (statusBytes[5]>>4)&0x0F == 0x0F: del self.status['GpsSecondarySetRawRate']
-
-        gf = ~statusBytes[6]
-        self.status['GnssGlonassEnabled'] = (gf & 0x01) > 0
-        self.status['GnssGalileoEnabled'] = (gf & 0x02) > 0
-        self.status['GnssRawRngEnabled'] = (gf & 0x04) > 0
-        self.status['GnssRawDopEnabled']  = (gf & 0x08) > 0
-        self.status['GnssRawL1Enabled']  = (gf & 0x10) > 0
-        self.status['GnssRawL2Enabled']  = (gf & 0x20) > 0
-        self.status['GnssRawL5Enabled']  = (gf & 0x40) > 0
-        if (gf & 0x80) == 0:
-            del self.status['GnssGlonassEnabled']
-            del self.status['GnssGalileoEnabled']
-            del self.status['GnssRawRngEnabled']
-            del self.status['GnssRawDopEnabled']
-            del self.status['GnssRawL1Enabled']
-            del self.status['GnssRawL2Enabled']
-            del self.status['GnssRawL5Enabled']
-
-
-    def decodeStatus65(self,statusBytes):
-        # Camera 1 out event timing
-        m = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True)
-        ms = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        us = statusBytes[6]
-        self.status['Digital1OutTime'] = m * 60.0 + ms * 0.001 + us * FINETIME2SEC
-        if m == 0: del self.status['Digital1OutTime']
-        
-        self.status['Digital1OutCount'] = statusBytes[7]
-
-
-    def decodeStatus66(self,statusBytes):
-        # Extended local co-ordinate/reference frame for latitude and longitude
-        self.status['RefFrameLat'] = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True) * FINEANG2RAD * RAD2DEG
-        if statusBytes[0:4] == b'\x00\x00\x00\x80': del self.status['RefFrameLat']
-        
-        self.status['RefFrameLon'] = int.from_bytes(statusBytes[4:8], byteorder = 'little', signed=True) * FINEANG2RAD * RAD2DEG
-        if statusBytes[4:8] == b'\x00\x00\x00\x80': del self.status['RefFrameLon']
-        self.computeRefFrame()
-
-
-    def decodeStatus67(self,statusBytes):
-        # Extended local co-ordinate/reference frame for altitude and heading
-        self.status['RefFrameAlt'] = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True) * ALT2M
-        if statusBytes[0:4] == b'\x00\x00\x00\x80': del self.status['RefFrameAlt']
-        
-        self.status['RefFrameHeading'] = int.from_bytes(statusBytes[4:8], byteorder = 'little', signed=True) * FINEANG2RAD * RAD2DEG
-        if statusBytes[4:8] == b'\x00\x00\x00\x80': del self.status['RefFrameHeading']
-        self.computeRefFrame()
-
-
     def computeRefFrame(self):
         # Compute reference frame if all the information needed is available
         # Note that, if the reference frame changes then there will be a glitch
@@ -1359,104 +979,387 @@ class NcomRx(object):
             except:
                 pass
 
-    def decodeStatus68(self,statusBytes):
-        # Additional slip point 5
-        self.status['SlipPoint5X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint5Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint5Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint5X']
-            del self.status['SlipPoint5Y']
-            del self.status['SlipPoint5Z']       
-
-
-    def decodeStatus69(self,statusBytes):
-        # Additional slip point 6
-        self.status['SlipPoint6X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint6Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint6Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint6X']
-            del self.status['SlipPoint6Y']
-            del self.status['SlipPoint6Z']       
-
-
-    def decodeStatus70(self,statusBytes):
-        # Additional slip point 7
-        self.status['SlipPoint7X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint7Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint7Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint7X']
-            del self.status['SlipPoint7Y']
-            del self.status['SlipPoint7Z']       
-
-
-    def decodeStatus71(self,statusBytes):
-        # Additional slip point 8
-        self.status['SlipPoint8X'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint8Y'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * SP2M
-        self.status['SlipPoint8Z'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * SP2M
-        if statusBytes[6] > 0:
-            del self.status['SlipPoint8X']
-            del self.status['SlipPoint8Y']
-            del self.status['SlipPoint8Z']       
-
-
-    def decodeStatus72(self,statusBytes):
-        # Accelerometer scale factor
-        self.status['AxSf'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * ASFACTOR
-        self.status['AySf'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * ASFACTOR
-        self.status['AzSf'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * ASFACTOR
-        if statusBytes[6] > 150:
-            del self.status['AxSf']
-            del self.status['AySf']
-            del self.status['AzSf']       
-
-
-    def decodeStatus73(self,statusBytes):
-        # Accelerometer scale factor accuracy
-        self.status['AxSfAcc'] = int.from_bytes(statusBytes[0:2], byteorder = 'little', signed=True) * ASAFACTOR
-        self.status['AySfAcc'] = int.from_bytes(statusBytes[2:4], byteorder = 'little', signed=True) * ASAFACTOR
-        self.status['AzSfAcc'] = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=True) * ASAFACTOR
-        if statusBytes[6] > 150:
-            del self.status['AxSfAcc']
-            del self.status['AySfAcc']
-            del self.status['AzSfAcc']       
-
-    # decodeStatus74 todo: low pass filter for accelerometers
-
-
-    def decodeStatus79(self,statusBytes):
-        # Trigger 1 output event timings (falling edge triggers)
-        m = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True)
-        ms = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        us = statusBytes[6]
-        self.status['Trig2FallingTime'] = m * 60.0 + ms * 0.001 + us * FINETIME2SEC
-        if m == 0: del self.status['Trig2FallingTime']
-        
-        self.status['Trig2FallingCount'] = statusBytes[7]
-
 
-    def decodeStatus80(self,statusBytes):
-        # Trigger 2 output event timing (rising edge triggers)
-        m = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True)
-        ms = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        us = statusBytes[6]
-        self.status['Trig2RisingTime'] = m * 60.0 + ms * 0.001 + us * FINETIME2SEC
-        if m == 0: del self.status['Trig2RisingTime']
-        
-        self.status['Trig2RisingCount'] = statusBytes[7]
+    def _computeVdop(self):
+        # Vertical dilution of precision, computed after status channel 48
+        if 'HDOP' in self.status and 'PDOP' in self.status:
+            x = max((self.status['PDOP']**2 - self.status['HDOP']**2,0.0))
+            self.status['VDOP'] = x**0.5
+        else:
+            self.status.pop('VDOP', None)
 
 
-    def decodeStatus81(self,statusBytes):
-        # Camera 2 out event timing
-        m = int.from_bytes(statusBytes[0:4], byteorder = 'little', signed=True)
-        ms = int.from_bytes(statusBytes[4:6], byteorder = 'little', signed=False)
-        us = statusBytes[6]
-        self.status['Digital2OutTime'] = m * 60.0 + ms * 0.001 + us * FINETIME2SEC
-        if m == 0: del self.status['Digital2OutTime']
-        
-        self.status['Digital2OutCount'] = statusBytes[7]
+    @classmethod
+    def _buildStatusDecoders(cls):
+        # Builds the 256 entry dispatch list, cls.statusDecoders, from
+        # STATUS_CHANNELS and any decodeStatusN methods. Each entry is
+        # None or a function f(self, statusBytes)
+        decoders = [None] * 256
+        for channel, fields in STATUS_CHANNELS.items():
+            decoders[channel] = _compileStatus(channel, fields, STATUS_HOOKS.get(channel))
+        for name in dir(cls):
+            if name.startswith('decodeStatus') and name[12:].isdigit():
+                decoders[int(name[12:])] = getattr(cls, name)
+        cls.statusDecoders = decoders
 
 
+########################################################################
+# Status channel table
+#
+# Each status channel is a tuple of StatusField:
+#   name    - key in the status dictionary
+#   start,
+#   end     - bytes of the 8 status bytes, b[start:end]
+#   kind    - 'u' unsigned integer, 'i' signed integer, 's' utf-8 string
+#   scale   - factors applied in turn (a string is used as an
+#             expression, e.g. 'b[7]')
+#   add     - offsets added in turn after scaling
+#   invalid - expression that is true when the measurement is invalid.
+#             b is the status bytes and v is the unscaled value
+#   expr    - expression for the unscaled value, used instead of
+#             start/end/kind for measurements that are not a simple
+#             integer (e.g. bit fields)
+#   fmt     - format string applied to the value
+#
+# Invalid measurements are removed from status (so old values do not
+# linger). The table is compiled into one function per channel the
+# first time an NcomRx (or subclass) is created.
+
+StatusField = collections.namedtuple('StatusField',
+    ['name', 'start', 'end', 'kind', 'scale', 'add', 'invalid', 'expr', 'fmt'],
+    defaults=[0, 0, 'u', (), (), None, None, None])
+F = StatusField # Shorter, for the table
+
+AGE150 = 'b[6] > 150'   # Age of Kalman filter estimates
+AGE0 = 'b[6] > 0'       # Validity of configuration settings
+
+
+def _upTime(b):
+    # System up time, which is compressed into 16-bits
+    x = int.from_bytes(b[2:4], byteorder = 'little', signed=False)
+    if x > 20700: return (x-20532)*3600
+    elif x < 10800: return x
+    else: return (x-10620)*60
+
+
+def _eventTime(b):
+    # Time of trigger and camera events
+    m = int.from_bytes(b[0:4], byteorder = 'little', signed=True)
+    ms = int.from_bytes(b[4:6], byteorder = 'little', signed=False)
+    return m * 60.0 + ms * 0.001 + b[6] * FINETIME2SEC
+
+
+def _slipPoint(n):
+    # Additional slip point lever arms (channels 51-54, 68-71)
+    return (
+        F('SlipPoint%dX' % n, 0, 2, 'i', (SP2M,), invalid=AGE0),
+        F('SlipPoint%dY' % n, 2, 4, 'i', (SP2M,), invalid=AGE0),
+        F('SlipPoint%dZ' % n, 4, 6, 'i', (SP2M,), invalid=AGE0),
+        )
+
+
+def _gnssReceiver(r):
+    # Status information about a GNSS receiver (channels 55, 56, 62)
+    return (
+        F('Gps%sAntStatus' % r, expr='b[0] & 0x03', invalid='v == 0x03'),
+        F('Gps%sAntPower' % r, expr='(b[0] & 0x0C) >> 2', invalid='v == 0x03'),
+        F('Gps%sCpuUsed' % r, 1, 2, invalid='v == 0xFF'),
+        F('Gps%sCoreNoise' % r, 2, 3, invalid='v == 0xFF'),
+        F('Gps%sBaud' % r, 3, 4, invalid='v == 0xFF'),
+        F('Gps%sNumSats' % r, 4, 5, invalid='v == 0xFF'),
+        F('Gps%sPosMode' % r, 5, 6, invalid='v == 0xFF'),
+        F('Gps%sCoreTemp' % r, 6, 7, add=(TEMPK_OFFSET, ABSZERO_TEMPC), invalid='v == 0xFF'),
+        F('Gps%sSupplyVolt' % r, 7, 8, scale=(SUPPLYV2V,), invalid='v == 0xFF'),
+        )
+
+
+def _event(time, count):
+    # Trigger and camera event timing
+    return (
+        F(time, expr='_eventTime(b)', invalid='not any(b[0:4])'),
+        F(count, 7, 8),
+        )
+
+
+def _triple(names, kind, scale, invalid=AGE150):
+    # Three 16-bit measurements in bytes 0-5, e.g. an x, y, z estimate
+    return tuple(F(name, 2*i, 2*i+2, kind, scale, invalid=invalid)
+                 for i, name in enumerate(names))
+
+
+STATUS_CHANNELS = {
+    # Full time, number of satellites, position mode, velocity mode, dual antenna mode
+    # 'Gps' not 'Gnss' used for historical reasons
+    0: (F('GpsMinutes', 0, 4, invalid='v < 1000'),
+        F('GpsNumObs', 4, 5, invalid='v == 255'),
+        F('GpsPosMode', 5, 6, invalid='v == 255'),
+        F('GpsVelMode', 6, 7, invalid='v == 255'),
+        F('GpsAttMode', 7, 8, invalid='v == 255')),
+    # Position accuracy, ABD robot UMAC interface status byte
+    3: _triple(('NorthAcc', 'EastAcc', 'AltAcc'), 'u', (POSA2M,))
+        + (F('UmacStatus', 7, 8, invalid='v == 0xFF'),),
+    # Velocity accuracy, processing method used by blended
+    4: _triple(('VnAcc', 'VeAcc', 'VdAcc'), 'u', (VELA2MPS,))
+        + (F('BlendedMethod', 7, 8, invalid='v == 0'),),
+    # Orientation accuracy
+    5: _triple(('HeadingAcc', 'PitchAcc', 'RollAcc'), 'u', (ANGA2RAD, RAD2DEG)),
+    # Gyro bias
+    6: _triple(('WxBias', 'WyBias', 'WzBias'), 'i', (GB2RPS, RAD2DEG)),
+    # Accelerometer bias
+    7: _triple(('AxBias', 'AyBias', 'AzBias'), 'i', (AB2MPS2,)),
+    # Gyro scale factor
+    8: _triple(('WxSf', 'WySf', 'WzSf'), 'i', (GSFACTOR,)),
+    # Gyro bias accuracy
+    9: _triple(('WxBiasAcc', 'WyBiasAcc', 'WzBiasAcc'), 'u', (GBA2RPS, RAD2DEG)),
+    # Accelerometer bias accuracy
+    10: _triple(('AxBiasAcc', 'AyBiasAcc', 'AzBiasAcc'), 'u', (ABA2MPS2,)),
+    # Gyro scale factor accuracy
+    11: _triple(('WxSfAcc', 'WySfAcc', 'WzSfAcc'), 'u', (GSAFACTOR,)),
+    # Position estimate of primary GPS antenna lever-arm
+    12: _triple(('GAPx', 'GAPy', 'GAPz'), 'i', (GPSPOS2M,)),
+    # Orientation estimate of dual antenna systems
+    13: (F('AtH', 0, 2, 'i', (GPSATT2RAD, RAD2DEG), invalid=AGE150),
+         F('AtP', 2, 4, 'i', (GPSATT2RAD, RAD2DEG), invalid=AGE150),
+         F('BaseLineLength', 4, 6, 'u', (GPSPOS2M,), invalid=AGE150)),
+    # Position estimate of primary GPS antenna lever-arm accuracy
+    14: _triple(('GAPxAcc', 'GAPyAcc', 'GAPzAcc'), 'u', (GPSPOSA2M,)),
+    # Orientation estimate of dual antenna systems accuracy
+    15: (F('AtHAcc', 0, 2, 'u', (GPSATTA2RAD, RAD2DEG), invalid=AGE150),
+         F('AtPAcc', 2, 4, 'u', (GPSATTA2RAD, RAD2DEG), invalid=AGE150),
+         F('BaseLineLengthAcc', 4, 6, 'u', (GPSPOSA2M,), invalid=AGE150)),
+    # RT to vehicle rotation, UTC offset
+    16: _triple(('VehHeading', 'VehPitch', 'VehRoll'), 'i', (GPSATT2RAD, RAD2DEG))
+        + (F('TimeUtcOffset', expr="int.from_bytes(b[7:8], byteorder = 'little', signed=True) >> 1",
+             invalid='not b[7] & 0x1'),),
+    # Software version running on the RT
+    19: (F('DevId', 0, 8, 's'),),
+    # Differential corrections configuration
+    20: (F('GpsDiffAge', 0, 2, 'i', (DIFFAGE2SEC,)),
+         F('BaseStationId', 2, 6, 's', invalid='b[2] == 0')),
+    # Disk space and size of current internal log file
+    21: (F('DiskSpace', 0, 4),
+         F('FileSize', 4, 8)),
+    # Internal information on timing of real-time processing
+    22: (F('TimeMismatch', 0, 2, invalid='v == 65535'),
+         F('ImuTimeDiff', 2, 3, invalid='v == 255'),
+         F('ImuTimeMargin', 3, 4, invalid='v == 255'),
+         F('ImuLoopTime', 4, 6, invalid='v == 65535'),
+         F('OpLoopTime', 6, 8, invalid='v == 65535')),
+    # System up time and consecutive GPS rejections
+    23: (F('BnsLag', 0, 2, invalid='v == 65535'),
+         F('UpTime', expr='_upTime(b)'),
+         F('GpsPosReject', 4, 5, invalid='v == 255'),
+         F('GpsVelReject', 5, 6, invalid='v == 255'),
+         F('GpsAttReject', 6, 7, invalid='v == 255')),
+    # Trigger 1 event timings (falling edge triggers)
+    24: _event('Trig1FallingTime', 'Trig1FallingCount'),
+    # 25 not decoded: reserved
+    # Status 25 used by older OxTS systems and unlikely to be output
+    # by any firmware after 2010. Status 66/67 used now.
+    # Remote lever-arm
+    26: _triple(('RemoveLeverArmX', 'RemoveLeverArmY', 'RemoveLeverArmZ'), 'i', (OUTPOS2M,), AGE0),
+    # Internal information about dual antenna ambiguity search
+    27: (F('HeadQuality', 0, 1),
+         F('HeadSearchType', 1, 2),
+         F('HeadSearchStatus', 2, 3),
+         F('HeadSearchReady', 3, 4),
+         F('HeadSearchInit', 4, 6, invalid='v == 0xFFFF'),
+         F('HeadSearchNum', 6, 8, invalid='v == 0xFFFF')),
+    # Details on initial settings for heading ambiguity search
+    28: (F('HeadSearchMaster', 0, 1, add=(1,)),
+         F('HeadSearchSlave1', 1, 2, add=(1,)),
+         F('HeadSearchSlave2', 2, 3, add=(1,)),
+         F('HeadSearchSlave3', 3, 4, add=(1,)),
+         F('HeadSearchTime', 4, 6),
+         F('HeadSearchConstr', 6, 8)),
+    # Details on the initial settings
+    29: (F('OptionLevel', 0, 1, invalid='v & 0x80'),
+         F('OptionVibration', 1, 2, invalid='v & 0x80'),
+         F('OptionGpsAcc', 2, 3, invalid='v & 0x80'),
+         F('OptionUpd', 3, 4, invalid='v & 0x80'),
+         F('OptionsSer1', 4, 5, invalid='v & 0x80'),
+         F('OptionsSer2', 5, 6, invalid='v & 0x80'),
+         F('OptionHeading', 6, 7, invalid='v & 0x80'),
+         F('OptionHeave', 7, 8, invalid='v & 0x80')),
+    # Operating system and script version information
+    30: (F('OsVersion1', 0, 1, invalid='v == 0xFF'),
+         F('OsVersion2', 1, 2, invalid='v == 0xFF'),
+         F('OsVersion3', 2, 3, invalid='v == 0xFF'),
+         F('OsScriptId', 3, 6, 'i', invalid='v < 0', fmt='%06d'),
+         F('SerialNumber', 6, 8)), # Not going to invalidate this one 0xFFFF is invalid
+    # Hardware configuration information
+    31: (F('ImuType', 0, 1, invalid='v == 0xFF'),
+         F('GpsPrimary', 1, 2, invalid='v == 0xFF'),
+         F('GpsSecondary', 2, 3, invalid='v == 0xFF'),
+         F('InterPcbType', 3, 4, invalid='v == 0xFF'),
+         F('FrontPcbType', 4, 5, invalid='v == 0xFF'),
+         F('InterSwId', 5, 6, invalid='v == 0xFF'),
+         F('HwConfig', 6, 7, invalid='v == 0xFF'),
+         F('PsrDiffEnabled', expr='not b[7] & 0x01', invalid='b[7] & 0x80'),
+         F('SBASEnabled', expr='not b[7] & 0x02', invalid='b[7] & 0x80'),
+         F('OmniVBSEnabled', expr='not b[7] & 0x08', invalid='b[7] & 0x80'),
+         F('OmniHpEnabled', expr='not b[7] & 0x10', invalid='b[7] & 0x80'),
+         F('L1DiffEnabled', expr='not b[7] & 0x20', invalid='b[7] & 0x80'),
+         F('L2DiffEnabled', expr='not b[7] & 0x40', invalid='b[7] & 0x80')),
+    # Zero velocity lever arm
+    33: _triple(('ZeroVelLeverArmX', 'ZeroVelLeverArmY', 'ZeroVelLeverArmZ'), 'i', (ZVPOS2M,), AGE0),
+    # Zero velocity lever arm accuracy
+    34: _triple(('ZeroVelLeverArmXAcc', 'ZeroVelLeverArmYAcc', 'ZeroVelLeverArmZAcc'), 'i', (ZVPOSA2M,), AGE0),
+    # Advanced slip lever arm
+    35: _triple(('NoSlipLeverArmX', 'NoSlipLeverArmY', 'NoSlipLeverArmZ'), 'i', (NSPOS2M,), AGE0),
+    # Advanced slip lever arm accuracy
+    36: _triple(('NoSlipLeverArmXAcc', 'NoSlipLeverArmYAcc', 'NoSlipLeverArmZAcc'), 'i', (NSPOSA2M,), AGE0),
+    # Heading misalignment angle and accuracy
+    # NCOM manual version 180806 shows validity of the number of
+    # satellites as not 0xF, but I assume this is incorrect. 0xFF used here
+    37: (F('HeadingMisAlign', 0, 2, 'i', (ALIGN2RAD, RAD2DEG), invalid=AGE0),
+         F('HeadingMisAlignAcc', 2, 4, 'u', (ALIGNA2RAD, RAD2DEG), invalid=AGE0),
+         F('NumSatsUsedPos', 4, 5, invalid='v == 0xFF'),
+         F('NumSatsUsedVel', 5, 6, invalid='v == 0xFF'),
+         F('NumSatsUsedAtt', 7, 8, invalid='v == 0xFF')),
+    # Zero velocity option settings
+    38: (F('OptionSZVDelay', 0, 1, scale=(SZVDELAY2S,), invalid='v == 0xFF'),
+         F('OptionSZVPeriod', 1, 2, scale=(SZVPERIOD2S,), invalid='v == 0xFF'),
+         F('OptionTopSpeed', 2, 4, scale=(TOPSPEED2MPS,), invalid='v == 0xFFFF'),
+         F('OptionInitSpeed', 4, 5, scale=(INITSPEED2MPS,), invalid='v == 0xFF'),
+         F('OptionSer3', 5, 6, invalid='v & 0x80')),
+    # No slip option settings
+    39: (F('OptionNSDelay', 0, 1, scale=(NSDELAY2S,), invalid='v == 0xFF'),
+         F('OptionNSPeriod', 1, 2, scale=(NSPERIOD2S,), invalid='v == 0xFF'),
+         F('OptionNSAngleStd', 2, 4, scale=(ANGA2RAD, RAD2DEG), invalid='v == 0xFFFF'),
+         F('OptionNSHAccel', 4, 5, scale=(NSACCEL2MPS2,), invalid='v == 0xFF'),
+         F('OptionNSVAccel', 5, 6, scale=(NSACCEL2MPS2,), invalid='v == 0xFF'),
+         F('OptionNSSpeed', 6, 7, scale=(NSSPEED2MPS,), invalid='v == 0xFF'),
+         F('OptionNSRadius', 7, 8, scale=(NSRADIUS2M,), invalid='v == 0xFF')),
+    # 40: NCOM format encoder version: not decoded
+    # Serial port baud rates
+    41: (F('OptionSer1Baud', expr='b[0] & 0xF'),
+         F('OptionSer2Baud', expr='b[1] & 0xF'),
+         F('OptionSer3Baud', expr='b[2] & 0xF'),
+         F('OptionCanBaud', expr='b[3] & 0xF')),
+    # Heading lock options
+    42: (F('OptionHLDelay', 0, 1, scale=(HLDELAY2S,), invalid='v == 0xFF'),
+         F('OptionHLPeriod', 1, 2, scale=(HLPERIOD2S,), invalid='v == 0xFF'),
+         F('OptionHLAngleStd', 2, 4, scale=(ANGA2RAD, RAD2DEG), invalid='v == 0xFFFF'),
+         F('OptionStatDelay', 4, 5, scale=(STATDELAY2S,), invalid='v == 0xFF'),
+         F('OptionStatSpeed', 5, 6, scale=(STATSPEED2MPS,), invalid='v == 0xFF')),
+    # Trigger 1 event timing (rising edge triggers)
+    43: _event('Trig1RisingTime', 'Trig1RisingCount'),
+    # Wheel speed configuration
+    44: (F('WSpeedScale', 0, 2, scale=(WSSF2PPM,), invalid='v == 0xFFFF'),
+         F('WSpeedScaleStd', 2, 4, scale=(WSSFA2PC,), invalid='v == 0xFFFF'),
+         F('OptionWSpeedDelay', 4, 5, scale=(WSDELAY2S,), invalid='v == 0xFF'),
+         F('OptionWSpeedZVDelay', 5, 6, scale=(WSDELAY2S,), invalid='v == 0xFF'),
+         F('OptionWSpeedNoiseStd', 6, 7, scale=(WSNOISE2CNT,), invalid='v == 0xFF')),
+    # Advanced wheel speed lever arm
+    46: _triple(('WSpeedLeverArmX', 'WSpeedLeverArmY', 'WSpeedLeverArmZ'), 'i', (WSPOS2M,), AGE0),
+    # Advanced wheel speed lever arm accuracy
+    47: _triple(('WSpeedLeverArmXAcc', 'WSpeedLeverArmYAcc', 'WSpeedLeverArmZAcc'), 'i', (WSPOSA2M,), AGE0),
+    # Undulation and dilution of precision of GPS (VDOP is computed by a hook)
+    48: (F('Undulation', 0, 2, 'i', (UNDUL2M,), invalid='v == -0x8000'),
+         F('HDOP', 2, 3, scale=(DOPFACTOR,), invalid='v == 0xFF'),
+         F('PDOP', 3, 4, scale=(DOPFACTOR,), invalid='v == 0xFF'),
+         F('DatumEllipsoid', 6, 7, invalid='v == 0xFF'),
+         F('DatumEarthFrame', 7, 8, invalid='v == 0xFF')),
+    # todo: 49: Omnistar
+    # Additional slip points 1 to 4
+    51: _slipPoint(1),
+    52: _slipPoint(2),
+    53: _slipPoint(3),
+    54: _slipPoint(4),
+    # Status information about primary GNSS receiver
+    55: _gnssReceiver('Primary'),
+    # Status information about secondary GNSS receiver
+    56: _gnssReceiver('Secondary'),
+    # Position estimate of primary GPS antenna lever-arm (extended range)
+    57: _triple(('GAPx', 'GAPy', 'GAPz'), 'i', (GPSPOS2M, 'b[7]'), 'b[6] > 150 or b[7] == 0'),
+    # Vehicle to output rotation - very rarely used and not in config software
+    58: _triple(('OpHeading', 'OpPitch', 'OpRoll'), 'i', (GPSATT2RAD, RAD2DEG)),
+    # Definition of the surface angles
+    60: _triple(('Ned2SurfHeading', 'Ned2SurfPitch', 'Ned2SurfRoll'), 'i', (GPSATT2RAD, RAD2DEG)),
+    # Status information about external GNSS receiver
+    62: _gnssReceiver('External'),
+    # 63: todo: angular acceleration low-pass filter
+    # Hardware information and GPS receiver configurations
+    64: (F('CpuPcbType', 0, 1, invalid='v == 0xFF'),
+         F('GpsSetType', 1, 2, invalid='v == 0xFF'),
+         F('GpsSetFormat', 2, 3, invalid='v == 0xFF'),
+         F('DualPortRamStatus', 3, 4, invalid='v == 0xFF'),
+         F('GpsPrimarySetPosRate', expr='b[4] & 0x0F', invalid='v == 0x0F'),
+         F('GpsPrimarySetVelRate', expr='(b[4]>>4) & 0x0F', invalid='v == 0x0F'),
+         F('GpsPrimarySetRawRate', expr='b[5] & 0x0F', invalid='v == 0x0F'),
+         F('GpsSecondarySetRawRate', expr='(b[5]>>4) & 0x0F', invalid='v == 0x0F'),
+         F('GnssGlonassEnabled', expr='not b[6] & 0x01', invalid='b[6] & 0x80'),
+         F('GnssGalileoEnabled', expr='not b[6] & 0x02', invalid='b[6] & 0x80'),
+         F('GnssRawRngEnabled', expr='not b[6] & 0x04', invalid='b[6] & 0x80'),
+         F('GnssRawDopEnabled', expr='not b[6] & 0x08', invalid='b[6] & 0x80'),
+         F('GnssRawL1Enabled', expr='not b[6] & 0x10', invalid='b[6] & 0x80'),
+         F('GnssRawL2Enabled', expr='not b[6] & 0x20', invalid='b[6] & 0x80'),
+         F('GnssRawL5Enabled', expr='not b[6] & 0x40', invalid='b[6] & 0x80')),
+    # Camera 1 out event timing
+    65: _event('Digital1OutTime', 'Digital1OutCount'),
+    # Extended local co-ordinate/reference frame for latitude and longitude
+    66: (F('RefFrameLat', 0, 4, 'i', (FINEANG2RAD, RAD2DEG), invalid='v == -0x80000000'),
+         F('RefFrameLon', 4, 8, 'i', (FINEANG2RAD, RAD2DEG), invalid='v == -0x80000000')),
+    # Extended local co-ordinate/reference frame for altitude and heading
+    67: (F('RefFrameAlt', 0, 4, 'i', (ALT2M,), invalid='v == -0x80000000'),
+         F('RefFrameHeading', 4, 8, 'i', (FINEANG2RAD, RAD2DEG), invalid='v == -0x80000000')),
+    # Additional slip points 5 to 8
+    68: _slipPoint(5),
+    69: _slipPoint(6),
+    70: _slipPoint(7),
+    71: _slipPoint(8),
+    # Accelerometer scale factor
+    72: _triple(('AxSf', 'AySf', 'AzSf'), 'i', (ASFACTOR,)),
+    # Accelerometer scale factor accuracy
+    73: _triple(('AxSfAcc', 'AySfAcc', 'AzSfAcc'), 'i', (ASAFACTOR,)),
+    # 74: todo: low pass filter for accelerometers
+    # Trigger 2 event timings (falling and rising edge triggers)
+    79: _event('Trig2FallingTime', 'Trig2FallingCount'),
+    80: _event('Trig2RisingTime', 'Trig2RisingCount'),
+    # Camera 2 out event timing
+    81: _event('Digital2OutTime', 'Digital2OutCount'),
+    }
+
+# Methods called after the table fields of a channel have been decoded
+STATUS_HOOKS = {
+    48: '_computeVdop',
+    66: 'computeRefFrame',
+    67: 'computeRefFrame',
+    }
+
+
+def _compileStatus(channel, fields, hook=None):
+    # Compiles the fields of a status channel into a function
+    # f(self, statusBytes) that updates self.status
+    lines = ['def decodeStatus%d(self, b):' % channel,
+             '    status = self.status']
+    for f in fields:
+        if f.expr is not None:
+            value = f.expr
+        elif f.kind == 's':
+            value = "b[%d:%d].decode('utf-8')" % (f.start, f.end)
+        elif f.kind == 'u' and f.end - f.start == 1:
+            value = 'b[%d]' % f.start
+        else:
+            value = "int.from_bytes(b[%d:%d], byteorder = 'little', signed=%r)" % (f.start, f.end, f.kind == 'i')
+        result = 'v'
+        for s in f.scale:
+            result += ' * ' + (s if isinstance(s, str) else repr(s))
+        for a in f.add:
+            result += ' + ' + repr(a)
+        if f.fmt is not None:
+            result = '%r %% (%s)' % (f.fmt, result)
+        lines.append('    v = ' + value)
+        if f.invalid is None:
+            lines.append('    status[%r] = %s' % (f.name, result))
+        else:
+            lines.append('    if %s:' % f.invalid)
+            lines.append('        status.pop(%r, None)' % f.name)
+            lines.append('    else:')
+            lines.append('        status[%r] = %s' % (f.name, result))
+    if hook is not None:
+        lines.append('    self.%s()' % hook)
+    namespace = {}
+    exec('\n'.join(lines) + '\n', globals(), namespace)
+    return namespace['decodeStatus%d' % channel]
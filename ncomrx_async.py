@@ -0,0 +1,105 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+ncomrx_async.py
+
+asyncio version of ncomrx_thread: receives data from OxTS INSs (on
+port 3000) with an asyncio.DatagramProtocol, on the event loop rather
+than in threads. Each IP address is sent to a separate NcomRx decoder.
+
+Use by (from a coroutine on the event loop):
+
+nrxs = await ncomrx_async.start()
+
+nrxs.nrx['<ip>']['decoder'] will be an NcomRx class that can be used
+to access the decoded data, as for NcomRxThread. Call nrxs.stop() to
+end.
+
+Datagrams are decoded as they arrive. Repeated datagrams are found in
+the same way as NcomRxThread (see ncomrx_thread.DuplicateFilter).
+"""
+
+import time
+import socket
+import asyncio
+
+import ncomrx
+from ncomrx_thread import DuplicateFilter
+
+
+class NcomRxProtocol(asyncio.DatagramProtocol):
+    def __init__(self, sequenceAware=False):
+        self.nrx = {}
+        self.sequenceAware = sequenceAware # See DuplicateFilter
+        self.transport = None
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def _newDevice(self, addr):
+        # Creates the decoder for a new IP address
+        decoder = ncomrx.NcomRx()
+        # Add IP address to connection, useful for user
+        decoder.connection['ip'] = addr
+        decoder.connection['repeatedUdp'] = 0
+        decoder.connection['duplicateRate'] = 0.0 # Fraction of datagrams repeated
+        self.nrx[addr] = {
+            'duplicates': DuplicateFilter(sequenceAware=self.sequenceAware),
+            'datagrams': 0,
+            'decoder': decoder
+            }
+        return self.nrx[addr]
+    
+    def datagram_received(self, data, addrport):
+        myTime = time.perf_counter() # Grab time asap
+        addr = addrport[0] # Just grab the IP address, not port
+        dev = self.nrx.get(addr) or self._newDevice(addr)
+        decoder = dev['decoder']
+        
+        dev['datagrams'] += 1
+        if not dev['duplicates'].isDuplicate(data, len(data)):
+            # There can be more than one packet in data, decode them all
+            decoder.decode_all(data, machineTime=myTime)
+        else:
+            decoder.connection['repeatedUdp'] += 1
+        decoder.connection['duplicateRate'] = decoder.connection['repeatedUdp'] / dev['datagrams']
+    
+    def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def start(port=3000, sequenceAware=False):
+    """
+    Starts receiving NCOM on port and returns the NcomRxProtocol
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Non-exclusive use
+    sock.bind(('', port))
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: NcomRxProtocol(sequenceAware), sock=sock)
+    return protocol
@@ -0,0 +1,220 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+ncomrx_numpy.py
+Bulk decoder for NCOM files, for post-processing
+
+NcomRx decodes one packet at a time, which is what is needed in real
+time but it is slow for an hour-long capture (360,000 packets). This
+module decodes a whole file at once using numpy:
+
+  nav, status = ncomrx_numpy.decode_file('capture.ncom')
+
+nav is a numpy structured array with one row per packet and one column
+per NcomRx nav key (NavStatus, GpsSeconds, Ax, ..., Roll), plus:
+  offset     - position of the packet in the file
+  GpsMinutes - GPS minutes, tracked in the same way as NcomRx, or -1
+               when not known (including NavStatus 0, 5, 6 and 7)
+Measurements that are not valid for the packet's NavStatus are NaN.
+The values are scaled in exactly the same way as NcomRx.
+
+status is a sparse table: a dictionary keyed by status channel. Each
+value is a structured array with the row of the packet in nav ('index')
+and the 8 status bytes ('bytes'). Use decode_status() to turn a channel
+into dictionaries of measurements using the NcomRx decoders.
+
+numpy is needed for this module but not for the rest of ncom-web.
+"""
+
+import numpy as np
+
+import ncomrx
+
+# NavStatus values for which each batch is valid (as in NcomRx.decode)
+BATCH_A_VALID = [1,2,3,4,20,21,22]
+BATCH_B_VALID = [3,4,20,21,22]
+BATCH_S_VALID = [1,2,3,4,10,20,21,22]
+ALL_INVALID   = [0,5,6,7]               # status is cleared
+
+# Columns of the nav array
+NAV_DTYPE = np.dtype(
+    [('offset', '<i8'), ('NavStatus', 'u1'), ('GpsMinutes', '<i8')]
+    + [(f[0], '<f8') for f in ncomrx.BATCH_A_FIELDS + ncomrx.BATCH_B_FIELDS])
+
+STATUS_DTYPE = np.dtype([('index', '<i8'), ('bytes', 'u1', (8,))])
+
+
+def find_packets(data):
+    """
+    Returns the offsets of all the valid packets in data (a numpy uint8
+    array), using one vectorised pass for the checksums. Packets are
+    chosen in the same way as NcomRx, which takes the first valid
+    packet and then searches from the end of it.
+    """
+    L = ncomrx.NOUTPUT_PACKET_LENGTH
+    if len(data) < L:
+        return np.zeros(0, dtype=np.int64)
+
+    # Running sum, modulo 256, so the sum of any range of bytes is the
+    # difference of two entries
+    csum = np.zeros(len(data) + 1, dtype=np.uint8)
+    np.cumsum(data, dtype=np.uint8, out=csum[1:])
+
+    c = np.flatnonzero(data[:len(data)-L+1] == ncomrx.NCOM_SYNC)
+    ok = np.zeros(len(c), dtype=bool)
+    for k in (22, 61, 71):
+        ok |= data[c+k] == csum[c+k] - csum[c+1] # uint8 arithmetic wraps
+    c = c[ok]
+
+    # Valid packets that overlap an earlier valid packet are not used
+    if len(c) > 1 and np.any(np.diff(c) < L):
+        keep = []
+        nxt = 0
+        for o in c.tolist():
+            if o >= nxt:
+                keep.append(o)
+                nxt = o + L
+        c = np.array(keep, dtype=np.int64)
+    return c.astype(np.int64)
+
+
+def _field(pk, offset, width, kind):
+    # Extracts one column from the (N,72) packet array
+    if kind == 'f':
+        raw = np.ascontiguousarray(pk[:, offset:offset+width])
+        return raw.view('<f%d' % width)[:, 0].astype(np.float64)
+    v = np.zeros(len(pk), dtype=np.int64)
+    for i in range(width):
+        v |= pk[:, offset+i].astype(np.int64) << (8*i)
+    if kind == 'i':
+        sign = 1 << (8*width - 1)
+        v = (v ^ sign) - sign
+    return v
+
+
+def _gps_minutes(pk, navStatus, channels):
+    # Tracks GpsMinutes in the same way as NcomRx:
+    # * Status channel 0 sets the minutes (< 1000 is invalid)
+    # * The minutes are incremented when the seconds wrap
+    # * Invalid packets (NavStatus 0, 5, 6, 7) clear the status
+    # The nav measurements use the minutes before the status channel
+    # of the same packet has been decoded
+    n = len(pk)
+    aValid = np.isin(navStatus, BATCH_A_VALID)
+    sValid = np.isin(navStatus, BATCH_S_VALID)
+    reset = np.isin(navStatus, ALL_INVALID)
+
+    # Seconds wrap: previous Batch A seconds > 30 and these < 30
+    secs = _field(pk, 1, 2, 'u') * ncomrx.TIME2SEC
+    prev = np.zeros(n)
+    ia = np.flatnonzero(aValid)
+    prev[ia[1:]] = secs[ia[:-1]]
+    wraps = np.cumsum(aValid & (prev > 30.0) & (secs < 30.0))
+
+    # Value that status channel 0 (or a reset) leaves after each packet
+    minutes = _field(pk, 63, 4, 'u')
+    setting = sValid & (channels == 0)
+    events = setting | reset
+    value = np.where(setting & (minutes >= 1000), minutes, -1)
+
+    # For each packet, the last event before it
+    idx = np.where(events, np.arange(n), -1)
+    last = np.maximum.accumulate(idx)
+    before = np.concatenate(([-1], last[:-1]))
+
+    result = np.full(n, -1, dtype=np.int64)
+    known = before >= 0
+    base = value[before[known]]
+    result[known] = np.where(base >= 0, base + wraps[known] - wraps[before[known]], -1)
+    result[reset] = -1 # Invalid packets have no status, so no minutes
+    return result
+
+
+def decode(data):
+    """
+    Decodes all the packets in data (bytes, or a numpy uint8 array such
+    as a memory-mapped file). Returns (nav, status), see the module
+    documentation.
+    """
+    data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    offsets = find_packets(data)
+    pk = data[offsets[:, None] + np.arange(ncomrx.NOUTPUT_PACKET_LENGTH)]
+
+    nav = np.zeros(len(offsets), dtype=NAV_DTYPE)
+    nav['offset'] = offsets
+    navStatus = pk[:, 21]
+    nav['NavStatus'] = navStatus
+    channels = pk[:, 62]
+
+    for fields, valid in ((ncomrx.BATCH_A_FIELDS, BATCH_A_VALID),
+                          (ncomrx.BATCH_B_FIELDS, BATCH_B_VALID)):
+        invalid = ~np.isin(navStatus, valid)
+        for name, offset, width, kind, scale in fields:
+            v = _field(pk, offset, width, kind).astype(np.float64)
+            for f in scale:
+                v = v * f
+            v[invalid] = np.nan
+            nav[name] = v
+    h = nav['Heading']
+    h[h < 0.0] += 360.0
+    nav['GpsMinutes'] = _gps_minutes(pk, navStatus, channels)
+
+    # Sparse table of status channels
+    status = {}
+    rows = np.flatnonzero(np.isin(navStatus, BATCH_S_VALID))
+    for ch in np.unique(channels[rows]).tolist():
+        r = rows[channels[rows] == ch]
+        t = np.zeros(len(r), dtype=STATUS_DTYPE)
+        t['index'] = r
+        t['bytes'] = pk[r, 63:71]
+        status[ch] = t
+
+    return nav, status
+
+
+def decode_file(filename):
+    """
+    Memory maps and decodes an NCOM file. Returns (nav, status), see
+    the module documentation.
+    """
+    return decode(np.memmap(filename, dtype=np.uint8, mode='r'))
+
+
+def decode_status(status, channel, nrx=None):
+    """
+    Decodes a status channel from the sparse table into a list of
+    dictionaries, one per row, using the NcomRx decoders. Channels
+    such as counters depend on previous values so the rows are decoded
+    in order by one NcomRx (nrx, or a new one).
+    """
+    nrx = nrx or ncomrx.NcomRx()
+    result = []
+    for row in status.get(channel, ()):
+        try:
+            nrx.statusDecoders[channel](nrx, row['bytes'].tobytes())
+        except:
+            pass # Missing or erroneous decoder, as in NcomRx.decode
+        result.append(dict(nrx.status))
+    return result
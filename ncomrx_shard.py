@@ -0,0 +1,268 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+ncomrx_shard.py
+
+Decodes NCOM in several worker processes, so that many INSs (e.g. an
+RT-Range setup with 20+ devices) can use more than one CPU core.
+
+Use by:
+
+nrxs = ncomrx_shard.NcomRxShards(workers=4)
+
+nrxs.nrx['<ip>']['decoder'] has nav, status and connection, as for
+NcomRxThread, so serve_json() in main.py works unchanged. They are
+read from shared memory each time they are used.
+
+A capture thread in this process receives the datagrams and queues
+each one (as raw bytes) for the worker that owns its IP address. Each
+new IP address is given to the worker with the fewest devices. A
+sender thread for each worker writes its queue to the worker's pipe,
+so the capture thread never waits for a busy worker: when a queue
+holds queueDepth datagrams more are dropped, and counted in the
+device's connection['queueDrops']. The workers own the NcomRx decoders
+and publish:
+* nav, after every packet
+* status and connection, at most every 'interval' seconds
+into a shared memory segment for the device (see ncom_shm), so the
+decoded measurements are never pickled. Other programs can read the
+segments too, see ncom_shm.NavReader.
+
+The workers are started with fork where the platform has it (see
+START_METHOD), so create NcomRxShards before starting other threads
+(e.g. the web server). Otherwise (e.g. Windows) they are started with
+spawn, which imports the main module again in each worker, so the
+program must create NcomRxShards under if __name__ == '__main__'.
+"""
+
+import time
+import socket
+import struct
+import threading
+import collections
+import multiprocessing
+
+import ncomrx
+import ncom_shm
+from ncomrx_thread import DuplicateFilter
+
+# Header sent to the worker before each datagram: IPv4 address and
+# machineTime
+DATAGRAM_HEADER = struct.Struct('<4sd')
+
+# How the worker processes are started, see module documentation
+START_METHOD = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class SharedDecoder(object):
+    # Read only stand-in for NcomRx in the web process: nav, status and
+    # connection are read from the device's shared memory
+    def __init__(self, segment):
+        self.segment = segment
+        self.queueDrops = 0     # Datagrams dropped by the capture thread
+    
+    @property
+    def nav(self):
+        return self.segment.readNav()
+    
+    @property
+    def status(self):
+        return self.segment.readJson(self.segment.status)
+    
+    @property
+    def connection(self):
+        connection = self.segment.readJson(self.segment.connection)
+        connection['queueDrops'] = self.queueDrops
+        return connection
+
+
+def _worker(conn, prefix, interval, sequenceAware):
+    # Worker process: decodes the datagrams sent on conn and publishes
+    # to shared memory
+    devices = {}
+    while True:
+        try:
+            if not conn.poll(interval):
+                # Idle, so write what the last datagrams changed
+                now = time.perf_counter()
+                for dev in devices.values():
+                    dev['publisher'].publish(dev['decoder'], now)
+                continue
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            break
+        addr, machineTime = DATAGRAM_HEADER.unpack_from(data)
+        ip = socket.inet_ntoa(addr)
+        
+        dev = devices.get(ip)
+        if dev is None:
+            # New device. The segment has been created by the capture thread
+            segment = ncom_shm.DeviceSegment(ncom_shm.segmentName(prefix, ip))
+            publisher = ncom_shm.Publisher(segment, interval)
+            decoder = ncomrx.NcomRx(samples=True)
+            decoder.connection['ip'] = ip
+            decoder.connection['repeatedUdp'] = 0
+            decoder.connection['worker'] = multiprocessing.current_process().name
+            decoder.onPacket = publisher.packet
+            dev = devices[ip] = {
+                'decoder': decoder,
+                'segment': segment,
+                'publisher': publisher,
+                'duplicates': DuplicateFilter(sequenceAware=sequenceAware),
+                }
+        
+        decoder = dev['decoder']
+        nb = data[DATAGRAM_HEADER.size:]
+        if not dev['duplicates'].isDuplicate(nb, len(nb)):
+            decoder.decode_all(nb, machineTime=machineTime)
+        else:
+            decoder.connection['repeatedUdp'] += 1
+        
+        dev['publisher'].datagram(decoder, time.perf_counter())
+    
+    for dev in devices.values():
+        dev['segment'].close()
+
+
+class NcomRxShards(object):
+    def __init__(self, workers=multiprocessing.cpu_count(), port=3000, interval=0.1,
+                 bufferSize=2048, sequenceAware=False, prefix='ncomweb', queueDepth=1000):
+        # workers    - number of worker processes
+        # interval   - seconds between publishing status and connection
+        # prefix     - start of the shared memory names (see ncom_shm)
+        # queueDepth - datagrams queued for each worker before dropping
+        self.prefix = prefix
+        self.nrx = {}
+        self.keepGoing = True
+        self.bufferSize = bufferSize
+        self.queueDepth = queueDepth
+        
+        ctx = multiprocessing.get_context(START_METHOD)
+        self.pipes = []
+        self.workers = []
+        self.load = [0] * workers   # Devices per worker
+        for k in range(workers):
+            r, w = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=_worker, args=(r, prefix, interval, sequenceAware),
+                            name='ncomrx-%d' % k, daemon=True)
+            p.start()
+            r.close()
+            self.pipes.append(w)
+            self.workers.append(p)
+        
+        # Datagrams are received into buffers from a pool and queued for
+        # the worker's sender thread as (buffer, nbytes, dev). deque
+        # append/pop are thread-safe. The semaphores count the queued
+        # datagrams
+        self.pool = collections.deque()
+        self.queues = [collections.deque() for k in range(workers)]
+        self.queued = [threading.Semaphore(0) for k in range(workers)]
+        self.senders = [threading.Thread(target=self._send, args=(k,), daemon=True)
+                        for k in range(workers)]
+        for t in self.senders:
+            t.start()
+        
+        self.directory = ncom_shm.Directory(prefix, create=True)
+        
+        # Functions f(ip) called after each datagram is passed to a
+        # worker, e.g. to wake publisher.Publisher
+        self.listeners = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Non-exclusive use
+        self.sock.bind(('', port))
+        self.capture = threading.Thread(target=self._capture, daemon=True)
+        self.capture.start()
+    
+    def _newDevice(self, addr):
+        # Creates the shared memory for a new IP address and gives it to
+        # the worker with the fewest devices
+        k = self.load.index(min(self.load))
+        self.load[k] += 1
+        segment = ncom_shm.DeviceSegment(ncom_shm.segmentName(self.prefix, addr), create=True)
+        self.nrx[addr] = {
+            'decoder': SharedDecoder(segment),
+            'segment': segment,
+            'worker': k,
+            }
+        self.directory.add(addr)
+        return self.nrx[addr]
+    
+    def _capture(self):
+        # Receive, time stamp and queue for the worker, never waiting
+        # for the worker
+        pool = self.pool
+        while(self.keepGoing):
+            buf = pool.pop() if pool else bytearray(DATAGRAM_HEADER.size + self.bufferSize)
+            with memoryview(buf) as mv:
+                n, addrport = self.sock.recvfrom_into(mv[DATAGRAM_HEADER.size:])
+            myTime = time.perf_counter() # Grab time asap
+            
+            addr = addrport[0] # Just grab the IP address, not port
+            dev = self.nrx.get(addr) or self._newDevice(addr)
+            k = dev['worker']
+            if len(self.queues[k]) >= self.queueDepth:
+                dev['decoder'].queueDrops += 1 # Worker is not keeping up
+                pool.append(buf)
+                continue
+            DATAGRAM_HEADER.pack_into(buf, 0, socket.inet_aton(addr), myTime)
+            self.queues[k].append((buf, DATAGRAM_HEADER.size + n))
+            self.queued[k].release()
+            for f in self.listeners:
+                f(addr)
+    
+    def _send(self, k):
+        # Sender thread of worker k: writes the queued datagrams to its
+        # pipe, waiting while the pipe is full
+        q = self.queues[k]
+        pipe = self.pipes[k]
+        while self.keepGoing:
+            self.queued[k].acquire() # Wait for a datagram
+            if not q:
+                continue # Woken by stop()
+            buf, n = q.popleft()
+            try:
+                with memoryview(buf) as mv:
+                    pipe.send_bytes(mv[:n])
+            except OSError:
+                break # Worker has gone
+            finally:
+                self.pool.append(buf)
+    
+    def stop(self):
+        self.keepGoing = False
+        for sem in self.queued:
+            sem.release() # Wake the senders
+        for t in self.senders:
+            t.join(1.0)
+        for w in self.pipes:
+            w.close()
+        for p in self.workers:
+            p.join(1.0)
+        for dev in self.nrx.values():
+            dev['segment'].close()
+            dev['segment'].unlink()
+        self.directory.close()
+        self.directory.unlink()
@@ -38,8 +38,54 @@ access the decoded data. For example:
 
   nrxs.nrx['192.168.2.62']['decoder'].nav['GpsTime']
 
-Call nrxs.stop() to end, but note that the thread will be blocked on
-data from the socket so it will only stop after data is received.
+Call nrxs.stop() to end, which waits for the decode stage to finish.
+Note that the capture thread will be blocked on data from the socket
+so it will only stop after data is received.
+
+Receiving and decoding are separate threads, so that a slow decode
+(e.g. a burst of corrupt data, or the GIL held while encoding JSON)
+does not leave datagrams in the socket buffer until it overflows:
+
+* The capture thread only receives datagrams into preallocated
+  buffers, time stamps them and queues them for the device
+* NcomRxThread itself (the decode stage) takes datagrams from the
+  queues and decodes them, taking one datagram from each device with
+  queued datagrams in turn (round robin) so that, when decoding falls
+  behind, every device loses datagrams rather than just the last
+
+The settings are NcomRxThread(port=3000, queueDepth=1000,
+rcvBuf=None, bufferSize=2048, sequenceAware=False), where queueDepth
+is the number of datagrams queued for each device, rcvBuf sets
+SO_RCVBUF (None leaves the system default), bufferSize is the largest
+datagram and sequenceAware changes how repeated datagrams are found
+(see DuplicateFilter). Datagrams that arrive when a device's queue is
+full are dropped. Each decoder's connection reports queueDepth,
+queueLength (when the datagram was decoded), queueDrops, rcvBuf (as
+reported by the system), repeatedUdp, duplicateRate and
+duplicateLookupNs.
+
+With shmPrefix (e.g. 'ncomweb') the latest nav record, status and
+connection of each device are also written to shared memory for other
+programs on the same machine, see ncom_shm. The nav record is written
+after every packet; status and connection are encoded as JSON every
+shmInterval seconds by a separate thread, not the decode stage.
+
+To act on every packet (e.g. logging at the full rate) subscribe:
+
+  def callback(packet):
+      print(packet['ip'], packet['machineTime'], packet['nav']['GpsTime'])
+
+  sub = nrxs.subscribe(callback, ip=None, kinds=('nav','status'))
+
+packet is a dictionary with 'ip', 'machineTime' and a copy of each of
+the kinds ('nav', 'status', 'connection' or 'sample', a NavSample);
+other kinds raise ValueError. The copies are shared between
+subscribers so do not modify them.
+Callbacks run in a separate thread for each subscriber, with a bounded
+queue, so a slow subscriber cannot stall the receive loop. Instead its
+packets are dropped and counted in sub.dropped. Use sub.unsubscribe()
+(or nrxs.unsubscribe(sub)) to stop. A subscription (or listener) that
+fails in the decode stage is logged and dropped.
 """
 
 import time
@@ -48,55 +94,324 @@ import ncomrx
 import collections
 import binascii
 import threading
+import queue
+import logging
+import ncom_shm
+
+log = logging.getLogger(__name__)
+
+# Kinds of data that can be subscribed to
+KINDS = ('nav', 'status', 'connection', 'sample')
+
+
+class DuplicateFilter(object):
+    # Identifies repeated datagrams. The keys of the last 'size'
+    # datagrams are held in a set, for O(1) lookup, and a deque, which
+    # gives the order in which to forget them.
+    #
+    # The key is the CRC of the datagram. If sequenceAware is set, and
+    # the datagram starts with an NCOM packet, its GpsSeconds and status
+    # channel are added to the key so that different packets with the
+    # same CRC are not taken as repeats.
+    def __init__(self, size=200, sequenceAware=False):
+        self.size = size
+        self.sequenceAware = sequenceAware
+        self.keys = set()
+        self.order = collections.deque()
+    
+    def key(self, buf, n):
+        with memoryview(buf) as mv:
+            crc = binascii.crc32(mv[:n])
+        if self.sequenceAware and n >= ncomrx.NOUTPUT_PACKET_LENGTH and buf[0] == ncomrx.NCOM_SYNC:
+            return (crc, buf[1] | (buf[2] << 8), buf[62])
+        return crc
+    
+    def isDuplicate(self, buf, n):
+        # True if the first n bytes of buf have been seen recently,
+        # otherwise remembers them and returns False
+        k = self.key(buf, n)
+        if k in self.keys:
+            return True
+        self.keys.add(k)
+        self.order.append(k)
+        if len(self.order) > self.size:
+            self.keys.discard(self.order.popleft())
+        return False
+
+
+class Subscription(threading.Thread):
+    # Delivers packets to one subscriber's callback, from its own thread
+    def __init__(self, owner, callback, ip, kinds, maxQueue):
+        threading.Thread.__init__(self, daemon=True)
+        self.owner = owner
+        self.callback = callback
+        self.ip = ip                # None for all devices
+        self.kinds = tuple(kinds)
+        self.queue = queue.Queue(maxQueue)
+        self.delivered = 0          # Packets given to the callback
+        self.dropped = 0            # Packets lost because the queue was full
+        self.errors = 0             # Exceptions raised by the callback
+        self.keepGoing = True
+        self.start()
+    
+    def put(self, packet):
+        # Called from the decode stage, so never blocks
+        try:
+            self.queue.put_nowait(packet)
+        except queue.Full:
+            self.dropped += 1
+    
+    def run(self):
+        while self.keepGoing:
+            packet = self.queue.get()
+            if packet is None:
+                break
+            try:
+                self.callback(packet)
+            except:
+                self.errors += 1 # A bad callback must not end the thread
+            self.delivered += 1
+    
+    def unsubscribe(self):
+        self.owner.unsubscribe(self)
 
 
 class NcomRxThread(threading.Thread):
-    def __init__(self):
+    def __init__(self, port=3000, queueDepth=1000, rcvBuf=None, bufferSize=2048, sequenceAware=False,
+                 shmPrefix=None, shmInterval=0.1):
         threading.Thread.__init__(self)
         self.daemon_threads = True
-        ncomrx.NcomRx.__init__(self)
         self.keepGoing = True
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Non-exclusive use
-        self.sock.bind(('', 3000))
+        if rcvBuf is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvBuf)
+        self.rcvBuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.sock.bind(('', port))
         self.nrx = {}
+        self.sequenceAware = sequenceAware # See DuplicateFilter
+        
+        # Shared memory for other programs, see ncom_shm
+        self.shmPrefix = shmPrefix
+        self.shmInterval = shmInterval
+        self.directory = ncom_shm.Directory(shmPrefix, create=True) if shmPrefix else None
+        self.shmThread = None
+        
+        # Datagrams are received into buffers from a pool and passed to
+        # the decode stage in per-device queues of (buffer, nbytes,
+        # machineTime). deque append/pop are thread-safe. The semaphore
+        # counts the queued datagrams
+        self.queueDepth = queueDepth
+        self.bufferSize = bufferSize
+        self.pool = collections.deque()
+        self.queued = threading.Semaphore(0)
+        # Devices with queued datagrams, in the order to decode them.
+        # A device is in ready (once) while its queue is not empty,
+        # which readyLock keeps true
+        self.ready = collections.deque()
+        self.readyLock = threading.Lock()
+        
+        # Subscriptions, replaced (not modified) when they change so
+        # that the decode stage can use them without a lock
+        self.subscriptions = ()
+        self.subscribeLock = threading.Lock()
+        
+        # Functions f(ip) called after each datagram is decoded, e.g. to
+        # wake publisher.Publisher. They must be quick
+        self.listeners = []
+        
+        self.capture = threading.Thread(target=self._capture, daemon=True)
+        self.capture.start()
+        if self.directory is not None:
+            self.shmThread = threading.Thread(target=self._publishJson, daemon=True)
+            self.shmThread.start()
         self.start()
     
-    def run(self):
+    def subscribe(self, callback, ip=None, kinds=('nav','status'), maxQueue=1000):
+        # Calls callback(packet) for every packet decoded from ip (or
+        # from all devices if ip is None), see module documentation.
+        # Up to maxQueue packets are held if the callback is slow.
+        # Returns a Subscription
+        for kind in kinds:
+            if kind not in KINDS:
+                raise ValueError("Unknown kind %r, expected one of %s" % (kind, ', '.join(KINDS)))
+        sub = Subscription(self, callback, ip, kinds, maxQueue)
+        with self.subscribeLock:
+            self.subscriptions += (sub,)
+            if 'sample' in sub.kinds:
+                for n in list(self.nrx.values()):
+                    n['decoder'].samples = True
+        return sub
+    
+    def unsubscribe(self, sub):
+        with self.subscribeLock:
+            self.subscriptions = tuple(s for s in self.subscriptions if s is not sub)
+            # NavSamples are only made while someone uses them (always
+            # with shared memory)
+            samples = self.directory is not None or any('sample' in s.kinds for s in self.subscriptions)
+            for n in list(self.nrx.values()):
+                n['decoder'].samples = samples
+        sub.keepGoing = False
+        try:
+            sub.queue.put_nowait(None) # Wake the thread
+        except queue.Full:
+            pass
+    
+    def _publish(self, decoder, machineTime):
+        # NcomRx.onPacket for every decoder: passes the packet to shared
+        # memory and the subscribers. The copies are made once and shared
+        ip = decoder.connection['ip']
+        publisher = self.nrx[ip].get('publisher')
+        if publisher is not None:
+            publisher.packet(decoder, machineTime)
+        subs = self.subscriptions
+        if not subs:
+            return
+        subs = [sub for sub in subs if sub.ip is None or sub.ip == ip]
+        if not subs:
+            return
+        packet = {'ip': ip, 'machineTime': machineTime}
+        for sub in subs:
+            try:
+                for kind in sub.kinds:
+                    if kind not in packet:
+                        if kind == 'sample':
+                            packet[kind] = decoder.sample
+                        else:
+                            packet[kind] = dict(getattr(decoder, kind))
+                sub.put(packet)
+            except Exception:
+                # Must not stop the decode stage or the other subscribers
+                log.exception("Dropping subscription %r for %s", sub.callback, ip)
+                self.unsubscribe(sub)
+    
+    def _newDevice(self, addr):
+        # Creates the queue and decoder for a new IP address
+        decoder = ncomrx.NcomRx()
+        # Add IP address to connection, useful for user
+        decoder.connection['ip'] = addr
+        decoder.connection['repeatedUdp'] = 0
+        decoder.connection['duplicateRate'] = 0.0       # Fraction of datagrams repeated
+        decoder.connection['duplicateLookupNs'] = 0.0   # Mean time to check for a repeat
+        decoder.connection['queueDepth'] = self.queueDepth
+        decoder.connection['queueLength'] = 0
+        decoder.connection['queueDrops'] = 0
+        decoder.connection['rcvBuf'] = self.rcvBuf
+        decoder.onPacket = self._publish
+        with self.subscribeLock:
+            decoder.samples = any('sample' in s.kinds for s in self.subscriptions)
+        dev = {
+            'duplicates': DuplicateFilter(sequenceAware=self.sequenceAware),
+            'datagrams': 0,
+            'lookupTime': 0.0,
+            'queue': collections.deque(),
+            'ready': False, # In self.ready
+            'decoder': decoder
+            }
+        if self.directory is not None:
+            decoder.samples = True
+            dev['publisher'] = ncom_shm.Publisher(
+                ncom_shm.DeviceSegment(ncom_shm.segmentName(self.shmPrefix, addr), create=True),
+                self.shmInterval)
+        self.nrx[addr] = dev
+        if self.directory is not None:
+            self.directory.add(addr)
+        return dev
+    
+    def _capture(self):
+        # Capture thread: receive, time stamp and queue, nothing else
+        pool = self.pool
         while(self.keepGoing):
-            # Get data from socket
-            nb, addrport = self.sock.recvfrom(256) # New bytes
+            buf = pool.pop() if pool else bytearray(self.bufferSize)
+            n, addrport = self.sock.recvfrom_into(buf) # New bytes
             myTime = time.perf_counter() # Grab time asap
+            if not self.keepGoing:
+                break # Stopped while waiting
             
             addr = addrport[0] # Just grab the IP address, not port
+            dev = self.nrx.get(addr) or self._newDevice(addr)
             
-            # Is this a new IP address
-            if addr not in self.nrx:
-                # Then create a new crclist and decoder in nrx
-                self.nrx[addr] = {
-                    'crcList': collections.deque(maxlen=200),
-                    'decoder': ncomrx.NcomRx()
-                    }
-                # Add IP address to connection, useful for user
-                self.nrx[addr]['decoder'].connection['ip'] = addr
-                self.nrx[addr]['decoder'].connection['repeatedUdp'] = 0
-            
-            # Under linux, UDP packets can be repeated, which messes up
-            # the ncom decoding. Compute CRC and use it to identify
-            # repeated packets
-            crc = binascii.crc32(nb)
-            if crc not in self.nrx[addr]['crcList']:
-                self.nrx[addr]['crcList'].append(crc)                
-                self.nrx[addr]['decoder'].decode(nb, machineTime=myTime)
-                # And process all possible data. There can be more than
-                # one packet in nb but the decoder stops each time it has
-                # a full packet
-                while self.nrx[addr]['decoder'].decode(b'', machineTime=myTime):
-                    pass # For this implementation just pass
-                    # If you need to act on every packet received then
-                    # add code (e.g. a callback) here
+            if len(dev['queue']) >= self.queueDepth:
+                dev['decoder'].connection['queueDrops'] += 1
+                pool.append(buf)
             else:
-                self.nrx[addr]['decoder'].connection['repeatedUdp'] += 1
+                with self.readyLock:
+                    dev['queue'].append((buf, n, myTime))
+                    if not dev['ready']:
+                        dev['ready'] = True
+                        self.ready.append(dev)
+                self.queued.release()
+    
+    def run(self):
+        # Decode stage
+        while(self.keepGoing):
+            self.queued.acquire() # Wait for a datagram
+            with self.readyLock:
+                if not self.ready:
+                    continue # Woken by stop()
+                dev = self.ready.popleft()
+                q = dev['queue']
+                buf, n, myTime = q.popleft()
+                if q:
+                    self.ready.append(dev) # Back of the line
+                else:
+                    dev['ready'] = False
+            decoder = dev['decoder']
+            decoder.connection['queueLength'] = len(q)
+            try:
+                self._decode(dev, buf, n, myTime)
+            except Exception:
+                # Log it and carry on with the next datagram
+                log.exception("Decoding a datagram from %s", decoder.connection['ip'])
+            self.pool.append(buf)
+    
+    def _decode(self, dev, buf, n, myTime):
+        # Decodes one datagram for the decode stage
+        decoder = dev['decoder']
+        
+        # Under linux, UDP packets can be repeated, which messes up
+        # the ncom decoding. Use a CRC to identify repeated packets
+        t0 = time.perf_counter()
+        repeated = dev['duplicates'].isDuplicate(buf, n)
+        dev['lookupTime'] += time.perf_counter() - t0
+        dev['datagrams'] += 1
+        if not repeated:
+            # There can be more than one packet in buf, decode them all
+            # Subscribers are given each packet by _publish()
+            decoder.decode_all(buf, machineTime=myTime, nbytes=n)
+        else:
+            decoder.connection['repeatedUdp'] += 1
+        if 'publisher' in dev:
+            dev['publisher'].changed = True # Written by _publishJson()
+        for f in self.listeners:
+            try:
+                f(decoder.connection['ip'])
+            except Exception:
+                log.exception("Dropping listener %r", f)
+                self.listeners = [g for g in self.listeners if g is not f]
+        decoder.connection['duplicateRate'] = decoder.connection['repeatedUdp'] / dev['datagrams']
+        decoder.connection['duplicateLookupNs'] = dev['lookupTime'] / dev['datagrams'] * 1e9
                                         
+    def _publishJson(self):
+        # Shared memory thread: writes status and connection of the
+        # devices that have changed, every shmInterval
+        while self.keepGoing:
+            time.sleep(self.shmInterval)
+            now = time.perf_counter()
+            for dev in list(self.nrx.values()):
+                dev['publisher'].publish(dev['decoder'], now)
+    
     def stop(self):
         self.keepGoing = False
+        self.queued.release() # Wake the decode stage
+        # Nothing must write to the segments once they are closed
+        if threading.current_thread() is not self:
+            self.join()
+        if self.shmThread is not None:
+            self.shmThread.join()
+        if self.directory is not None:
+            for dev in self.nrx.values():
+                dev['publisher'].segment.close()
+                dev['publisher'].segment.unlink()
+            self.directory.close()
+            self.directory.unlink()
@@ -0,0 +1,331 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+publisher.py
+
+Sends the decoded measurements to the web sockets when new data
+arrives, rather than polling every 0.5s.
+
+Usage:
+  pub = publisher.Publisher(ws, nrxs)
+
+where ws is the BgWebServer and nrxs the NcomRxThread (or
+NcomRxShards). The decoder wakes the publisher after each datagram.
+The publisher then waits a short 'window' so that the updates that
+arrive together are sent together, and sends to each web socket that
+is due.
+
+Each web socket chooses its rate with a "rate" query (in Hz, 1 to
+100), for example:
+
+  ws://192.168.2.123:8000/message.json?ip=192.168.2.62&rate=10
+
+The default is 2Hz, as before. nav is sent at this rate. status and
+connection are much larger and change slowly so they are sent at no
+more than statusRate (2Hz). devices.json is sent when the list of
+devices changes and every 0.5s.
+
+A web socket can also choose the messages it wants with a "kinds"
+query, for example &kinds=nav or &kinds=status,connection. The
+default is all three.
+
+Encoding is only done for what is being watched. The publisher keeps
+a table of subscriptions, (ip, kind) -> web sockets, and a device
+with no web sockets does not even wake the publisher. Each message
+is encoded once however many web sockets it is sent to.
+
+Binary nav
+----------
+JSON is heavy for charts at 100Hz on many web pages. A web socket that
+asks for the sub-protocol NAV_PROTOCOL ("ncom-nav-binary") is sent nav
+as binary messages instead (status and connection are still JSON).
+Each binary message holds every sample since the last one (up to
+MAX_BATCH), so a page at rate=10 from a 100Hz INS gets 10 samples in
+each message. All little-endian:
+
+  header (NAV_HEADER, 12 bytes)
+    4s   NAV_TAG, b'NAV1'
+    H    number of records
+    H    bytes in each record (NAV_RECORD.size, 136)
+    i    TimeUtcOffset (s), INT_NONE if not known
+  records (NAV_RECORD), one per sample
+    i    NavStatus
+    i    GpsMinutes, INT_NONE if not known
+    d    GpsSeconds, Ax, Ay, Az, Wx, Wy, Wz, Lat, Lon, Alt, Vn, Ve,
+         Vd, Heading, Pitch, Roll (NAV_FLOATS), NaN if not valid
+
+The samples come from a subscription to the decoder (kinds 'sample').
+If the decoder cannot be subscribed to (NcomRxShards) each message
+holds just the latest nav. static/messages.js has the decoder.
+"""
+
+import time
+import json
+import math
+import struct
+import threading
+import collections
+import urllib.parse
+
+import ncomrx
+
+DEFAULT_RATE = 2.0      # Hz, when the web socket does not have a rate query
+MIN_RATE = 1.0
+MAX_RATE = 100.0
+DEVICES_PERIOD = 0.5    # Seconds between devices.json messages
+KINDS = ('nav', 'status', 'connection') # Messages sent on message.json
+
+# Binary nav, see module documentation
+NAV_PROTOCOL = 'ncom-nav-binary'
+MAX_BATCH = 100         # Most samples in one binary message
+NAV_TAG = b'NAV1'
+NAV_INTS = ('NavStatus', 'GpsMinutes')
+NAV_FLOATS = ncomrx.NavSample.FIELDS[len(NAV_INTS):]
+NAV_HEADER = struct.Struct('<4sHHi')
+NAV_RECORD = struct.Struct('<2i%dd' % len(NAV_FLOATS))
+INT_NONE = -0x80000000  # Integer that is not known
+NAN = float('nan')
+
+
+def encodeNav(samples, timeUtcOffset=None):
+    """
+    Returns the binary nav message (bytes) for samples, each a
+    NavSample or the values in the order of NavSample.FIELDS
+    """
+    parts = [NAV_HEADER.pack(NAV_TAG, len(samples), NAV_RECORD.size,
+                             INT_NONE if timeUtcOffset is None else int(timeUtcOffset))]
+    pack = NAV_RECORD.pack
+    for sample in samples:
+        navStatus, minutes, *values = sample
+        parts.append(pack(int(navStatus), int(minutes) if minutes == minutes else INT_NONE,
+                          *values))
+    return b''.join(parts)
+
+
+def encodeLatestNav(decoder):
+    """Returns the binary nav message for the latest nav of decoder"""
+    nav = decoder.nav
+    if 'NavStatus' not in nav:
+        return encodeNav(())
+    minutes = decoder.status.get('GpsMinutes', NAN)
+    return encodeNav([[nav['NavStatus'], minutes] + [nav.get(f, NAN) for f in NAV_FLOATS]],
+                     decoder.status.get('TimeUtcOffset'))
+
+
+class ClientState(object):
+    # What the publisher knows about one web socket
+    __slots__ = ('handler', 'kind', 'ip', 'kinds', 'binary', 'period', 'seq', 'due',
+                 'statusDue', 'sample')
+    
+    def __init__(self, handler):
+        self.handler = handler
+        url = urllib.parse.urlsplit(handler.path)
+        query = urllib.parse.parse_qs(url.query)
+        self.kind = url.path     # "/message.json", "/devices.json", ...
+        self.ip = query.get('ip', [None])[0]
+        try:
+            rate = float(query['rate'][0])
+        except (KeyError, ValueError):
+            rate = DEFAULT_RATE
+        if not rate >= MIN_RATE: # Includes NaN
+            rate = MIN_RATE
+        self.period = 1.0 / min(rate, MAX_RATE)
+        try:
+            kinds = query['kinds'][0].split(',')
+            self.kinds = tuple(k for k in KINDS if k in kinds)
+        except KeyError:
+            self.kinds = KINDS
+        if self.kind != '/message.json' or self.ip is None:
+            self.kinds = () # e.g. devices.json
+        # Binary nav (see module documentation)
+        self.binary = getattr(handler, 'ws_protocol', None) == NAV_PROTOCOL
+        self.seq = -1           # Device update last sent; -1 so that a new
+                                # web socket is sent the latest values, even
+                                # from a device that has gone quiet
+        self.due = 0.0          # Time that nav can next be sent
+        self.statusDue = 0.0    # Time that status can next be sent
+        self.sample = 0         # Number of the last sample sent (binary)
+
+
+def subscriptions(clients):
+    """
+    Returns the subscriptions of the message.json web sockets in
+    clients (ClientState) as a dictionary: (ip, kind) -> [ClientState]
+    """
+    subs = {}
+    for c in clients:
+        for kind in c.kinds:
+            subs.setdefault((c.ip, kind), []).append(c)
+    return subs
+
+
+class Publisher(threading.Thread):
+    def __init__(self, ws, nrxs, window=0.005, statusRate=2.0):
+        # window     - seconds to wait, after being woken, for other
+        #              updates to arrive
+        # statusRate - maximum rate for status and connection (Hz)
+        threading.Thread.__init__(self, daemon=True)
+        self.ws = ws
+        self.nrxs = nrxs
+        self.window = window
+        self.statusPeriod = 1.0 / statusRate
+        self.updates = {}       # ip -> number of updates
+        self.wake = threading.Event()
+        self.clients = {}       # handler -> ClientState
+        self.subscriptions = {} # (ip, kind) -> [ClientState]
+        self.watched = frozenset() # ips with at least one subscription
+        self.version = -1       # Registry version of clients
+        self.samples = {}       # ip -> deque of (number, NavSample), for binary nav
+        self.sampled = frozenset() # ips with binary nav web sockets
+        self.sampler = None     # Subscription that fills samples
+        self.devices = None     # Last devices.json
+        self.devicesDue = 0.0
+        self.keepGoing = True
+        nrxs.listeners.append(self.notify)
+        self.start()
+    
+    def notify(self, ip):
+        # Called by the decoder after each datagram, so must be quick.
+        # Devices that nobody is watching are ignored
+        if ip in self.watched:
+            self.updates[ip] = self.updates.get(ip, 0) + 1
+            self.wake.set()
+    
+    def run(self):
+        timeout = 0.0
+        while self.keepGoing:
+            if self.wake.wait(timeout):
+                time.sleep(self.window) # Coalesce updates
+                self.wake.clear()
+            timeout = self._publish(time.perf_counter())
+    
+    def stop(self):
+        self.keepGoing = False
+        self.wake.set()
+        if self.sampler is not None:
+            self.sampler.unsubscribe()
+    
+    def _sample(self, packet):
+        # Subscription callback (its own thread): keeps the latest
+        # samples of the devices with binary nav web sockets
+        ip = packet['ip']
+        sample = packet['sample']
+        if ip not in self.sampled or sample is None:
+            return
+        samples = self.samples.get(ip)
+        if samples is None:
+            samples = self.samples[ip] = collections.deque(maxlen=MAX_BATCH)
+        samples.append((samples[-1][0] + 1 if samples else 1, sample))
+    
+    def _publish(self, now):
+        # Sends to each web socket that is due. Returns the time until
+        # the next web socket (or devices.json) is due, so the loop wakes
+        # at least every DEVICES_PERIOD, sooner when new data arrives
+        websockets = self.ws.server.websockets
+        if websockets.version != self.version:
+            self.version = websockets.version
+            self._subscribe(tuple(websockets))
+        
+        nextDue = math.inf
+        encoded = {}    # (ip, kind) -> message, encoded once
+        for h, c in self.clients.items():
+            if not c.kinds or c.ip not in self.nrxs.nrx:
+                continue
+            seq = self.updates.get(c.ip, 0)
+            if seq == c.seq:
+                continue # Nothing new
+            if now < c.due:
+                nextDue = min(nextDue, c.due)
+                continue
+            c.seq = seq
+            c.due = now + c.period
+            kinds = [k for k in c.kinds if k == 'nav' or now >= c.statusDue]
+            if len(kinds) > ('nav' in kinds):
+                c.statusDue = now + self.statusPeriod
+            for kind in kinds:
+                if kind == 'nav' and c.binary:
+                    message = self._binaryNav(c, encoded)
+                    if message is not None:
+                        h.send_binary(message)
+                    continue
+                message = encoded.get((c.ip, kind))
+                if message is None:
+                    decoder = self.nrxs.nrx[c.ip]['decoder']
+                    message = json.dumps({kind: getattr(decoder, kind)}, default=str)
+                    encoded[(c.ip, kind)] = message
+                h.send_message(message)
+        
+        # devices.json
+        devices = [ nrx for nrx in self.nrxs.nrx ] # list of keys/ip addresses
+        if devices != self.devices or now >= self.devicesDue:
+            self.devices = devices
+            self.devicesDue = now + DEVICES_PERIOD
+            self.ws.send_message_all(json.dumps(devices), path="/devices.json")
+        nextDue = min(nextDue, self.devicesDue)
+        
+        return max(0.0, nextDue - time.perf_counter())
+    
+    def _binaryNav(self, c, encoded):
+        # Binary nav for c: the samples since the last message, or the
+        # latest nav if there are no samples. None if nothing is new
+        decoder = self.nrxs.nrx[c.ip]['decoder']
+        samples = self.samples.get(c.ip)
+        if self.sampler is None or samples is None:
+            key = (c.ip, 'nav', None)
+            if key not in encoded:
+                encoded[key] = encodeLatestNav(decoder)
+            return encoded[key]
+        samples = tuple(samples) # The subscription may append meanwhile
+        last = samples[-1][0]
+        if last == c.sample:
+            return None
+        key = (c.ip, 'nav', c.sample)
+        if key not in encoded:
+            encoded[key] = encodeNav([s for n, s in samples if n > c.sample],
+                                     decoder.status.get('TimeUtcOffset'))
+        c.sample = last
+        return encoded[key]
+    
+    def _subscribe(self, handlers):
+        # Updates the clients and subscriptions when web sockets open
+        # or close
+        clients = {h: self.clients.get(h) or ClientState(h) for h in handlers}
+        for c in clients.values():
+            if c.kinds and 'nav' not in c.kinds:
+                c.period = max(c.period, self.statusPeriod)
+        self.clients = clients # Forgets closed web sockets
+        self.subscriptions = subscriptions(clients.values())
+        self.watched = frozenset(ip for ip, kind in self.subscriptions)
+        
+        # Every sample of the devices with binary nav web sockets
+        self.sampled = frozenset(c.ip for c in clients.values() if c.binary and 'nav' in c.kinds)
+        for ip in list(self.samples):
+            if ip not in self.sampled:
+                del self.samples[ip]
+        if self.sampled and self.sampler is None and hasattr(self.nrxs, 'subscribe'):
+            self.sampler = self.nrxs.subscribe(self._sample, kinds=('sample',))
+        elif not self.sampled and self.sampler is not None:
+            self.sampler.unsubscribe()
+            self.sampler = None
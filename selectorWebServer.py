@@ -0,0 +1,524 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+selectorWebServer is a web server for bgWebServer that handles all
+the connections (web pages and websockets) on one thread, using
+non-blocking sockets and selectors, rather than a thread per
+connection.
+
+It is not used directly:
+  ws = bgWebServer.BgWebServer(selectors=True)
+
+and then ws.send_message_all(), ws.recvpath(), etc. are the same as
+the threaded server. SelectorHTTPServer has the parts of
+ThreadedHTTPServer that BgWebServer uses (serve_forever, shutdown,
+socket, websockets and websocketmessages) and each open websocket has
+a path and send_message(), like BgWebHandler.
+
+send_message() can be called from any thread. The frame is sent
+straight away if the socket will take it, otherwise it is queued and
+sent by the server thread when the socket is writable. As with
+HTTPWebSocketsHandler, the queue of each websocket is limited to
+send_queue_size frames and send_policy says what happens when it is
+full.
+
+HTTP/1.1 connections are kept open for more requests (including
+pipelined requests) until the client closes them or they have been
+idle for keep_alive_timeout seconds. Only GET (and HEAD) is supported.
+parse_request(), response_head() and error_page() are also used by
+asyncWebServer, so the two servers handle requests in the same way.
+"""
+
+import os
+import time
+import socket
+import selectors
+import threading
+import collections
+import mimetypes
+import posixpath
+import urllib.parse
+from base64 import b64encode
+from hashlib import sha1
+
+from HTTPWebSocketsHandler import HTTPWebSocketsHandler, FrameParser, WebSocketError
+from HTTPWebSocketsHandler import negotiate_deflate, negotiate_protocol
+from HTTPWebSocketsHandler import DROP_OLDEST, KEEP_LATEST, DISCONNECT
+
+MAX_REQUEST = 16384     # Limit on the size of the HTTP request headers
+MAX_HEADERS = 100       # Limit on the number of HTTP headers
+RECV_SIZE = 65536
+KEEP_ALIVE_TIMEOUT = 15 # Seconds that an idle HTTP connection is kept open
+
+# Definitions from the websocket protocol
+WS_GUID = HTTPWebSocketsHandler._ws_GUID
+OPCODE_TEXT = HTTPWebSocketsHandler._opcode_text
+OPCODE_BINARY = HTTPWebSocketsHandler._opcode_binary
+OPCODE_CLOSE = HTTPWebSocketsHandler._opcode_close
+OPCODE_PING = HTTPWebSocketsHandler._opcode_ping
+OPCODE_PONG = HTTPWebSocketsHandler._opcode_pong
+
+
+def parse_request(head):
+    """
+    Parses the head of an HTTP request: the request line and headers,
+    as bytes, without the blank line that ends them. Returns (method,
+    path, headers, keep_alive), with the header names in lower case, or
+    None if it is not a valid request. keep_alive is True if the client
+    wants the connection kept open after the response
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    requestline = lines[0].split()
+    if len(requestline) != 3 or len(lines) > MAX_HEADERS + 1:
+        return None
+    method, path, version = requestline
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        keep_alive = 'close' not in connection
+    else:
+        keep_alive = 'keep-alive' in connection
+    return method, path, headers, keep_alive
+
+
+def response_head(code, reason, fields, keep_alive):
+    """
+    Returns the status line and header fields of a response, as bytes.
+    fields must include Content-Length (except for 304) so that the
+    connection can be kept open
+    """
+    return ''.join(['HTTP/1.1 %d %s\r\n' % (code, reason)]
+                   + ['%s: %s\r\n' % field for field in fields]
+                   + ['Connection: %s\r\n\r\n' % ('keep-alive' if keep_alive else 'close')]
+                   ).encode('latin-1')
+
+
+def error_page(code, message):
+    """
+    Returns (fields, body) of an error response
+    """
+    body = ('<html><body><h1>%d %s</h1></body></html>' % (code, message)).encode('utf-8')
+    return [('Content-Type', 'text/html;charset=utf-8'), ('Content-Length', str(len(body)))], body
+
+
+class SelectorConnection(object):
+    """
+    One connection to the SelectorHTTPServer. It starts as an HTTP
+    request and, after a websocket handshake, is the websocket that
+    is added to server.websockets
+    """
+    def __init__(self, server, sock, address):
+        self.server = server
+        self.sock = sock
+        self.client_address = address
+        self.path = None
+        self.ws_connected = False
+        self.ws_protocol = None     # The negotiated sub-protocol, or None
+        self.send_drops = 0         # Frames discarded by the send_policy
+        self._request = bytearray() # HTTP request until it is complete
+        self._keepAlive = False     # Keep the connection after this request
+        self.lastActive = time.monotonic()
+        self._parser = None
+        self._deflater = None       # MessageDeflater with permessage-deflate
+        self._lock = threading.Lock()
+        self._out = collections.deque() # Frames/responses waiting to be sent
+        self._partial = None        # Remainder of a part sent buffer
+        self._closing = False       # Close when _out has been sent
+        self._abort = False         # Close now, from the server thread
+        self._writing = False       # Waiting for the socket to be writable
+        self._closed = False
+
+    def send_message(self, message):
+        """Send a message to the websocket"""
+        self._send_message(OPCODE_TEXT, message)
+
+    def send_binary(self, message):
+        """Send a binary message (bytes) to the websocket"""
+        self._send_message(OPCODE_BINARY, message)
+
+    def _send_message(self, opcode, message):
+        # Frames the message and sends or queues it (any thread)
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        if self._deflater is not None and opcode < OPCODE_CLOSE:
+            frame = (opcode, message) # Compressed by _flush(), in order
+        else:
+            frame = HTTPWebSocketsHandler._frame(opcode, message)
+        with self._lock:
+            if not self.ws_connected:
+                return
+            if len(self._out) >= self.server.send_queue_size:
+                self.send_drops += 1
+                if self.server.send_policy == DISCONNECT:
+                    self.ws_connected = False
+                    self._abort = True
+                    frame = None
+                elif self.server.send_policy == KEEP_LATEST:
+                    self.send_drops += len(self._out) - 1
+                    self._out.clear()
+                else:
+                    self._out.popleft()
+            if frame is not None:
+                self._out.append(frame)
+                if self._writing:
+                    return
+                self._flush()
+                if not self._out and self._partial is None:
+                    return
+            self._writing = True
+        self.server._schedule(self)
+
+    def _queue(self, data, close=False):
+        # Queues a response or control frame (server thread), and
+        # optionally closes the connection once it has been sent
+        with self._lock:
+            self._out.append(data)
+            self._closing = self._closing or close
+            if not self._writing:
+                self._writing = True
+                self.server._schedule(self)
+
+    def _flush(self):
+        # Sends as much as the socket will take, with self._lock held.
+        # Waiting frames are joined so that they go in one send()
+        try:
+            while self._partial is not None or self._out:
+                if self._partial is None:
+                    if self._deflater is not None:
+                        self._partial = b''.join([f if type(f) is bytes else self._deflater.frame(*f)
+                                                  for f in self._out])
+                    else:
+                        self._partial = b''.join(self._out)
+                    self._out.clear()
+                n = self.sock.send(self._partial)
+                self._partial = self._partial[n:] if n < len(self._partial) else None
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.ws_connected = False
+            self._abort = True
+
+    def _on_event(self, mask):
+        # Called by the server thread when the socket is ready
+        if mask & selectors.EVENT_READ:
+            self._read()
+        if mask & selectors.EVENT_WRITE and not self._closed:
+            self._write()
+
+    def _write(self):
+        # Socket is writable (server thread)
+        with self._lock:
+            if not self._abort:
+                self._flush()
+            done = self._partial is None and not self._out
+            if done:
+                self._writing = False
+            abort = self._abort or (done and self._closing)
+        if abort:
+            self._close()
+        elif done:
+            self.server.selector.modify(self.sock, selectors.EVENT_READ, self._on_event)
+
+    def _read(self):
+        # Socket is readable (server thread)
+        try:
+            data = self.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        self.lastActive = time.monotonic()
+        if not data:
+            self._close()
+        elif self.ws_connected:
+            self._on_ws_data(data)
+        elif self._parser is None and not self._closing:
+            self._request += data
+            # There may be several (pipelined) requests
+            while self._parser is None and not self._closing:
+                end = self._request.find(b'\r\n\r\n')
+                if end < 0:
+                    if len(self._request) > MAX_REQUEST:
+                        self._send_error(431, 'Request header fields too large')
+                    break
+                head = bytes(self._request[:end])
+                del self._request[:end+4]
+                self._on_request(head)
+
+    def _on_request(self, head):
+        # A complete HTTP request (no body) has arrived
+        request = parse_request(head)
+        if request is None:
+            self._keepAlive = False
+            self._send_error(400, 'Bad request')
+            return
+        method, path, headers, self._keepAlive = request
+        if headers.get('upgrade', '').lower() == 'websocket':
+            self._websocket(path, headers, bytes(self._request))
+        elif method in ('GET', 'HEAD'):
+            self._send_file(path, method == 'HEAD', headers)
+        else:
+            self._send_error(501, 'Unsupported method')
+
+    def _websocket(self, path, headers, rest):
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            self._send_error(400, 'Bad websocket request')
+            return
+        digest = b64encode(sha1((key + WS_GUID).encode()).digest()).decode()
+        response, self._deflater = negotiate_deflate(
+            headers.get('sec-websocket-extensions'), self.server.ws_deflate)
+        extensions = 'Sec-WebSocket-Extensions: %s\r\n' % response if response else ''
+        self.ws_protocol = negotiate_protocol(headers.get('sec-websocket-protocol'),
+                                              self.server.ws_protocols)
+        if self.ws_protocol:
+            extensions += 'Sec-WebSocket-Protocol: %s\r\n' % self.ws_protocol
+        self._queue(('HTTP/1.1 101 Switching Protocols\r\n'
+                     'Upgrade: websocket\r\n'
+                     'Connection: Upgrade\r\n'
+                     '%s'
+                     'Sec-WebSocket-Accept: %s\r\n\r\n' % (extensions, digest)).encode('latin-1'))
+        self.path = path
+        self._parser = FrameParser(self.server.max_message_size, inflate=self._deflater is not None)
+        self._request = None
+        with self._lock:
+            self.ws_connected = True
+        self.server.websockets.add(self)
+        if rest:
+            self._on_ws_data(rest)
+
+    def _on_ws_data(self, data):
+        # Bytes received on the websocket
+        try:
+            messages = self._parser.feed(data)
+        except WebSocketError:
+            self._ws_close()
+            return
+        for opcode, payload in messages:
+            if not self.ws_connected:
+                break
+            if opcode == OPCODE_CLOSE:
+                self._ws_close()
+            elif opcode == OPCODE_PING:
+                self._send_message(OPCODE_PONG, payload)
+            elif opcode == OPCODE_TEXT:
+                try:
+                    message = payload.decode('utf-8')
+                except UnicodeDecodeError:
+                    self._ws_close()
+                    break
+                self.server._on_ws_message(message, self.path)
+            elif opcode == OPCODE_BINARY:
+                self.server._on_ws_message(payload, self.path)
+
+    def _ws_close(self):
+        # Sends a close frame and closes once it has gone (server thread)
+        with self._lock:
+            connected = self.ws_connected
+            self.ws_connected = False
+        if connected:
+            self.server.websockets.remove(self)
+            self._queue(HTTPWebSocketsHandler._frame(OPCODE_CLOSE, b''), close=True)
+
+    def _close(self):
+        # Closes the connection now (server thread)
+        if self._closed:
+            return
+        self._closed = True
+        self.server.connections.discard(self)
+        with self._lock:
+            self.ws_connected = False
+            self._out.clear()
+            self._partial = None
+        if self._parser is not None:
+            self.server.websockets.remove(self)
+        try:
+            self.server.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
+
+    def _send_file(self, path, headOnly, headers):
+        if self.server.static is not None:
+            # From memory, see staticCache
+            response = self.server.static.respond(path,
+                headers.get('accept-encoding'), headers.get('if-none-match'))
+            if response is not None:
+                code, fields, body = response
+                self._respond(code, 'OK' if code == 200 else 'Not Modified',
+                              fields, b'' if headOnly else body)
+                return
+        filename = self.server._translate_path(path)
+        try:
+            with open(filename, 'rb') as f:
+                body = f.read()
+        except OSError:
+            self._send_error(404, 'File not found')
+            return
+        ctype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self._respond(200, 'OK', [('Content-Type', ctype), ('Content-Length', str(len(body)))],
+                      b'' if headOnly else body)
+
+    def _send_error(self, code, message):
+        if code != 404:
+            self._keepAlive = False
+        fields, body = error_page(code, message)
+        self._respond(code, message, fields, body)
+
+    def _respond(self, code, reason, fields, body):
+        # Queues the response, see response_head()
+        self._queue(response_head(code, reason, fields, self._keepAlive) + body,
+                    close=not self._keepAlive)
+
+
+class SelectorHTTPServer(object):
+    """
+    Serves files from directory and websockets on one thread. Used by
+    BgWebServer(selectors=True), which sets websockets (a Registry),
+    websocketmessages (a queue) and static (a StaticCache) before
+    calling serve_forever()
+    """
+    def __init__(self, server_address, directory="static",
+                 send_queue_size=100, send_policy=DROP_OLDEST, max_message_size=1 << 20,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT, ws_deflate=None, ws_protocols=()):
+        self.directory = os.path.abspath(directory)
+        self.ws_deflate = ws_deflate
+        self.ws_protocols = ws_protocols
+        self.keep_alive_timeout = keep_alive_timeout
+        self.connections = set()
+        self.send_queue_size = send_queue_size
+        self.send_policy = send_policy
+        self.max_message_size = max_message_size
+        self.websockets = None
+        self.websocketmessages = None
+        self.static = None          # staticCache.StaticCache, or None
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(server_address)
+        self.socket.listen(128)
+        self.socket.setblocking(False)
+
+        # The wake socket pair lets other threads interrupt select()
+        self._wakeRx, self._wakeTx = socket.socketpair()
+        self._wakeRx.setblocking(False)
+        self._wakeTx.setblocking(False)
+        self._pending = set()       # Connections that have data to send
+        self._pendingLock = threading.Lock()
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ, self._accept)
+        self.selector.register(self._wakeRx, selectors.EVENT_READ, self._wake)
+        self._keepGoing = True
+        self._stopped = threading.Event()
+
+    def serve_forever(self):
+        nextCheck = time.monotonic() + 1.0
+        try:
+            while self._keepGoing:
+                for key, mask in self.selector.select(1.0):
+                    key.data(mask)
+                now = time.monotonic()
+                if now >= nextCheck:
+                    nextCheck = now + 1.0
+                    self._close_idle(now)
+        finally:
+            for connection in list(self.connections):
+                connection._close()
+            self._stopped.set()
+
+    def _close_idle(self, now):
+        # Closes HTTP connections that have been idle for too long
+        for connection in list(self.connections):
+            if (connection._parser is None and not connection._writing
+                    and now - connection.lastActive > self.keep_alive_timeout):
+                connection._close()
+
+    def shutdown(self):
+        """Stops serve_forever() and waits for it to finish"""
+        self._keepGoing = False
+        self._wakeTx.send(b'\0')
+        self._stopped.wait()
+
+    def _accept(self, mask):
+        try:
+            sock, address = self.socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = SelectorConnection(self, sock, address)
+        self.connections.add(connection)
+        self.selector.register(sock, selectors.EVENT_READ, connection._on_event)
+
+    def _schedule(self, connection):
+        # Asks the server thread to write (or close) connection
+        with self._pendingLock:
+            wake = not self._pending
+            self._pending.add(connection)
+        if wake:
+            try:
+                self._wakeTx.send(b'\0')
+            except (BlockingIOError, InterruptedError):
+                pass # Already plenty of wake ups waiting
+
+    def _wake(self, mask):
+        # Another thread has data to send
+        try:
+            while self._wakeRx.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        with self._pendingLock:
+            pending = self._pending
+            self._pending = set()
+        for connection in pending:
+            if connection._closed:
+                continue
+            if connection._abort:
+                connection._close()
+            else:
+                self.selector.modify(connection.sock,
+                    selectors.EVENT_READ | selectors.EVENT_WRITE, connection._on_event)
+
+    def _on_ws_message(self, message, path):
+        try:
+            # Put both the message and the path so we know where it came from
+            self.websocketmessages.put((message, path), block=False)
+        except Exception:
+            pass # queue full then throw it away
+
+    def _translate_path(self, path):
+        # Translates a URL path to a file in directory (as asyncWebServer)
+        path = urllib.parse.unquote(path.split('?', 1)[0].split('#', 1)[0])
+        path = posixpath.normpath(path)
+        parts = [p for p in path.split('/') if p and p not in (os.curdir, os.pardir)]
+        filename = os.path.join(self.directory, *parts)
+        if os.path.isdir(filename):
+            filename = os.path.join(filename, 'index.html')
+        return filename
@@ -18,6 +18,18 @@
 // To display the same measurement twice on one web page
 // perform a calculation to duplicate that measurement first.
 //
+// Binary nav
+//
+// With &binary=1 in the page address (e.g.
+// nav.html?ip=192.168.2.62&rate=25&binary=1) the websocket asks for
+// the "ncom-nav-binary" sub-protocol. nav then arrives as binary
+// messages, each with all the samples since the last one (see
+// publisher.py), which are much quicker to decode than JSON. The
+// latest sample goes to onMessage_nav as usual. To use all of them
+// (e.g. for a chart) define onMessage_navBatch(batch), where batch
+// has count, TimeUtcOffset and a typed array for each measurement,
+// e.g. batch.Ax[0] ... batch.Ax[batch.count-1]
+//
 // !!! Because this script adds global functions, watch out for any
 // unintended clashes with scripts that you write !!!
 
@@ -27,6 +39,15 @@
 // you can read
 AmIdFilter = -1 // Negative for no filter
 
+// Layout of the binary nav records (see publisher.py)
+const NAV_INTS = ["NavStatus", "GpsMinutes"];
+const NAV_FLOATS = ["GpsSeconds", "Ax", "Ay", "Az", "Wx", "Wy", "Wz",
+  "Lat", "Lon", "Alt", "Vn", "Ve", "Vd", "Heading", "Pitch", "Roll"];
+const NAV_TAG = 0x4e415631; // "NAV1"
+const NAV_HEADER_SIZE = 12;
+const INT_NONE = -2147483648; // Integer that is not known
+const GPS_EPOCH = Date.UTC(1980, 0, 6); // ms
+
 // updateId is a useful function to update the innerHTML from
 // the measurements from the websockets
 // The element's id should be in the form mi_NcomName
@@ -64,17 +85,29 @@ function doConnect()
   // Hopefully the query has been set correctly by page index.html
   const urlParams = new URLSearchParams(window.location.search);
   const ip = urlParams.get('ip');
+  // Optional update rate (Hz), e.g. nav.html?ip=192.168.2.62&rate=10
+  const rate = urlParams.get('rate');
+  // Optional messages to receive, e.g. &kinds=nav,status
+  const kinds = urlParams.get('kinds');
+  // Optional binary nav, &binary=1 (see above)
+  const binary = urlParams.get('binary');
 
-  // Open the websocket
-  websocket = new WebSocket(
-    // Build the web socket address
-    // Like ws://192.168.2.10:8000/nav,json?ip=192.168.2.62
-    "ws://"
+  // Build the web socket address
+  // Like ws://192.168.2.10:8000/nav,json?ip=192.168.2.62
+  const address = "ws://"
     + window.location.hostname
     + ":" + window.location.port
     + "/message.json?ip="
     + ip
-  );
+    + (rate ? "&rate=" + rate : "")
+    + (kinds ? "&kinds=" + kinds : "");
+
+  // Open the websocket
+  if( binary && binary != "0" )
+    websocket = new WebSocket(address, "ncom-nav-binary");
+  else
+    websocket = new WebSocket(address);
+  websocket.binaryType = "arraybuffer";
   // Set the callback functions for the websocket
   websocket.onopen = onOpen;
   websocket.onclose = onClose;
@@ -109,11 +142,69 @@ function onError(evt)
   disconnected = true;
 }
 
+// decodeNav() decodes a binary nav message (an ArrayBuffer) into a
+// batch: count, TimeUtcOffset and a typed array for each measurement
+// (Int32Array for NAV_INTS, Float64Array for NAV_FLOATS, NaN when not
+// valid). Returns null if the message is not binary nav
+function decodeNav(buffer)
+{
+  const view = new DataView(buffer);
+  if( view.byteLength < NAV_HEADER_SIZE || view.getUint32(0) != NAV_TAG )
+    return null;
+  const count = view.getUint16(4, true);
+  const size = view.getUint16(6, true);
+  if( size < 4*NAV_INTS.length + 8*NAV_FLOATS.length
+      || view.byteLength < NAV_HEADER_SIZE + count*size )
+    return null;
+  let batch = { count: count, TimeUtcOffset: view.getInt32(8, true) };
+  for( const name of NAV_INTS )   batch[name] = new Int32Array(count);
+  for( const name of NAV_FLOATS ) batch[name] = new Float64Array(count);
+  const floats = 4*NAV_INTS.length; // Offset of the floats in a record
+  for( let i = 0, pos = NAV_HEADER_SIZE; i < count; i++, pos += size )
+  {
+    for( let j = 0; j < NAV_INTS.length; j++ )
+      batch[NAV_INTS[j]][i] = view.getInt32(pos + 4*j, true);
+    for( let j = 0; j < NAV_FLOATS.length; j++ )
+      batch[NAV_FLOATS[j]][i] = view.getFloat64(pos + floats + 8*j, true);
+  }
+  return batch;
+}
+
+// navSample() returns sample i of a batch as a nav object, like the
+// JSON nav: only valid measurements, with GpsTime and UtcTime
+function navSample(batch, i)
+{
+  let nav = { NavStatus: batch.NavStatus[i] };
+  for( const name of NAV_FLOATS )
+    if( !isNaN(batch[name][i]) )
+      nav[name] = batch[name][i];
+  const minutes = batch.GpsMinutes[i];
+  if( minutes != INT_NONE && 'GpsSeconds' in nav )
+  {
+    const t = GPS_EPOCH + (minutes*60 + nav.GpsSeconds)*1000;
+    nav.GpsTime = new Date(t).toISOString();
+    if( batch.TimeUtcOffset != INT_NONE )
+      nav.UtcTime = new Date(t + batch.TimeUtcOffset*1000).toISOString();
+  }
+  return nav;
+}
+
 // onMessage() is a callback when the websocket received a new message
 // Process the message her
 function onMessage(evt)
 {
-  message = JSON.parse(evt.data);
+  if( evt.data instanceof ArrayBuffer )
+  {
+    // Binary nav, see above
+    const batch = decodeNav(evt.data);
+    if( batch == null || batch.count == 0 )
+      return;
+    if( typeof onMessage_navBatch === 'function' )
+      onMessage_navBatch(batch);
+    message = { nav: navSample(batch, batch.count - 1) };
+  }
+  else
+    message = JSON.parse(evt.data);
 
   // If onCalculations is defined then call it so that additional
   // measurements can be calculated. Useful for changing units,
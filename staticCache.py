@@ -0,0 +1,221 @@
+# The MIT License (MIT)
+
+# Copyright (C) 2021 s7711
+# 39369253+s7711@users.noreply.github.com
+
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+staticCache keeps the web pages (subfolder "static") in memory, ready
+compressed, for bgWebServer.
+
+Usage:
+  cache = staticCache.StaticCache("static")
+  response = cache.respond(path, acceptEncoding, ifNoneMatch)
+
+respond() returns (code, headers, body) for a GET, or None if the path
+is not a file in the folder (for example a directory without a
+trailing "/"), which is left to SimpleHTTPRequestHandler.
+
+All the files are loaded when the cache is made. Text files (html,
+javascript, css, ...) are also stored gzip compressed and, if the
+brotli module is installed, brotli compressed. chart.js is about a
+quarter of its size with gzip, which makes a big difference on a
+phone with poor Wi-Fi.
+
+Each response has a strong ETag (different for each encoding) so the
+browser can ask "If-None-Match" and get "304 Not Modified" without
+the file. Web pages (html) are "no-cache", so the browser always
+checks that it has the latest page; everything else may be used for
+MAX_AGE seconds without checking.
+
+Each request checks the size and modification time of the file, so
+a file that is changed on disk is reloaded and new files are found.
+"""
+
+import os
+import stat
+import gzip
+import hashlib
+import mimetypes
+import posixpath
+import threading
+import urllib.parse
+import email.utils
+
+try:
+    import brotli # Optional
+except ImportError:
+    brotli = None
+
+MAX_AGE = 86400         # Seconds that browsers may keep files other than html
+COMPRESS_MIN = 256      # Files smaller than this are not compressed
+COMPRESS_TYPES = ('text/', 'application/javascript', 'application/json',
+                  'application/xml', 'image/svg+xml')
+
+
+class StaticFile(object):
+    # One file, with its encodings: {None: body, 'gzip': ..., 'br': ...}
+    __slots__ = ('filename', 'stat', 'ctype', 'etag', 'bodies', 'headers')
+
+    def __init__(self, filename, stat, body):
+        self.filename = filename
+        self.stat = stat
+        self.ctype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.bodies = {None: body}
+        if len(body) >= COMPRESS_MIN and self.ctype.startswith(COMPRESS_TYPES):
+            z = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(z) < len(body):
+                self.bodies['gzip'] = z
+            if brotli is not None:
+                z = brotli.compress(body)
+                if len(z) < len(body):
+                    self.bodies['br'] = z
+        if self.ctype == 'text/html':
+            cacheControl = 'no-cache'
+        else:
+            cacheControl = 'max-age=%d' % MAX_AGE
+        # Headers that are the same for every response
+        self.headers = [
+            ('Content-Type', self.ctype),
+            ('Last-Modified', email.utils.formatdate(stat[1] / 1e9, usegmt=True)),
+            ('Cache-Control', cacheControl),
+            ]
+        if len(self.bodies) > 1:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+
+
+class StaticCache(object):
+    """
+    Files in directory, in memory. See the module documentation
+    """
+    def __init__(self, directory="static"):
+        self.directory = os.path.abspath(directory)
+        self.files = {}         # filename -> StaticFile
+        self._lock = threading.Lock()
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                self._load(os.path.join(root, name))
+
+    def _load(self, filename):
+        # Loads (or reloads) filename, returns the StaticFile or None if
+        # it is not a file
+        try:
+            with open(filename, 'rb') as f:
+                st = os.fstat(f.fileno())
+                body = f.read()
+        except OSError:
+            with self._lock:
+                self.files.pop(filename, None)
+            return None
+        entry = StaticFile(filename, (st.st_size, st.st_mtime_ns), body)
+        with self._lock:
+            self.files[filename] = entry
+        return entry
+
+    def translate_path(self, path):
+        """
+        Translates a URL path to a file in directory, in the same way as
+        SimpleHTTPRequestHandler ("/" is index.html)
+        """
+        path = urllib.parse.unquote(path.split('?', 1)[0].split('#', 1)[0])
+        trailing = path.endswith('/')
+        path = posixpath.normpath(path)
+        parts = [p for p in path.split('/') if p and p not in (os.curdir, os.pardir)]
+        filename = os.path.join(self.directory, *parts)
+        if trailing or not parts:
+            filename = os.path.join(filename, 'index.html')
+        return filename
+
+    def lookup(self, path):
+        """
+        Returns the StaticFile for a URL path, reloading it if it has
+        changed on disk, or None if there is no such file
+        """
+        filename = self.translate_path(path)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            st = None
+        entry = self.files.get(filename)
+        if st is None or not stat.S_ISREG(st.st_mode):
+            if entry is not None:
+                with self._lock:
+                    self.files.pop(filename, None)
+            return None
+        if entry is None or entry.stat != (st.st_size, st.st_mtime_ns):
+            entry = self._load(filename)
+        return entry
+
+    def respond(self, path, acceptEncoding=None, ifNoneMatch=None):
+        """
+        Returns (code, headers, body) for a GET of path, where headers
+        is a list of (name, value), or None if path is not a file.
+        acceptEncoding and ifNoneMatch are the request headers (or None)
+        """
+        entry = self.lookup(path)
+        if entry is None:
+            return None
+        encoding = choose_encoding(entry.bodies, acceptEncoding)
+        etag = '"%s%s"' % (entry.etag, '-' + encoding if encoding else '')
+        headers = entry.headers + [('ETag', etag)]
+        if ifNoneMatch is not None and etag_matches(etag, ifNoneMatch):
+            return 304, headers, b''
+        body = entry.bodies[encoding]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(len(body))))
+        return 200, headers, body
+
+
+def choose_encoding(bodies, acceptEncoding):
+    """
+    Returns the encoding in bodies (a key) that the client accepts and
+    is smallest, or None for no encoding
+    """
+    if not acceptEncoding or len(bodies) == 1:
+        return None
+    accepted = {}
+    for item in acceptEncoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    best = None
+    for encoding in bodies:
+        if encoding and accepted.get(encoding, accepted.get('*', 0.0)) > 0.0:
+            if best is None or len(bodies[encoding]) < len(bodies[best]):
+                best = encoding
+    return best
+
+
+def etag_matches(etag, ifNoneMatch):
+    """True if the If-None-Match header includes etag (or is *)"""
+    for tag in ifNoneMatch.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag == etag or tag == 'W/' + etag:
+            return True
+    return False